@@ -0,0 +1,961 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A local stand-in for an HMC, for end-to-end load tests of the forwarder
+without an HMC.
+
+The stand-in simulates the HMC REST operations used by the forwarder on the
+HMC REST port, and the HMC STOMP notification service on the HMC STOMP port,
+both with TLS and a self-signed certificate. It publishes synthetic OS
+messages for the LPARs whose OS message channel has been opened, at a
+configurable rate.
+
+Since the forwarder uses the standard HMC ports, only one stand-in can run
+on a host address at a time. Other loopback addresses such as 127.0.0.2 can
+be used to run multiple stand-ins on Linux.
+
+The stand-in can also be run as a script, for manual load tests:
+
+    python -m tests.end2end.hmc_standin --lpars 100 --rate 10
+"""
+
+import os
+import re
+import ssl
+import sys
+import socket
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import socketserver
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Ports of the HMC REST API and of the HMC STOMP notification service, as
+# used by the zhmcclient library
+REST_PORT = 6794
+STOMP_PORT = 61612
+
+# Number of OS messages kept per LPAR for the 'List OS Messages' operation
+HISTORY_SIZE = 10000
+
+# Interval in seconds at which the publisher thread publishes OS messages
+PUBLISH_INTERVAL = 0.01
+
+# Churn actions performed in turn by the churn thread:
+# - replace: Remove an LPAR and add a new LPAR to its CPC, with
+#   inventory change notifications.
+# - deactivate: Deactivate an LPAR, with a status change notification. This
+#   closes its OS message channels.
+# - activate: Activate the deactivated LPAR again, with a status change
+#   notification. Its sequence numbers start again at 1.
+# - reconnect: Close all STOMP connections, so that the clients reconnect.
+#   The next churn action is performed only after a client has subscribed
+#   again, because notifications published in the meantime are lost.
+CHURN_ACTIONS = ('replace', 'deactivate', 'activate', 'reconnect')
+
+
+def create_certificate(directory):
+    """
+    Create a self-signed certificate and its key in a directory, using the
+    openssl command, and return the path name of the combined PEM file.
+    """
+    pem_file = os.path.join(directory, 'standin.pem')
+    key_file = os.path.join(directory, 'standin.key')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+         '-subj', '/CN=localhost', '-days', '1',
+         '-keyout', key_file, '-out', pem_file],
+        check=True, capture_output=True)
+    with open(key_file, encoding='ascii') as fp:
+        key = fp.read()
+    with open(pem_file, 'a', encoding='ascii') as fp:
+        fp.write(key)
+    return pem_file
+
+
+class HTTPError(Exception):
+    """
+    An error returned by a simulated HMC REST operation.
+    """
+
+    def __init__(self, http_status, reason, message):
+        super().__init__(message)
+        self.http_status = http_status
+        self.reason = reason
+
+
+# pylint: disable=too-few-public-methods
+class _StandinLpar:
+    """
+    State of a simulated LPAR
+    """
+
+    def __init__(self, uri, name, cpc_uri):
+        self.uri = uri  # string: URI of the LPAR
+        self.name = name  # string: Name of the LPAR
+        self.cpc_uri = cpc_uri  # string: URI of the CPC of the LPAR
+        self.active = True  # bool: Indicates whether the LPAR is active
+        self.seq_no = 0  # int: Sequence number of the last OS message
+        # deque of dict: Last OS messages, for 'List OS Messages'
+        self.history = deque(maxlen=HISTORY_SIZE)
+
+
+class HmcStandin:
+    # pylint: disable=too-many-instance-attributes
+    """
+    A local stand-in for an HMC, with REST operations and STOMP notifications.
+
+    Usage::
+
+        standin = HmcStandin(num_lpars=100, rate=10)
+        standin.start()
+        ...  # Run the forwarder against standin.host
+        standin.stop()
+    """
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, host='127.0.0.1', num_cpcs=1, num_lpars=10, rate=10.0,
+                 batch_size=1, open_channels=False, churn_interval=0):
+        """
+        Parameters:
+          host (string): IP address the stand-in listens on.
+          num_cpcs (int): Number of CPCs.
+          num_lpars (int): Number of LPARs per CPC.
+          rate (float): Number of OS messages per second per LPAR whose OS
+            message channel is open.
+          batch_size (int): Maximum number of OS messages per notification.
+          open_channels (bool): Simulate that the OS message channels of
+            all LPARs are already open in every session, so that opening them
+            fails with HTTP status 409, reason 331 and the forwarder needs
+            to look up their topics.
+          churn_interval (float): Time in seconds between two churn actions
+            (see CHURN_ACTIONS), or 0 for no churn.
+        """
+        self.host = host
+        self.rate = rate
+        self.batch_size = batch_size
+        self.open_channels = open_channels
+        self.churn_interval = churn_interval
+        self.cpcs = []  # dicts with the properties of the CPCs
+        self.lpars = {}  # _StandinLpar objects, by URI
+        self._lock = threading.RLock()
+        self._next_lpar_index = 0
+        for cpc_index in range(num_cpcs):
+            cpc_uri = f'/api/cpcs/cpc{cpc_index}'
+            self.cpcs.append({
+                'object-uri': cpc_uri,
+                'object-id': f'cpc{cpc_index}',
+                'name': f'CPC{cpc_index}',
+                'status': 'operating',
+                'dpm-enabled': False,
+            })
+            for _ in range(num_lpars):
+                self._new_lpar(cpc_uri)
+
+        self.num_published = 0  # Number of published OS messages
+        self.num_delivered = 0  # Number of OS messages sent to subscribers
+        self.num_churn_actions = 0  # Number of performed churn actions
+        self._sessions = {}  # Open topics by LPAR URI, by session ID
+        self._next_session = 0
+        self._topic_lpars = {}  # LPAR URIs by OS message topic
+        self._stomp_subscriptions = {}  # list of (handler, id), by topic
+        self._global_seq_no = 0
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._tmpdir = None
+        self._rest_server = None
+        self._stomp_server = None
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "host={s.host!r}, "
+                "lpars={n}, "
+                "rate={s.rate!r}"
+                ")".format(s=self, n=len(self.lpars)))
+
+    def start(self):
+        """
+        Start the REST server, the STOMP server and the publisher.
+
+        Raises:
+          OSError: A port is in use, or the openssl command failed.
+          subprocess.CalledProcessError: The openssl command failed.
+        """
+        # pylint: disable=consider-using-with
+        self._tmpdir = tempfile.TemporaryDirectory()
+        pem_file = create_certificate(self._tmpdir.name)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(pem_file)
+
+        self._rest_server = _RestServer((self.host, REST_PORT), self)
+        self._rest_server.socket = context.wrap_socket(
+            self._rest_server.socket, server_side=True,
+            do_handshake_on_connect=False)
+        self._stomp_server = _StompServer((self.host, STOMP_PORT), self)
+        self._stomp_server.socket = context.wrap_socket(
+            self._stomp_server.socket, server_side=True,
+            do_handshake_on_connect=False)
+
+        self._stop_event.clear()
+        self._threads = [
+            threading.Thread(target=self._rest_server.serve_forever,
+                             name='standin-rest', daemon=True),
+            threading.Thread(target=self._stomp_server.serve_forever,
+                             name='standin-stomp', daemon=True),
+            threading.Thread(target=self._run_publisher,
+                             name='standin-publisher', daemon=True),
+        ]
+        if self.churn_interval:
+            self._threads.append(
+                threading.Thread(target=self._run_churn,
+                                 name='standin-churn', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Stop the stand-in and close its connections.
+        """
+        self._stop_event.set()
+        for server in (self._rest_server, self._stomp_server):
+            if server:
+                server.shutdown()
+                server.server_close()
+        if self._stomp_server:
+            self._stomp_server.close_connections()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self._tmpdir:
+            self._tmpdir.cleanup()
+            self._tmpdir = None
+
+    def add_lpar(self, cpc_uri):
+        """
+        Add a new LPAR to a CPC and publish an inventory change notification.
+
+        Returns:
+          string: URI of the new LPAR.
+        """
+        with self._lock:
+            lpar = self._new_lpar(cpc_uri)
+        self._publish_object_notification(lpar, {
+            'notification-type': 'inventory-change',
+            'action': 'add',
+        })
+        return lpar.uri
+
+    def remove_lpar(self, lpar_uri):
+        """
+        Remove an LPAR and publish an inventory change notification.
+        """
+        with self._lock:
+            lpar = self.lpars.pop(lpar_uri)
+            self._close_channels(lpar_uri)
+        self._publish_object_notification(lpar, {
+            'notification-type': 'inventory-change',
+            'action': 'remove',
+        })
+
+    def set_lpar_status(self, lpar_uri, active):
+        """
+        Activate or deactivate an LPAR and publish a status change
+        notification. Deactivating an LPAR closes its OS message channels,
+        and activating it restarts its sequence numbers.
+        """
+        with self._lock:
+            lpar = self.lpars[lpar_uri]
+            lpar.active = active
+            if active:
+                lpar.seq_no = 0
+                lpar.history.clear()
+            else:
+                self._close_channels(lpar_uri)
+        old_status, new_status = ('not-activated', 'operating') if active \
+            else ('operating', 'not-activated')
+        self._publish_object_notification(lpar, {
+            'notification-type': 'status-change',
+        }, {'change-reports': [{'old-status': old_status,
+                                'new-status': new_status}]})
+
+    def drop_connections(self):
+        """
+        Close all STOMP connections, so that the clients need to reconnect.
+        """
+        self._stomp_server.close_connections()
+
+    def published_seq_nos(self):
+        """
+        Return the sequence numbers of the last published OS messages, by
+        LPAR URI, for the LPARs that have published OS messages.
+        """
+        with self._lock:
+            return {lpar.uri: lpar.seq_no for lpar in self.lpars.values()
+                    if lpar.seq_no}
+
+    #
+    # REST operations
+    #
+
+    def logon(self):
+        """
+        Create a session and return the result of the 'Logon' operation.
+        """
+        with self._lock:
+            self._next_session += 1
+            session_id = f'session{self._next_session}'
+            topics = {}
+            if self.open_channels:
+                for lpar in self.lpars.values():
+                    topics[lpar.uri] = self._new_topic(lpar, session_id)
+            self._sessions[session_id] = topics
+        return {
+            'api-session': session_id,
+            'session-credential': 'credential',
+            'notification-topic': f'object-{session_id}',
+            'job-notification-topic': f'job-{session_id}',
+            'api-major-version': 4,
+            'api-minor-version': 10,
+        }
+
+    def list_lpars(self, cpc_uri):
+        """
+        Return the LPARs of a CPC.
+        """
+        with self._lock:
+            return [lpar for lpar in self.lpars.values()
+                    if lpar.cpc_uri == cpc_uri]
+
+    def logoff(self, session_id):
+        """
+        Delete a session, which closes its OS message channels.
+        """
+        with self._lock:
+            for topic in self._sessions.pop(session_id).values():
+                del self._topic_lpars[topic]
+
+    def open_os_message_channel(self, session_id, lpar):
+        """
+        Open the OS message channel of an LPAR in a session and return the
+        result of the 'Open OS Message Channel' operation.
+        """
+        with self._lock:
+            if not lpar.active:
+                raise HTTPError(
+                    409, 332, "The OS does not support OS messages")
+            topics = self._sessions[session_id]
+            if lpar.uri in topics:
+                raise HTTPError(
+                    409, 331, "The OS message channel is already open")
+            topics[lpar.uri] = self._new_topic(lpar, session_id)
+            return {'topic-name': topics[lpar.uri]}
+
+    def get_notification_topics(self, session_id):
+        """
+        Return the result of the 'Get Notification Topics' operation for a
+        session.
+        """
+        with self._lock:
+            topics = [{'topic-type': 'object-notification',
+                       'topic-name': f'object-{session_id}'}]
+            for lpar_uri, topic in self._sessions[session_id].items():
+                topics.append({'topic-type': 'os-message-notification',
+                               'topic-name': topic,
+                               'object-uri': lpar_uri,
+                               'include-refresh-messages': False})
+            return {'topics': topics}
+
+    def list_os_messages(self, lpar, begin, end):
+        """
+        Return the result of the 'List OS Messages' operation for an LPAR.
+        """
+        begin = 0 if begin is None else begin
+        end = lpar.seq_no if end is None else end
+        with self._lock:
+            msg_infos = [
+                msg_info for msg_info in lpar.history
+                if begin <= msg_info['sequence-number'] <= end]
+        return {'os-messages': msg_infos}
+
+    def _new_lpar(self, cpc_uri):
+        """
+        Create a new LPAR in a CPC and return it.
+        """
+        index = self._next_lpar_index
+        self._next_lpar_index += 1
+        uri = '/api/logical-partitions/{c}-lpar{i}'.format(
+            c=cpc_uri.split('/')[-1], i=index)
+        lpar = _StandinLpar(uri, f'LPAR{index}', cpc_uri)
+        self.lpars[uri] = lpar
+        return lpar
+
+    def _close_channels(self, lpar_uri):
+        """
+        Close the OS message channels of an LPAR in all sessions.
+        """
+        for topics in self._sessions.values():
+            topic = topics.pop(lpar_uri, None)
+            if topic:
+                del self._topic_lpars[topic]
+
+    def _new_topic(self, lpar, session_id):
+        """
+        Return a new OS message topic for an LPAR in a session.
+        """
+        topic = f'os-{lpar.uri.split("/")[-1]}-{session_id}'
+        self._topic_lpars[topic] = lpar.uri
+        return topic
+
+    #
+    # STOMP subscriptions and publishing
+    #
+
+    def subscribe(self, handler, topic, sub_id):
+        """
+        Add a STOMP subscription of a connection for a topic.
+        """
+        with self._lock:
+            self._stomp_subscriptions.setdefault(topic, []).append(
+                (handler, sub_id))
+
+    def unsubscribe(self, handler, sub_id=None):
+        """
+        Remove a STOMP subscription of a connection, or all its
+        subscriptions if no subscription ID is specified.
+        """
+        with self._lock:
+            for topic, subs in list(self._stomp_subscriptions.items()):
+                subs = [(h, i) for h, i in subs
+                        if h is not handler or sub_id not in (None, i)]
+                if subs:
+                    self._stomp_subscriptions[topic] = subs
+                else:
+                    del self._stomp_subscriptions[topic]
+
+    def _run_publisher(self):
+        """
+        The method running in the publisher thread.
+
+        Publishes OS messages for the LPARs with an open OS message channel,
+        at the configured rate per LPAR.
+        """
+        start_time = time.monotonic()
+        due = 0.0  # Number of OS messages per LPAR due since the start
+        published = 0  # Number of OS messages per LPAR published so far
+        while not self._stop_event.wait(PUBLISH_INTERVAL):
+            due = (time.monotonic() - start_time) * self.rate
+            count = int(due) - published
+            if count <= 0:
+                continue
+            published += count
+            with self._lock:
+                lpar_topics = {}
+                for topic, lpar_uri in self._topic_lpars.items():
+                    lpar_topics.setdefault(lpar_uri, []).append(topic)
+            for lpar_uri, topics in lpar_topics.items():
+                self._publish(lpar_uri, topics, count)
+
+    def _run_churn(self):
+        """
+        The method running in the churn thread.
+
+        Performs the churn actions in turn, at the churn interval.
+        """
+        deactivated_uri = None
+        index = 0
+        while not self._stop_event.wait(self.churn_interval):
+            action = CHURN_ACTIONS[index % len(CHURN_ACTIONS)]
+            index += 1
+            with self._lock:
+                lpar_uris = [uri for uri, lpar in self.lpars.items()
+                             if lpar.active]
+            if action == 'replace' and lpar_uris:
+                lpar = self.lpars[lpar_uris[0]]
+                self.remove_lpar(lpar.uri)
+                self.add_lpar(lpar.cpc_uri)
+            elif action == 'deactivate' and lpar_uris:
+                deactivated_uri = lpar_uris[len(lpar_uris) // 2]
+                self.set_lpar_status(deactivated_uri, False)
+            elif action == 'activate' and deactivated_uri:
+                self.set_lpar_status(deactivated_uri, True)
+                deactivated_uri = None
+            elif action == 'reconnect':
+                self.drop_connections()
+                while not self._stop_event.wait(PUBLISH_INTERVAL):
+                    with self._lock:
+                        if self._stomp_subscriptions:
+                            break
+            self.num_churn_actions += 1
+
+    def _publish_object_notification(self, lpar, headers, message=None):
+        """
+        Publish an object notification for an LPAR on the object topics of
+        all sessions.
+        """
+        with self._lock:
+            subs = [sub for session_id in self._sessions
+                    for sub in self._stomp_subscriptions.get(
+                        f'object-{session_id}', [])]
+        # The notifications of the HMC have a body also when they have no
+        # message, and the notification receiver parses it as JSON
+        body = json.dumps(message or {})
+        for handler, sub_id in subs:
+            with self._lock:
+                self._global_seq_no += 1
+                seq_no = self._global_seq_no
+            handler.send_frame('MESSAGE', dict(headers, **{
+                'subscription': sub_id,
+                'message-id': str(seq_no),
+                'object-uri': lpar.uri,
+                'class': 'logical-partition',
+                'name': lpar.name,
+                'session-sequence-nr': str(seq_no),
+                'global-sequence-nr': str(seq_no),
+            }), body)
+
+    def _publish(self, lpar_uri, topics, count):
+        """
+        Publish a number of new OS messages of an LPAR on its topics.
+        """
+        timestamp = int(time.time() * 1000)
+        with self._lock:
+            lpar = self.lpars.get(lpar_uri)
+            if lpar is None:
+                return  # Removed in the meantime
+            msg_infos = []
+            for _ in range(count):
+                lpar.seq_no += 1
+                msg_info = {
+                    'sequence-number': lpar.seq_no,
+                    'message-id': str(lpar.seq_no),
+                    'message-text':
+                        f'Stand-in OS message {lpar.seq_no} of {lpar.name}',
+                    'timestamp': timestamp,
+                    'is-priority': False,
+                    'is-held': False,
+                    'prompt-text': '',
+                }
+                lpar.history.append(msg_info)
+                msg_infos.append(msg_info)
+            self.num_published += count
+            subs = [(topic, sub) for topic in topics
+                    for sub in self._stomp_subscriptions.get(topic, [])]
+        for index in range(0, len(msg_infos), self.batch_size):
+            body = json.dumps(
+                {'os-messages': msg_infos[index:index + self.batch_size]})
+            for topic, (handler, sub_id) in subs:
+                with self._lock:
+                    self._global_seq_no += 1
+                    seq_no = self._global_seq_no
+                headers = {
+                    'destination': f'/topic/{topic}',
+                    'subscription': sub_id,
+                    'message-id': str(seq_no),
+                    'notification-type': 'os-message',
+                    'object-uri': lpar.uri,
+                    'object-id': lpar.uri.split('/')[-1],
+                    'class': 'logical-partition',
+                    'name': lpar.name,
+                    'session-sequence-nr': str(seq_no),
+                    'global-sequence-nr': str(seq_no),
+                    'content-type': 'application/json',
+                }
+                if handler.send_frame('MESSAGE', headers, body):
+                    with self._lock:
+                        self.num_delivered += len(
+                            msg_infos[index:index + self.batch_size])
+
+
+class _RestServer(ThreadingHTTPServer):
+    """
+    HTTP server for the REST operations of the stand-in.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, standin):
+        self.standin = standin
+        super().__init__(address, _RestHandler)
+
+
+class _RestHandler(BaseHTTPRequestHandler):
+    """
+    Handler for the REST operations of the stand-in.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    # Routes as tuple(method, URI pattern, handler method name)
+    ROUTES = (
+        ('GET', r'/api/version', '_get_version'),
+        ('POST', r'/api/sessions', '_logon'),
+        ('DELETE', r'/api/sessions/this-session', '_logoff'),
+        ('GET', r'/api/sessions/operations/get-notification-topics',
+         '_get_topics'),
+        ('GET', r'/api/cpcs', '_list_cpcs'),
+        ('GET', r'/api/cpcs/([^/]+)', '_get_cpc'),
+        ('GET', r'/api/cpcs/([^/]+)/logical-partitions', '_list_lpars'),
+        ('GET', r'/api/logical-partitions/([^/]+)', '_get_lpar'),
+        ('POST',
+         r'/api/logical-partitions/([^/]+)/operations/'
+         r'open-os-message-channel', '_open_channel'),
+        ('GET',
+         r'/api/logical-partitions/([^/]+)/operations/list-os-messages',
+         '_list_os_messages'),
+    )
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handle a GET request"""
+        self._handle('GET')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Handle a POST request"""
+        self._handle('POST')
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        """Handle a DELETE request"""
+        self._handle('DELETE')
+
+    def log_message(self, format, *args):
+        # pylint: disable=redefined-builtin
+        """Suppress the logging of requests"""
+
+    def _handle(self, method):
+        """
+        Route a request to its handler method and send the response.
+        """
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            for route_method, pattern, name in self.ROUTES:
+                match = re.fullmatch(pattern, url.path)
+                if route_method == method and match:
+                    if name not in ('_get_version', '_logon'):
+                        self._check_session()
+                    result = getattr(self, name)(
+                        *match.groups(), body=body, query=query)
+                    break
+            else:
+                raise HTTPError(404, 1, f"Unknown URI: {url.path}")
+        except HTTPError as exc:
+            self._send(exc.http_status, {
+                'http-status': exc.http_status,
+                'reason': exc.reason,
+                'message': str(exc),
+                'request-method': method,
+                'request-uri': self.path,
+            })
+            return
+        self._send(200 if result is not None else 204, result)
+
+    def _send(self, status, result):
+        """
+        Send a response with a JSON body, or without a body.
+        """
+        data = json.dumps(result).encode('utf-8') if result is not None \
+            else b''
+        self.send_response(status)
+        if data:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _check_session(self):
+        """
+        Raise HTTPError if the request does not have a valid session.
+        """
+        # pylint: disable=protected-access
+        session_id = self.headers.get('X-API-Session')
+        if session_id not in self.server.standin._sessions:
+            raise HTTPError(403, 5, "Invalid session ID")
+
+    def _lpar(self, lpar_id):
+        """
+        Return the LPAR with an object ID, or raise HTTPError.
+        """
+        try:
+            return self.server.standin.lpars[
+                f'/api/logical-partitions/{lpar_id}']
+        except KeyError:
+            raise HTTPError(404, 1, f"Unknown LPAR: {lpar_id}")
+
+    def _get_version(self, body, query):
+        # pylint: disable=unused-argument,no-self-use
+        return {'api-major-version': 4, 'api-minor-version': 10,
+                'hmc-version': '2.16.0', 'hmc-name': 'standin'}
+
+    def _logon(self, body, query):
+        # pylint: disable=unused-argument
+        return self.server.standin.logon()
+
+    def _logoff(self, body, query):
+        # pylint: disable=unused-argument
+        self.server.standin.logoff(self.headers.get('X-API-Session'))
+
+    def _get_topics(self, body, query):
+        # pylint: disable=unused-argument
+        return self.server.standin.get_notification_topics(
+            self.headers.get('X-API-Session'))
+
+    def _list_cpcs(self, body, query):
+        # pylint: disable=unused-argument
+        return {'cpcs': [
+            {k: cpc[k] for k in ('object-uri', 'name', 'status')}
+            for cpc in self.server.standin.cpcs]}
+
+    def _get_cpc(self, cpc_id, body, query):
+        # pylint: disable=unused-argument
+        for cpc in self.server.standin.cpcs:
+            if cpc['object-id'] == cpc_id:
+                return cpc
+        raise HTTPError(404, 1, f"Unknown CPC: {cpc_id}")
+
+    def _list_lpars(self, cpc_id, body, query):
+        # pylint: disable=unused-argument
+        return {'logical-partitions': [
+            {'object-uri': lpar.uri, 'name': lpar.name,
+             'status': _lpar_status(lpar)}
+            for lpar in self.server.standin.list_lpars(f'/api/cpcs/{cpc_id}')]}
+
+    def _get_lpar(self, lpar_id, body, query):
+        # pylint: disable=unused-argument
+        lpar = self._lpar(lpar_id)
+        return {'object-uri': lpar.uri, 'object-id': lpar_id,
+                'name': lpar.name, 'status': _lpar_status(lpar),
+                'parent': lpar.cpc_uri, 'class': 'logical-partition'}
+
+    def _open_channel(self, lpar_id, body, query):
+        # pylint: disable=unused-argument
+        return self.server.standin.open_os_message_channel(
+            self.headers.get('X-API-Session'), self._lpar(lpar_id))
+
+    def _list_os_messages(self, lpar_id, body, query):
+        # pylint: disable=unused-argument
+        begin = int(query['begin']) if 'begin' in query else None
+        end = int(query['end']) if 'end' in query else None
+        return self.server.standin.list_os_messages(
+            self._lpar(lpar_id), begin, end)
+
+
+class _StompServer(socketserver.ThreadingTCPServer):
+    """
+    TCP server for the STOMP connections of the stand-in.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, standin):
+        self.standin = standin
+        self.handlers = set()  # _StompHandler objects of open connections
+        super().__init__(address, _StompHandler)
+
+    def close_connections(self):
+        """
+        Close the open STOMP connections.
+        """
+        for handler in list(self.handlers):
+            handler.close()
+
+
+class _StompHandler(socketserver.BaseRequestHandler):
+    """
+    Handler for a STOMP connection of the stand-in.
+
+    Supports the subset of STOMP 1.2 used by the zhmcclient notification
+    receiver: CONNECT/STOMP, SUBSCRIBE, UNSUBSCRIBE and DISCONNECT from the
+    client, and CONNECTED, MESSAGE and RECEIPT to the client.
+    """
+
+    def setup(self):
+        self._send_lock = threading.Lock()
+        self._closed = False
+        self.server.handlers.add(self)
+
+    def finish(self):
+        self.server.standin.unsubscribe(self)
+        self.server.handlers.discard(self)
+
+    def close(self):
+        """
+        Close the connection.
+        """
+        self._closed = True
+        # Closing the socket alone does not end a recv() that is blocked in
+        # the handler thread, and does not close the TCP connection
+        try:
+            self.request.shutdown(socket.SHUT_RDWR)
+        except (OSError, ValueError):
+            pass
+        self.request.close()
+
+    def handle(self):
+        """
+        Receive and handle the frames from the client.
+        """
+        standin = self.server.standin
+        buffer = b''
+        while not self._closed:
+            try:
+                data = self.request.recv(65536)
+            except (OSError, ValueError):
+                return
+            if not data:
+                return
+            buffer += data
+            while b'\0' in buffer:
+                frame, buffer = buffer.split(b'\0', 1)
+                command, headers = _parse_frame(frame)
+                if command in ('CONNECT', 'STOMP'):
+                    self.send_frame('CONNECTED', {
+                        'version': '1.2', 'heart-beat': '0,0',
+                        'server': 'hmc-standin'})
+                elif command == 'SUBSCRIBE':
+                    topic = headers['destination'].split('/topic/', 1)[-1]
+                    standin.subscribe(self, topic, headers['id'])
+                elif command == 'UNSUBSCRIBE':
+                    standin.unsubscribe(self, headers['id'])
+                elif command == 'DISCONNECT':
+                    if 'receipt' in headers:
+                        self.send_frame(
+                            'RECEIPT', {'receipt-id': headers['receipt']})
+                    return
+                if 'receipt' in headers and command != 'DISCONNECT':
+                    self.send_frame(
+                        'RECEIPT', {'receipt-id': headers['receipt']})
+
+    def send_frame(self, command, headers, body=''):
+        """
+        Send a frame to the client.
+
+        Returns:
+          bool: Indicates whether the frame was sent.
+        """
+        body_bytes = body.encode('utf-8')
+        lines = [command]
+        for name, value in headers.items():
+            lines.append(f'{_escape(name)}:{_escape(value)}')
+        if body_bytes:
+            lines.append(f'content-length:{len(body_bytes)}')
+        data = ('\n'.join(lines) + '\n\n').encode('utf-8') + body_bytes + \
+            b'\0'
+        with self._send_lock:
+            if self._closed:
+                return False
+            try:
+                self.request.sendall(data)
+            except (OSError, ValueError):
+                self._closed = True
+                return False
+        return True
+
+
+def _lpar_status(lpar):
+    """
+    Return the 'status' property of an LPAR.
+    """
+    return 'operating' if lpar.active else 'not-activated'
+
+
+def _escape(value):
+    """
+    Escape a STOMP 1.2 header name or value.
+    """
+    return str(value).replace('\\', '\\\\').replace('\r', '\\r'). \
+        replace('\n', '\\n').replace(':', '\\c')
+
+
+def _unescape(value):
+    """
+    Unescape a STOMP 1.2 header name or value.
+    """
+    return re.sub(r'\\(.)', lambda m: {'r': '\r', 'n': '\n', 'c': ':'}.get(
+        m.group(1), m.group(1)), value)
+
+
+def _parse_frame(frame):
+    """
+    Parse a STOMP frame from a client (without its NUL terminator) and return
+    its command and headers. The body is ignored, since the frames used by
+    the notification receiver have no body.
+    """
+    head = frame.split(b'\n\n', 1)[0].decode('utf-8').replace('\r', '')
+    lines = head.lstrip('\n').split('\n')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers.setdefault(_unescape(name), _unescape(value))
+    return lines[0], headers
+
+
+def main():
+    """
+    Run the stand-in until interrupted.
+    """
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for an HMC, for load tests of the "
+        "forwarder")
+    parser.add_argument("--host", default='127.0.0.1',
+                        help="IP address to listen on. Default: 127.0.0.1")
+    parser.add_argument("--cpcs", type=int, default=1,
+                        help="number of CPCs. Default: 1")
+    parser.add_argument("--lpars", type=int, default=10,
+                        help="number of LPARs per CPC. Default: 10")
+    parser.add_argument("--rate", type=float, default=10.0,
+                        help="OS messages per second per LPAR. Default: 10")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="maximum number of OS messages per "
+                        "notification. Default: 1")
+    parser.add_argument("--open-channels", action='store_true',
+                        help="simulate already open OS message channels")
+    parser.add_argument("--churn-interval", type=float, default=0,
+                        help="seconds between two churn actions (LPAR "
+                        "replacement, deactivation, activation, STOMP "
+                        "reconnect), or 0 for no churn. Default: 0")
+    args = parser.parse_args()
+
+    standin = HmcStandin(args.host, args.cpcs, args.lpars, args.rate,
+                         args.batch_size, args.open_channels,
+                         args.churn_interval)
+    standin.start()
+    print(f"HMC stand-in listening on {args.host} "
+          f"(REST port {REST_PORT}, STOMP port {STOMP_PORT}). Use this in "
+          "the forwarder config file:\n"
+          f"hmc:\n  host: {args.host}\n  userid: user\n"
+          "  password: password\n  verify_cert: false\n"
+          "Press Ctrl-C to stop.", flush=True)
+    try:
+        while True:
+            time.sleep(10)
+            print(f"Published {standin.num_published} OS messages, "
+                  f"delivered {standin.num_delivered} to subscribers, "
+                  f"performed {standin.num_churn_actions} churn actions",
+                  flush=True)
+    except KeyboardInterrupt:
+        pass
+    standin.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
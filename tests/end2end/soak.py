@@ -0,0 +1,570 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A soak test of the forwarder with detection of leaked memory, file
+descriptors and threads.
+
+The soak test runs the forwarder server against the HMC stand-in (see
+hmc_standin.py) in a separate process, with churn: The stand-in replaces,
+deactivates and activates LPARs and drops the STOMP connections, and the
+syslog and HTTP destinations of the forwarder are restarted periodically.
+
+The RSS, the number of open file descriptors, the number of threads and the
+memory traced by tracemalloc of the forwarder process are sampled
+periodically. After a warmup time, a baseline sample is taken, and at the
+end, the soak test fails if the growth since the baseline exceeds the
+thresholds, or if the forwarder no longer delivers OS messages.
+
+The soak test can be run as a script for long runs, for example:
+
+    python -m tests.end2end.soak --duration 14400 --lpars 50
+"""
+
+import os
+import gc
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+from collections import namedtuple
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from zhmc_os_forwarder.backfill import DEFAULT_BACKFILL_CONCURRENCY
+from zhmc_os_forwarder.forwarder_server import ForwarderServer
+
+# Default growth thresholds since the baseline sample
+DEFAULT_MAX_RSS_GROWTH = 50 * 1024 * 1024  # Bytes
+DEFAULT_MAX_TRACED_GROWTH = 5 * 1024 * 1024  # Bytes
+DEFAULT_MAX_FD_GROWTH = 10
+# The threads of the backfiller are started on demand, up to its concurrency
+DEFAULT_MAX_THREAD_GROWTH = DEFAULT_BACKFILL_CONCURRENCY + 2
+
+# Maximum time in seconds for the forwarder to deliver new OS messages at the
+# end of the soak test. This covers the reconnect after a dropped STOMP
+# connection, which takes several seconds.
+LIVENESS_TIMEOUT = 30
+
+# Number of top allocators reported
+TOP_ALLOCATORS = 10
+
+# Root directory of the repository, for running the stand-in as a module
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+# One sample of the resource usage of the process. Items that cannot be
+# determined on the platform are None.
+ResourceSample = namedtuple(
+    'ResourceSample',
+    [
+        'time',     # float: Seconds since the start of the soak test
+        'rss',      # int: Resident set size in Bytes
+        'fds',      # int: Number of open file descriptors
+        'threads',  # int: Number of threads
+        'traced',   # int: Memory traced by tracemalloc in Bytes
+    ]
+)
+
+
+class ResourceSampler:
+    """
+    Samples the resource usage of the current process.
+
+    Starts tracemalloc if it is not already tracing, until the sampler is
+    stopped.
+    """
+
+    def __init__(self):
+        self.start_time = time.monotonic()
+        self.baseline = None  # ResourceSample: The baseline sample
+        self._baseline_snapshot = None  # tracemalloc.Snapshot
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "baseline={s.baseline!r}"
+                ")".format(s=self))
+
+    def stop(self):
+        """
+        Stop tracemalloc if the sampler has started it.
+        """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def sample(self):
+        """
+        Return a ResourceSample of the current resource usage, after a
+        garbage collection.
+        """
+        gc.collect()
+        return ResourceSample(
+            time.monotonic() - self.start_time, _rss(), _num_fds(),
+            threading.active_count(), tracemalloc.get_traced_memory()[0])
+
+    def set_baseline(self):
+        """
+        Take the baseline sample and return it.
+        """
+        self.baseline = self.sample()
+        self._baseline_snapshot = tracemalloc.take_snapshot()
+        return self.baseline
+
+    def growth(self, sample):
+        """
+        Return the growth of a sample since the baseline sample, as a dict
+        with the growth of each item of ResourceSample that is known.
+        """
+        return {
+            name: getattr(sample, name) - getattr(self.baseline, name)
+            for name in ('rss', 'fds', 'threads', 'traced')
+            if None not in (getattr(sample, name),
+                            getattr(self.baseline, name))}
+
+    def top_allocators(self, limit=TOP_ALLOCATORS):
+        """
+        Return the source lines with the largest growth of traced memory since
+        the baseline sample, as a list of strings.
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        stats = snapshot.compare_to(self._baseline_snapshot, 'lineno')
+        return [str(stat) for stat in stats[:limit]]
+
+
+def _rss():
+    """
+    Return the resident set size of the current process in Bytes, or None.
+    """
+    try:
+        with open('/proc/self/statm', encoding='ascii') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _num_fds():
+    """
+    Return the number of open file descriptors of the current process, or
+    None.
+    """
+    for fd_dir in ('/proc/self/fd', '/dev/fd'):
+        try:
+            return len(os.listdir(fd_dir))
+        except OSError:
+            pass
+    return None
+
+
+class _IngestHandler(BaseHTTPRequestHandler):
+    """
+    Handler for the HTTP destination, that counts the received records.
+    """
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Handle a POST request"""
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        with self.server.lock:
+            self.server.destination.num_records += body.count(b'\n')
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # pylint: disable=redefined-builtin
+        """Suppress the logging of requests"""
+
+
+class _IngestServer(ThreadingHTTPServer):
+    """
+    HTTP server for the HTTP destination.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, destination):
+        self.destination = destination
+        self.lock = threading.Lock()
+        super().__init__(address, _IngestHandler)
+
+
+class HttpDestination:
+    """
+    A local HTTP destination for the forwarder, that can be restarted.
+    """
+
+    def __init__(self):
+        self.num_records = 0  # Number of received records
+        self._server = None
+        self._thread = None
+        self.port = 0
+        self.start()
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "port={s.port!r}, "
+                "num_records={s.num_records!r}"
+                ")".format(s=self))
+
+    @property
+    def url(self):
+        """
+        string: URL of the HTTP destination.
+        """
+        return f'http://127.0.0.1:{self.port}/ingest'
+
+    def start(self):
+        """
+        Start the HTTP server, on the same port as before if restarted.
+        """
+        self._server = _IngestServer(('127.0.0.1', self.port), self)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='soak-http', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the HTTP server.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def restart(self):
+        """
+        Restart the HTTP server.
+        """
+        self.stop()
+        self.start()
+
+
+class SyslogDestination:
+    """
+    A local UDP syslog destination for the forwarder, that can be restarted.
+    """
+
+    def __init__(self):
+        self.num_records = 0  # Number of received records
+        self._sock = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.port = 0
+        self.start()
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "port={s.port!r}, "
+                "num_records={s.num_records!r}"
+                ")".format(s=self))
+
+    def start(self):
+        """
+        Start receiving, on the same port as before if restarted.
+        """
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind(('127.0.0.1', self.port))
+        self._sock.settimeout(0.1)
+        self.port = self._sock.getsockname()[1]
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='soak-syslog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop receiving.
+        """
+        self._stop_event.set()
+        self._thread.join()
+        self._sock.close()
+
+    def restart(self):
+        """
+        Restart receiving.
+        """
+        self.stop()
+        self.start()
+
+    def _run(self):
+        """
+        The method running in the receiving thread.
+        """
+        while not self._stop_event.is_set():
+            try:
+                self._sock.recv(65536)
+            except socket.timeout:
+                continue
+            self.num_records += 1
+
+
+def start_standin_process(num_cpcs, num_lpars, rate, churn_interval):
+    """
+    Start the HMC stand-in in a separate process, so that its resource usage
+    does not affect the samples, and wait until it is ready.
+
+    Returns:
+      subprocess.Popen: The stand-in process.
+
+    Raises:
+      RuntimeError: The stand-in process ended.
+    """
+    # pylint: disable=consider-using-with
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'tests.end2end.hmc_standin',
+         '--cpcs', str(num_cpcs), '--lpars', str(num_lpars),
+         '--rate', str(rate), '--batch-size', '5',
+         '--churn-interval', str(churn_interval)],
+        cwd=REPO_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        text=True)
+    output = []
+    for line in proc.stdout:
+        output.append(line)
+        if line.startswith('HMC stand-in listening'):
+            break
+    else:
+        proc.wait()
+        raise RuntimeError("The HMC stand-in ended with exit code {c}:\n{o}".
+                           format(c=proc.returncode, o=''.join(output)))
+    # The output of the stand-in must be consumed so that it does not block
+    threading.Thread(target=proc.stdout.read, name='soak-standin-output',
+                     daemon=True).start()
+    return proc
+
+
+def stop_standin_process(proc):
+    """
+    Stop the HMC stand-in process.
+    """
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+# pylint: disable=too-many-locals
+def run_soak(directory, duration, warmup, num_cpcs=1, num_lpars=10, rate=10.0,
+             churn_interval=1.0, sample_interval=10.0, restart_interval=30.0,
+             max_rss_growth=DEFAULT_MAX_RSS_GROWTH,
+             max_traced_growth=DEFAULT_MAX_TRACED_GROWTH,
+             max_fd_growth=DEFAULT_MAX_FD_GROWTH,
+             max_thread_growth=DEFAULT_MAX_THREAD_GROWTH, log=None):
+    """
+    Run the soak test.
+
+    Parameters:
+      directory (string): Path name of a directory for the forwarder config
+        file and the file destination.
+      duration (float): Duration of the soak test in seconds.
+      warmup (float): Time in seconds after which the baseline sample is
+        taken.
+      num_cpcs (int): Number of CPCs of the stand-in.
+      num_lpars (int): Number of LPARs per CPC of the stand-in.
+      rate (float): OS messages per second per LPAR.
+      churn_interval (float): Seconds between two churn actions of the
+        stand-in, or 0 for no churn.
+      sample_interval (float): Seconds between two samples.
+      restart_interval (float): Seconds between two restarts of the syslog
+        and HTTP destinations.
+      max_rss_growth (int): Maximum growth of the RSS in Bytes.
+      max_traced_growth (int): Maximum growth of the traced memory in Bytes.
+      max_fd_growth (int): Maximum growth of the number of open file
+        descriptors.
+      max_thread_growth (int): Maximum growth of the number of threads.
+      log (callable): Function for logging progress messages, or None.
+
+    Returns:
+      dict: The result, with items 'samples' (list of ResourceSample),
+      'baseline' (ResourceSample), 'growth' (dict, see
+      ResourceSampler.growth()), 'top_allocators' (list of string),
+      'records' (dict with the number of records received by the 'http' and
+      'syslog' destinations) and 'violations' (list of string with the
+      exceeded thresholds; empty if the soak test passed).
+    """
+    log = log or (lambda msg: None)
+    standin = start_standin_process(num_cpcs, num_lpars, rate, churn_interval)
+    sampler = ResourceSampler()
+    http_dest = HttpDestination()
+    syslog_dest = SyslogDestination()
+    file_dir = os.path.join(directory, 'files')
+    config_data = {
+        'hmc': {'host': '127.0.0.1', 'userid': 'user',
+                'password': 'password', 'verify_cert': False},
+        'forwarding': [{
+            'syslogs': [{'host': '127.0.0.1', 'port': syslog_dest.port,
+                         'port_type': 'udp'}],
+            'files': [{'directory': file_dir, 'per': 'lpar',
+                       'max_size': 1024 * 1024, 'compression': 'gzip'}],
+            'http_servers': [{'url': http_dest.url, 'compression': 'none',
+                              'batch_max_delay': 0.1, 'retry_backoff': 0.1}],
+            'cpcs': [{'cpc': '.*', 'partitions': [{'partition': '.*'}]}],
+        }],
+    }
+    server = ForwarderServer(
+        config_data, os.path.join(directory, 'config.yaml'), stats_interval=0)
+    samples = []
+    try:
+        server.startup()
+        start_time = time.monotonic()
+        next_restart = start_time + restart_interval
+        records_at_last_sample = 0
+        while True:
+            now = time.monotonic()
+            if now - start_time >= duration:
+                break
+            time.sleep(min(sample_interval, duration - (now - start_time)))
+            if time.monotonic() >= next_restart:
+                http_dest.restart()
+                syslog_dest.restart()
+                _remove_segments(file_dir)
+                next_restart += restart_interval
+            if sampler.baseline is None and \
+                    time.monotonic() - start_time >= warmup:
+                samples.append(sampler.set_baseline())
+            else:
+                samples.append(sampler.sample())
+            records_at_last_sample = http_dest.num_records
+            log("Sample: {s}; records: http={h}, syslog={y}".format(
+                s=samples[-1], h=http_dest.num_records,
+                y=syslog_dest.num_records))
+        # The forwarder must still deliver at the end of the soak test
+        delivering = False
+        end_time = time.monotonic() + LIVENESS_TIMEOUT
+        while not delivering and time.monotonic() < end_time:
+            time.sleep(0.5)
+            delivering = http_dest.num_records > records_at_last_sample
+    finally:
+        server.shutdown()
+        stop_standin_process(standin)
+        http_dest.stop()
+        syslog_dest.stop()
+
+    if sampler.baseline is None:
+        sampler.set_baseline()
+    final = samples[-1] if samples else sampler.sample()
+    growth = sampler.growth(final)
+    violations = []
+    for name, max_growth in (('rss', max_rss_growth),
+                             ('traced', max_traced_growth),
+                             ('fds', max_fd_growth),
+                             ('threads', max_thread_growth)):
+        if growth.get(name, 0) > max_growth:
+            violations.append(
+                "Growth of {n} is {g}, exceeding the threshold {m}".
+                format(n=name, g=growth[name], m=max_growth))
+    if not delivering:
+        violations.append(
+            "The forwarder no longer delivers OS messages at the end")
+    top_allocators = sampler.top_allocators()
+    sampler.stop()
+    return {
+        'samples': samples,
+        'baseline': sampler.baseline,
+        'growth': growth,
+        'top_allocators': top_allocators,
+        'records': {'http': http_dest.num_records,
+                    'syslog': syslog_dest.num_records},
+        'violations': violations,
+    }
+
+
+def _remove_segments(file_dir):
+    """
+    Remove the compressed rotated segments of the file destination, so that
+    they do not fill the disk in long runs.
+    """
+    try:
+        for name in os.listdir(file_dir):
+            if name.endswith('.gz'):
+                os.remove(os.path.join(file_dir, name))
+    except OSError:
+        pass  # The directory may not exist yet
+
+
+def main():
+    """
+    Run the soak test and return the exit code.
+    """
+    parser = argparse.ArgumentParser(
+        description="Soak test of the forwarder with leak detection")
+    parser.add_argument("--duration", type=float, default=3600,
+                        help="duration in seconds. Default: 3600")
+    parser.add_argument("--warmup", type=float, default=300,
+                        help="seconds after which the baseline is taken. "
+                        "Default: 300")
+    parser.add_argument("--cpcs", type=int, default=1,
+                        help="number of CPCs. Default: 1")
+    parser.add_argument("--lpars", type=int, default=10,
+                        help="number of LPARs per CPC. Default: 10")
+    parser.add_argument("--rate", type=float, default=10.0,
+                        help="OS messages per second per LPAR. Default: 10")
+    parser.add_argument("--churn-interval", type=float, default=5.0,
+                        help="seconds between two churn actions. Default: 5")
+    parser.add_argument("--sample-interval", type=float, default=60,
+                        help="seconds between two samples. Default: 60")
+    parser.add_argument("--restart-interval", type=float, default=120,
+                        help="seconds between two restarts of the "
+                        "destinations. Default: 120")
+    parser.add_argument("--max-rss-growth", type=int,
+                        default=DEFAULT_MAX_RSS_GROWTH,
+                        help="maximum RSS growth in Bytes. Default: "
+                        f"{DEFAULT_MAX_RSS_GROWTH}")
+    parser.add_argument("--max-traced-growth", type=int,
+                        default=DEFAULT_MAX_TRACED_GROWTH,
+                        help="maximum traced memory growth in Bytes. "
+                        f"Default: {DEFAULT_MAX_TRACED_GROWTH}")
+    parser.add_argument("--max-fd-growth", type=int,
+                        default=DEFAULT_MAX_FD_GROWTH,
+                        help="maximum growth of open file descriptors. "
+                        f"Default: {DEFAULT_MAX_FD_GROWTH}")
+    parser.add_argument("--max-thread-growth", type=int,
+                        default=DEFAULT_MAX_THREAD_GROWTH,
+                        help="maximum growth of threads. Default: "
+                        f"{DEFAULT_MAX_THREAD_GROWTH}")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        result = run_soak(
+            directory, args.duration, args.warmup, args.cpcs, args.lpars,
+            args.rate, args.churn_interval, args.sample_interval,
+            args.restart_interval, args.max_rss_growth,
+            args.max_traced_growth, args.max_fd_growth,
+            args.max_thread_growth, log=lambda msg: print(msg, flush=True))
+    print(f"Baseline: {result['baseline']}")
+    print(f"Growth since baseline: {result['growth']}")
+    print(f"Records received: {result['records']}")
+    print("Top allocators since baseline:")
+    for line in result['top_allocators']:
+        print(f"  {line}")
+    for violation in result['violations']:
+        print(f"Failed: {violation}")
+    return 1 if result['violations'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+End-to-end tests of the forwarder server against the local HMC stand-in.
+"""
+
+import os
+import re
+import time
+import shutil
+import subprocess
+
+import pytest
+
+from zhmc_os_forwarder import utils
+from zhmc_os_forwarder.forwarder_server import ForwarderServer
+
+from .hmc_standin import HmcStandin
+
+# Maximum time in seconds for the forwarded messages to arrive
+WAIT_TIMEOUT = 60
+
+# Time in seconds between two checks for the forwarded messages
+POLL_INTERVAL = 0.2
+
+MESSAGE_PATTERN = re.compile(r'^(CPC\d+) (LPAR\d+) (\d+): ')
+
+
+@pytest.fixture(name='standin_factory')
+def fixture_standin_factory():
+    """
+    Fixture returning a function that creates and starts an HMC stand-in.
+    The stand-in is stopped at the end of the test.
+    """
+    if not shutil.which('openssl'):
+        pytest.skip("The openssl command is needed for the HMC stand-in")
+    standins = []
+
+    def create(**kwargs):
+        standin = HmcStandin(**kwargs)
+        try:
+            standin.start()
+        except OSError as exc:
+            pytest.skip(f"The HMC stand-in cannot be started: {exc}")
+        except subprocess.CalledProcessError as exc:
+            pytest.skip(f"The certificate cannot be created: {exc.stderr}")
+        standins.append(standin)
+        return standin
+
+    yield create
+    for standin in standins:
+        standin.stop()
+
+
+def forwarded_seq_nos(out_dir):
+    """
+    Return the sequence numbers of the messages written by the forwarder to
+    the files in a directory, as a list by (CPC name, LPAR name).
+    """
+    seq_nos = {}
+    if not os.path.isdir(out_dir):
+        return seq_nos
+    for name in os.listdir(out_dir):
+        with open(os.path.join(out_dir, name), encoding='utf-8') as fp:
+            for line in fp:
+                m = MESSAGE_PATTERN.match(line)
+                if m:
+                    seq_nos.setdefault((m.group(1), m.group(2)), []).append(
+                        int(m.group(3)))
+    return seq_nos
+
+
+def wait_for(condition, timeout=WAIT_TIMEOUT):
+    """
+    Poll a condition until it is true or the timeout expires, and return
+    whether it became true.
+    """
+    end_time = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= end_time:
+            return False
+        time.sleep(POLL_INTERVAL)
+    return True
+
+
+def run_forwarder(standin, tmp_path, min_messages):
+    """
+    Run the forwarder against the stand-in until each LPAR has forwarded at
+    least a number of messages, and return the forwarder server and the
+    forwarded sequence numbers by (CPC name, LPAR name).
+
+    Fails the test if the messages do not arrive within WAIT_TIMEOUT.
+    """
+    out_dir = tmp_path / 'out'
+    config_data = {
+        'hmc': {'host': standin.host, 'userid': 'user',
+                'password': 'password', 'verify_cert': False},
+        'forwarding': [{
+            'files': [{'directory': str(out_dir), 'per': 'lpar'}],
+            'cpcs': [{'cpc': '.*', 'partitions': [{'partition': '.*'}]}],
+        }],
+    }
+    server = ForwarderServer(config_data, str(tmp_path / 'config.yaml'),
+                             stats_interval=0)
+
+    def complete():
+        seq_nos = forwarded_seq_nos(out_dir)
+        if len(seq_nos) < len(standin.lpars):
+            return False
+        return min(len(s) for s in seq_nos.values()) >= min_messages
+
+    server.startup()
+    try:
+        arrived = wait_for(complete)
+    finally:
+        server.shutdown()
+    seq_nos = forwarded_seq_nos(out_dir)
+    if not arrived:
+        counts = {f'{c}/{p}': len(s) for (c, p), s in seq_nos.items()}
+        pytest.fail(
+            f"The forwarder did not forward {min_messages} messages for each "
+            f"of the {len(standin.lpars)} LPARs within {WAIT_TIMEOUT} sec. "
+            f"Messages forwarded by LPAR: {counts}; messages published by "
+            f"the stand-in: {standin.num_published}, delivered to "
+            f"subscribers: {standin.num_delivered}")
+    return server, seq_nos
+
+
+@pytest.mark.parametrize(
+    "open_channels", [
+        pytest.param(False, id='new-channels'),
+        pytest.param(True, id='open-channels'),
+    ]
+)
+def test_end2end(standin_factory, tmp_path, monkeypatch, open_channels):
+    """
+    Test that the forwarder forwards the OS messages of all LPARs of the
+    HMC stand-in without gaps, for newly opened OS message channels and for
+    already open OS message channels.
+    """
+    monkeypatch.setattr(utils, 'VERBOSE_LEVEL', 0)
+    standin = standin_factory(num_cpcs=2, num_lpars=3, rate=50.0,
+                              batch_size=4, open_channels=open_channels)
+
+    server, seq_nos = run_forwarder(standin, tmp_path, min_messages=20)
+
+    assert len(seq_nos) == 6
+    for lpar_seq_nos in seq_nos.values():
+        assert len(lpar_seq_nos) >= 20
+        # Messages may be forwarded before the subscription was complete,
+        # but from the first forwarded message on there are no gaps
+        assert lpar_seq_nos == list(
+            range(lpar_seq_nos[0], lpar_seq_nos[-1] + 1))
+    assert server.backfiller.missing_counter.value == 0
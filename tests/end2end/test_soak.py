@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Short soak test of the forwarder server against the local HMC stand-in.
+Long soak tests are run with the soak module as a script.
+"""
+
+import shutil
+
+import pytest
+
+from zhmc_os_forwarder import utils
+
+from .soak import run_soak
+
+
+def test_soak(tmp_path, monkeypatch):
+    """
+    Test that the forwarder does not leak resources while LPARs are added,
+    removed, deactivated and activated, connections are dropped and the
+    destinations are restarted.
+    """
+    if not shutil.which('openssl'):
+        pytest.skip("The openssl command is needed for the HMC stand-in")
+    monkeypatch.setattr(utils, 'VERBOSE_LEVEL', 0)
+
+    try:
+        result = run_soak(
+            str(tmp_path), duration=30, warmup=10, num_lpars=4, rate=20,
+            churn_interval=2, sample_interval=2, restart_interval=5)
+    except RuntimeError as exc:
+        pytest.skip(f"The HMC stand-in cannot be started: {exc}")
+
+    assert result['violations'] == [], \
+        "Soak test violations: {v}\nTop allocators:\n{t}".format(
+            v=result['violations'], t='\n'.join(result['top_allocators']))
+    assert result['records']['http'] > 0
+    assert result['records']['syslog'] > 0
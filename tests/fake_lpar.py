@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Stand-in for a zhmcclient.Lpar with OS messages, for the unit tests.
+"""
+
+from types import SimpleNamespace
+
+import zhmcclient
+
+
+class FakeLpar:
+    """
+    Stand-in for a zhmcclient.Lpar that has OS messages with a set of
+    sequence numbers available. Its CPC is CPC1, unless specified.
+
+    Its OS message channel has the notification topic os_topic, or its OS
+    does not support OS messages if os_topic is None.
+    """
+
+    def __init__(self, seq_nos, name='LPAR1', cpc=None):
+        if cpc is None:
+            cpc = SimpleNamespace(name='CPC1', uri='/api/cpcs/1')
+        self.name = name
+        self.uri = f'/api/logical-partitions/{name}'
+        self.manager = SimpleNamespace(
+            parent=cpc, resource_object=lambda uri, props=None: self)
+        self.seq_nos = seq_nos
+        self.requests = []
+        self.os_topic = f'os-{name}'
+
+    def open_os_message_channel(self, include_refresh_messages=True):
+        """Return the notification topic of the OS message channel"""
+        # pylint: disable=unused-argument
+        if self.os_topic is None:
+            raise zhmcclient.HTTPError({
+                'http-status': 409, 'reason': 332,
+                'message': "The OS does not support OS messages",
+                'request-method': 'POST',
+                'request-uri': self.uri + '/operations/open-os-message-channel',
+            })
+        return self.os_topic
+
+    def list_os_messages(self, begin=None, end=None):
+        """Return the available OS messages in the range. Has the parameters
+        of zhmcclient.Partition.list_os_messages(), which are a subset of
+        those of zhmcclient.Lpar.list_os_messages()."""
+        self.requests.append((begin, end))
+        if end is None:
+            end = max(self.seq_nos)
+        return {'os-messages': [
+            msg(s) for s in self.seq_nos if begin <= s <= end]}
+
+
+def msg(seq_no):
+    """Return an OS message with the sequence number"""
+    return {'sequence-number': seq_no, 'message-text': f'msg {seq_no}'}
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the backfill module.
+"""
+
+import inspect
+from threading import Event
+
+import pytest
+import zhmcclient
+
+from zhmc_os_forwarder.backfill import Backfiller, list_os_messages
+from zhmc_os_forwarder.forwarded_lpars import ForwardedLparInfo
+from zhmc_os_forwarder.metrics import MetricsRegistry
+
+from .fake_lpar import FakeLpar, msg
+
+
+def backfiller(max_queued=None, **kwargs):
+    """
+    Return a Backfiller and the list of sequence numbers put. If max_queued
+    is specified, putting routine OS messages fails while that many of them
+    are in the list.
+    """
+    put_seq_nos = []
+
+    def put(lpar_info, msg_info, recv_time):
+        # pylint: disable=unused-argument
+        if max_queued is not None and not msg_info.get('is-priority') and \
+                len(put_seq_nos) >= max_queued:
+            return False
+        put_seq_nos.append(msg_info['sequence-number'])
+        return True
+
+    bf = Backfiller(put, Event(), MetricsRegistry(), **kwargs)
+    return bf, put_seq_nos
+
+
+def test_list_os_messages_pages():
+    """
+    Test that list_os_messages() retrieves the range in pages.
+    """
+    lpar = FakeLpar(range(0, 100))
+    pages = list(list_os_messages(lpar, 10, 34, 10))
+    assert lpar.requests == [(10, 19), (20, 29), (30, 34)]
+    seq_nos = [m['sequence-number'] for page in pages for m in page]
+    assert seq_nos == list(range(10, 35))
+
+
+AVAILABLE_SEQ_NOS = [10, 11, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29]
+
+
+@pytest.mark.parametrize(
+    "max_count, exp_requests, exp_seq_nos",
+    [
+        (None, [(10, 19), (20, 29), (30, 39)], AVAILABLE_SEQ_NOS),
+        (8, [(10, 17)], [10, 11]),
+        (12, [(10, 19), (20, 21)], [10, 11, 20, 21]),
+        (0, [], []),
+    ]
+)
+def test_list_os_messages_open_end(max_count, exp_requests, exp_seq_nos):
+    """
+    Test that list_os_messages() without an end retrieves the available
+    OS messages in pages of sequence numbers, up to the maximum count, and
+    without limiting the number of OS messages in the request, which
+    partitions do not support.
+    """
+    lpar = FakeLpar(AVAILABLE_SEQ_NOS)
+    pages = list(list_os_messages(lpar, 10, None, 10, max_count))
+    assert lpar.requests == exp_requests
+    seq_nos = [m['sequence-number'] for page in pages for m in page]
+    assert seq_nos == exp_seq_nos
+
+
+def test_fake_lpar_partition_parameters():
+    """
+    Test that FakeLpar.list_os_messages() accepts only the parameters of
+    zhmcclient.Partition.list_os_messages(), so that the tests fail if
+    list_os_messages() uses parameters that only LPARs in classic mode
+    support.
+    """
+    params = list(inspect.signature(
+        zhmcclient.Partition.list_os_messages).parameters)
+    assert list(inspect.signature(
+        FakeLpar.list_os_messages).parameters) == params
+
+
+def test_backfiller_in_sequence():
+    """
+    Test that OS messages in sequence are passed on without retrieval.
+    """
+    lpar = FakeLpar(range(0, 100))
+    lpar_info = ForwardedLparInfo(lpar)
+    bf, put_seq_nos = backfiller()
+    bf.receive(lpar_info, [msg(5), msg(6)], 0.0)
+    bf.receive(lpar_info, [msg(7)], 0.0)
+    bf.shutdown()
+    assert put_seq_nos == [5, 6, 7]
+    assert lpar.requests == []
+    assert lpar_info.next_seq_no == 8
+
+
+def test_backfiller_gap():
+    """
+    Test that a gap is filled in sequence order, that OS messages no longer
+    available are counted as missing, and that held back OS messages are
+    passed on after the retrieved ones.
+    """
+    lpar = FakeLpar([0, 1, 2, 4, 5, 6])  # 3 is no longer available
+    lpar_info = ForwardedLparInfo(lpar)
+    bf, put_seq_nos = backfiller(page_size=2)
+    bf.receive(lpar_info, [msg(0)], 0.0)
+    bf.receive(lpar_info, [msg(7), msg(8)], 0.0)
+    bf.receive(lpar_info, [msg(9)], 0.0)
+    bf.shutdown()
+    assert put_seq_nos == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    assert lpar_info.next_seq_no == 10
+    assert lpar_info.held_messages is None
+    assert bf.backfilled_counter.value == 5
+    assert bf.missing_counter.value == 1
+
+
+def test_backfiller_startup():
+    """
+    Test that the most recent OS messages are retrieved for the first OS
+    message of an LPAR, and that a large gap is limited to max_messages.
+    """
+    lpar = FakeLpar(range(0, 100))
+    lpar_info = ForwardedLparInfo(lpar)
+    bf, put_seq_nos = backfiller(startup_messages=3, max_messages=2)
+    bf.receive(lpar_info, [msg(50)], 0.0)
+    bf.shutdown()
+    bf, put_seq_nos2 = backfiller(startup_messages=3, max_messages=2)
+    bf.receive(lpar_info, [msg(60)], 0.0)
+    bf.shutdown()
+    assert put_seq_nos == [47, 48, 49, 50]
+    assert put_seq_nos2 == [58, 59, 60]
+    assert bf.missing_counter.value == 7
+
+
+def test_backfiller_resume():
+    """
+    Test resuming from a checkpoint, with an OS message received while the
+    OS messages since the checkpoint are retrieved.
+    """
+    lpar = FakeLpar(range(0, 20))
+    lpar_info = ForwardedLparInfo(lpar)
+    lpar_info.next_seq_no = 16
+    bf, put_seq_nos = backfiller()
+    bf.resume(lpar_info, 16)
+    bf.receive(lpar_info, [msg(19), msg(20)], 0.0)
+    bf.shutdown()
+    assert put_seq_nos == [16, 17, 18, 19, 20]
+    assert lpar_info.next_seq_no == 21
+
+
+def test_backfiller_resume_max_messages():
+    """
+    Test that resuming from a checkpoint retrieves at most max_messages OS
+    messages, in pages of page_size sequence numbers.
+    """
+    lpar = FakeLpar(range(0, 100))
+    lpar_info = ForwardedLparInfo(lpar)
+    bf, put_seq_nos = backfiller(max_messages=5, page_size=3)
+    bf.resume(lpar_info, 10)
+    bf.shutdown()
+    assert lpar.requests == [(10, 12), (13, 14)]
+    assert put_seq_nos == [10, 11, 12, 13, 14]
+    assert lpar_info.next_seq_no == 15
+
+
+def test_backfiller_reset():
+    """
+    Test that the first OS message after a reset is handled like the first
+    OS message after startup.
+    """
+    lpar_info = ForwardedLparInfo(FakeLpar(range(0, 20)))
+    bf, put_seq_nos = backfiller()
+    bf.receive(lpar_info, [msg(10), msg(11)], 0.0)
+    bf.reset(lpar_info)
+    assert lpar_info.next_seq_no is None
+    bf.receive(lpar_info, [msg(3)], 0.0)
+    bf.shutdown()
+    assert put_seq_nos == [10, 11, 3]
+    assert lpar_info.next_seq_no == 4
+
+
+def test_backfiller_spill():
+    """
+    Test that the OS messages of an LPAR are spilled when they cannot be
+    passed on, that priority OS messages are still passed on, and that the
+    spilled OS messages are retrieved in order and without duplicates when
+    refilling.
+    """
+    lpar = FakeLpar(range(0, 20))
+    lpar_info = ForwardedLparInfo(lpar)
+    bf, put_seq_nos = backfiller(max_queued=2)
+    bf.receive(lpar_info, [msg(0), msg(1), msg(2), msg(3)], 0.0)
+    priority_msg = dict(msg(4), **{'is-priority': True})
+    bf.receive(lpar_info, [priority_msg, msg(5), msg(6)], 0.0)
+    assert put_seq_nos == [0, 1, 4]
+    assert lpar_info.spilled_seq_no == 2
+    assert lpar_info.next_seq_no == 7
+    assert bf.spilled_counter.value == 4
+
+    # Refill part of the spilled OS messages
+    put_seq_nos.clear()
+    bf.refill(lpar_info, 2)
+    bf.shutdown()
+    assert put_seq_nos == [2, 3]
+    assert lpar_info.spilled_seq_no == 4
+    assert lpar_info.spilled_priority == {4}
+
+    # Refill the remaining ones, without the priority OS message
+    bf, put_seq_nos = backfiller(max_queued=10)
+    bf.refill(lpar_info, 10)
+    bf.receive(lpar_info, [msg(7)], 0.0)
+    bf.shutdown()
+    assert put_seq_nos == [5, 6, 7]
+    assert lpar_info.spilled_seq_no is None
+    assert lpar_info.next_seq_no == 8
+    assert lpar.requests == [(2, 3), (4, 6)]
+
+
+def test_backfiller_unexpected_error():
+    """
+    Test that the held back OS messages are passed on when the retrieval
+    fails with an unexpected exception.
+    """
+    lpar = FakeLpar(range(0, 20))
+    lpar.list_os_messages = None  # Causes TypeError when called
+    lpar_info = ForwardedLparInfo(lpar)
+    bf, put_seq_nos = backfiller()
+    bf.receive(lpar_info, [msg(0)], 0.0)
+    bf.receive(lpar_info, [msg(5), msg(6)], 0.0)
+    bf.shutdown()
+    assert put_seq_nos == [0, 5, 6]
+    assert lpar_info.held_messages is None
+    assert lpar_info.next_seq_no == 7
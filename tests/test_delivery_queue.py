@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the delivery_queue module.
+"""
+
+from threading import Thread
+
+import pytest
+
+from zhmc_os_forwarder.delivery_queue import DeliveryQueue, delivery_class, \
+    PRIORITY_CLASS, NORMAL_CLASS
+
+
+@pytest.mark.parametrize(
+    "msg_info, exp_class",
+    [
+        ({}, NORMAL_CLASS),
+        ({'is-priority': False, 'is-held': False}, NORMAL_CLASS),
+        ({'is-priority': True, 'is-held': False}, PRIORITY_CLASS),
+        ({'is-priority': False, 'is-held': True}, PRIORITY_CLASS),
+    ]
+)
+def test_delivery_class(msg_info, exp_class):
+    """
+    Test delivery_class().
+    """
+    assert delivery_class(msg_info) == exp_class
+
+
+def test_queue_priority_first():
+    """
+    Test that priority items are returned before normal items, and that
+    each class is returned in FIFO order.
+    """
+    queue = DeliveryQueue()
+    queue.put('n1')
+    queue.put('n2')
+    queue.put('p1', PRIORITY_CLASS)
+    queue.put('n3')
+    queue.put('p2', PRIORITY_CLASS)
+    assert len(queue) == 5
+    queue.close()
+
+    items = []
+    while True:
+        entry = queue.get()
+        if entry is None:
+            break
+        items.append(entry)
+    assert items == [
+        ('p1', PRIORITY_CLASS),
+        ('p2', PRIORITY_CLASS),
+        ('n1', NORMAL_CLASS),
+        ('n2', NORMAL_CLASS),
+        ('n3', NORMAL_CLASS),
+    ]
+
+
+def test_queue_key_full():
+    """
+    Test that normal items of a key that has reached the maximum number of
+    items are rejected without blocking, and that items of other keys and
+    priority items can still be put.
+    """
+    queue = DeliveryQueue(max_key_size=2)
+    assert queue.put('a0', key='A') is True
+    assert queue.put('a1', key='A') is True
+
+    putter = Thread(target=queue.put, args=('a2',), kwargs={'key': 'A'})
+    putter.start()
+    putter.join(5)
+    assert not putter.is_alive()
+    assert queue.put('a2', key='A') is False
+    assert queue.put('b0', key='B') is True
+    assert queue.put('p0', PRIORITY_CLASS, key='A') is True
+    assert queue.key_size('A') == 2
+    assert queue.key_size('B') == 1
+    assert len(queue) == 4
+
+    assert queue.get() == ('p0', PRIORITY_CLASS)
+    assert queue.get() == ('a0', NORMAL_CLASS)
+    assert queue.put('a2', key='A') is True
+    assert queue.key_size('C') == 0
+    assert queue.put('a3', key='A', force=True) is True
+    assert queue.key_size('A') == 3
+
+
+def test_queue_close():
+    """
+    Test that closing the queue wakes up a blocked get() and rejects puts.
+    """
+    queue = DeliveryQueue()
+    result = []
+    getter = Thread(target=lambda: result.append(queue.get()))
+    getter.start()
+    queue.close()
+    getter.join(5)
+    assert result == [None]
+    assert queue.put('n1') is False
+
+
+def test_queue_round_robin():
+    """
+    Test that normal items of different keys are returned in weighted
+    round-robin order.
+    """
+    queue = DeliveryQueue()
+    for i in range(6):
+        queue.put(f'a{i}', key='A', weight=2)
+    queue.put('b0', key='B')
+    queue.put('b1', key='B')
+    queue.put('c0', key='C', weight=3)
+    queue.close()
+
+    items = []
+    while True:
+        entry = queue.get()
+        if entry is None:
+            break
+        items.append(entry[0])
+    assert items == [
+        'a0', 'a1', 'b0', 'c0', 'a2', 'a3', 'b1', 'a4', 'a5',
+    ]
+
+
+def test_queue_round_robin_new_key():
+    """
+    Test that a key that gets items while other keys have a backlog is served
+    within one round.
+    """
+    queue = DeliveryQueue()
+    for i in range(100):
+        queue.put(f'a{i}', key='A')
+    assert queue.get() == ('a0', NORMAL_CLASS)
+    queue.put('b0', key='B')
+    assert queue.get() == ('a1', NORMAL_CLASS)
+    assert queue.get() == ('b0', NORMAL_CLASS)
+    assert queue.get() == ('a2', NORMAL_CLASS)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the error_aggregator module.
+"""
+
+from zhmc_os_forwarder import utils
+from zhmc_os_forwarder.error_aggregator import ErrorAggregator, \
+    MAX_SAMPLE_SEQ_NOS
+from zhmc_os_forwarder.metrics import MetricsRegistry
+
+
+def test_error_aggregator(capsys, monkeypatch):
+    """
+    Test that errors are counted by destination and error class, and that
+    only the first error of a kind in an interval is to be logged by the
+    caller.
+    """
+    monkeypatch.setattr(utils, 'VERBOSE_LEVEL', 0)
+    metrics = MetricsRegistry()
+    agg = ErrorAggregator(metrics)
+    dest = 'syslog host1:514'
+    assert agg.record(dest, ConnectionRefusedError('refused'), 1) is True
+    for seq_no in range(2, 10):
+        assert agg.record(dest, ConnectionRefusedError('refused'), seq_no) \
+            is False
+    assert agg.record(dest, TimeoutError('timed out'), 10) is True
+    assert agg.record('directory /d', OSError('disk full'), 10) is True
+
+    agg.report()
+    out = capsys.readouterr().out
+    lines = out.splitlines()
+    # Only the kind with more than one error is summarized
+    assert len(lines) == 1
+    assert "9 OS messages could not be delivered to syslog host1:514 due " \
+        "to ConnectionRefusedError" in lines[0]
+    samples = ', '.join(str(s) for s in range(1, MAX_SAMPLE_SEQ_NOS + 1))
+    assert f"(sample sequence numbers: {samples})" in lines[0]
+
+    # A new interval starts after the report, the counters continue
+    assert agg.record(dest, ConnectionRefusedError('refused'), 11) is True
+    agg.report()
+    assert capsys.readouterr().out == ''
+    counts = {
+        (m.labels['destination'], m.labels['error']): m.value
+        for m in metrics.metrics()
+        if m.name == 'zhmc_os_forwarder_delivery_errors_total'}
+    assert counts == {
+        (dest, 'ConnectionRefusedError'): 10,
+        (dest, 'TimeoutError'): 1,
+        ('directory /d', 'OSError'): 1,
+    }
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the FileSink class.
+"""
+
+import os
+import gzip
+
+from zhmc_os_forwarder.file_sink import FileSink
+
+
+def test_file_sink_per_lpar(tmp_path):
+    """
+    Test writing to one file per LPAR.
+    """
+    sink = FileSink(str(tmp_path), per='lpar', compression='none')
+    sink.write('CPC1', 'LPAR1', ['CPC1 LPAR1 1: m1'])
+    sink.write('CPC1', 'LPAR2', ['CPC1 LPAR2 1: m2'])
+    sink.write('CPC1', 'LPAR1',
+               ['CPC1 LPAR1 2-1/2: l1', 'CPC1 LPAR1 2-2/2: l2'])
+    sink.close()
+
+    assert sorted(os.listdir(tmp_path)) == ['CPC1_LPAR1.log', 'CPC1_LPAR2.log']
+    with open(tmp_path / 'CPC1_LPAR1.log', encoding='utf-8') as fp:
+        assert fp.read() == \
+            'CPC1 LPAR1 1: m1\nCPC1 LPAR1 2-1/2: l1\nCPC1 LPAR1 2-2/2: l2\n'
+
+
+def test_file_sink_close_file(tmp_path):
+    """
+    Test that closing the file of an LPAR flushes it, and that it is opened
+    again when written to.
+    """
+    sink = FileSink(str(tmp_path), per='lpar', compression='none',
+                    flush_interval=3600)
+    sink.write('CPC1', 'LPAR1', ['CPC1 LPAR1 1: m1'])
+    sink.close_file('CPC1', 'LPAR1')
+    sink.close_file('CPC1', 'LPAR2')  # not open
+    with open(tmp_path / 'CPC1_LPAR1.log', encoding='utf-8') as fp:
+        assert fp.read() == 'CPC1 LPAR1 1: m1\n'
+    sink.write('CPC1', 'LPAR1', ['CPC1 LPAR1 2: m2'])
+    sink.close()
+
+    with open(tmp_path / 'CPC1_LPAR1.log', encoding='utf-8') as fp:
+        assert fp.read() == 'CPC1 LPAR1 1: m1\nCPC1 LPAR1 2: m2\n'
+
+
+def test_file_sink_per_cpc(tmp_path):
+    """
+    Test writing to one file per CPC.
+    """
+    sink = FileSink(str(tmp_path), per='cpc', compression='none')
+    sink.write('CPC1', 'LPAR1', ['CPC1 LPAR1 1: m1'])
+    sink.write('CPC1', 'LPAR2', ['CPC1 LPAR2 1: m2'])
+    sink.close()
+
+    assert os.listdir(tmp_path) == ['CPC1.log']
+    with open(tmp_path / 'CPC1.log', encoding='utf-8') as fp:
+        assert fp.read() == 'CPC1 LPAR1 1: m1\nCPC1 LPAR2 1: m2\n'
+
+
+def test_file_sink_rotate_gzip(tmp_path):
+    """
+    Test size based rotation with gzip compression of rotated segments.
+    """
+    sink = FileSink(str(tmp_path), per='lpar', max_size=100,
+                    compression='gzip')
+    records = [f'CPC1 LPAR1 {i}: {"x" * 40}' for i in range(10)]
+    for record in records:
+        sink.write('CPC1', 'LPAR1', [record])
+    sink.close()
+
+    names = sorted(os.listdir(tmp_path))
+    segments = [n for n in names if n.endswith('.log.gz')]
+    assert 'CPC1_LPAR1.log' in names
+    assert len(segments) >= 2
+    assert not [n for n in names if n.endswith('.tmp')]
+
+    data = ''
+    for seg in segments:
+        with gzip.open(tmp_path / seg, 'rt', encoding='utf-8') as fp:
+            data += fp.read()
+    with open(tmp_path / 'CPC1_LPAR1.log', encoding='utf-8') as fp:
+        data += fp.read()
+    assert sorted(data.splitlines()) == sorted(records)
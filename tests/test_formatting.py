@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the formatting module.
+"""
+
+import json
+
+import pytest
+
+from zhmc_os_forwarder.formatting import split_message, \
+    format_text_records, json_lpar_fragment, format_json_record, \
+    truncate_json_record, syslog_header, message_time, SYSLOG_HEADER_LENGTH
+
+
+@pytest.mark.parametrize(
+    "msg_txt, max_bytes, exp_parts",
+    [
+        ("", 100, [""]),
+        ("abc", 100, ["abc"]),
+        ("line1\nline2\n\nline4", 100, ["line1", "line2", "", "line4"]),
+        ("a" * 40, 16, ["a" * 16, "a" * 16, "a" * 8]),
+        # 'ä' is 2 Bytes in UTF-8 and must not be split
+        ("a" + "ä" * 10, 16, ["a" + "ä" * 7, "ä" * 3]),
+        # max_bytes below the minimum is raised to the minimum
+        ("b" * 20, 1, ["b" * 16, "b" * 4]),
+    ]
+)
+def test_split_message(msg_txt, max_bytes, exp_parts):
+    """
+    Test split_message().
+    """
+    parts = split_message(msg_txt, max_bytes)
+    assert parts == exp_parts
+    for part in parts:
+        assert len(part.encode('utf-8')) <= max(max_bytes, 16)
+
+
+def test_format_text_records_single():
+    """
+    Test format_text_records() for a message that fits into one record.
+    """
+    records = format_text_records('CPC1', 'LPAR1', 42, 'IEF403I JOB1', 2048)
+    assert records == ['CPC1 LPAR1 42: IEF403I JOB1']
+
+
+def test_format_text_records_multiline():
+    """
+    Test format_text_records() for a multi-line message.
+    """
+    records = format_text_records('CPC1', 'LPAR1', 42, 'l1\nl2\nl3', 2048)
+    assert records == [
+        'CPC1 LPAR1 42-1/3: l1',
+        'CPC1 LPAR1 42-2/3: l2',
+        'CPC1 LPAR1 42-3/3: l3',
+    ]
+
+
+def test_format_text_records_oversize():
+    """
+    Test format_text_records() for a message exceeding the maximum length.
+    """
+    max_length = 256
+    msg_txt = 'x' * 1000
+    records = format_text_records('CPC1', 'LPAR1', 7, msg_txt, max_length)
+    assert len(records) > 1
+    text = ''
+    for i, record in enumerate(records, 1):
+        assert len(record) + SYSLOG_HEADER_LENGTH <= max_length
+        prefix = f'CPC1 LPAR1 7-{i}/{len(records)}: '
+        assert record.startswith(prefix)
+        text += record[len(prefix):]
+    assert text == msg_txt
+
+
+def test_format_json_record():
+    """
+    Test format_json_record() with a pre-serialized LPAR fragment.
+    """
+    fragment = json_lpar_fragment('CPC1', 'LPAR1', '/api/lpars/1')
+    msg_info = {
+        'sequence-number': 42,
+        'message-id': 'ABC',
+        'timestamp': 1700000000000,
+        'is-priority': True,
+        'is-held': False,
+        'prompt-text': None,
+        'message-text': 'l1\nl2 "q" ä\n',
+    }
+    record = format_json_record(fragment, msg_info, 'l1\nl2 "q" ä')
+
+    assert '\n' not in record
+    assert record.isascii()
+    exp_obj = dict(msg_info)
+    exp_obj['message-text'] = 'l1\nl2 "q" ä'
+    exp_obj.update(
+        {'cpc': 'CPC1', 'lpar': 'LPAR1', 'lpar-uri': '/api/lpars/1'})
+    assert json.loads(record) == exp_obj
+
+
+def test_format_json_record_empty():
+    """
+    Test that format_json_record() returns valid JSON for an empty message.
+    """
+    fragment = json_lpar_fragment('CPC1', 'LPAR1', '/api/lpars/1')
+    record = format_json_record(fragment, {}, '')
+
+    assert json.loads(record) == \
+        {'cpc': 'CPC1', 'lpar': 'LPAR1', 'lpar-uri': '/api/lpars/1'}
+
+
+@pytest.mark.parametrize(
+    "msg_txt, max_length",
+    [
+        ('a' * 500, 200),
+        ('ä"\n' * 200, 200),
+        ('a' * 500, 20),
+    ]
+)
+def test_truncate_json_record(msg_txt, max_length):
+    """
+    Test that truncate_json_record() truncates the message text of oversize
+    records to the maximum length and keeps the record valid JSON.
+    """
+    fragment = json_lpar_fragment('CPC1', 'LPAR1', '/api/lpars/1')
+    msg_info = {'sequence-number': 42, 'message-text': msg_txt}
+    record = format_json_record(fragment, msg_info, msg_txt)
+    assert truncate_json_record(record, len(record)) == record
+
+    truncated = truncate_json_record(record, max_length)
+
+    obj = json.loads(truncated)
+    assert obj['truncated'] is True
+    assert msg_txt.startswith(obj['message-text'])
+    assert obj['sequence-number'] == 42
+    if obj['message-text']:
+        assert len(truncated) <= max_length
+        next_len = len(obj['message-text']) + 1
+        obj['message-text'] = msg_txt[:next_len]
+        assert len(json.dumps(obj, separators=(',', ':'))) > max_length
+
+
+def test_syslog_header():
+    """
+    Test syslog_header() for the supported header types.
+    """
+    msg_time = 1700000000.123  # 2023-11-14 22:13:20.123 UTC
+    assert syslog_header('none', msg_time, 'LPAR1') == ''
+    assert syslog_header('rfc5424', msg_time, 'LPAR1') == \
+        '1 2023-11-14T22:13:20.123Z LPAR1 zhmc_os_forwarder - - - '
+    assert syslog_header('rfc3164', msg_time, 'LPAR1') == \
+        'Nov 14 22:13:20 LPAR1 zhmc_os_forwarder: '
+
+
+def test_message_time():
+    """
+    Test message_time().
+    """
+    assert message_time({'timestamp': 1700000000123}) == 1700000000.123
+    assert message_time({'timestamp': -1}) is None
+    assert message_time({}) is None
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the forwarded_lpars module.
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from zhmc_os_forwarder.forwarded_lpars import ForwardedLpars, \
+    ForwardedLparInfo
+
+CONFIG_DATA = {
+    'hmc': {'host': 'hmc1', 'userid': 'user', 'password': 'password'},
+    'forwarding': [
+        {
+            'syslogs': [{'host': 'syslog1'}],
+            'cpcs': [{'cpc': 'CPC1', 'partitions': [{'partition': '.*'}]}],
+        },
+    ],
+}
+
+
+def fake_lpar(index):
+    """Return a stand-in for a zhmcclient.Lpar on CPC1"""
+    cpc = SimpleNamespace(name='CPC1', uri='/api/cpcs/1')
+    manager = SimpleNamespace(
+        parent=cpc,
+        resource_object=lambda uri, props: SimpleNamespace(uri=uri, **props))
+    return SimpleNamespace(
+        name=f'LPAR{index}', uri=f'/api/logical-partitions/{index}',
+        manager=manager)
+
+
+def test_add_if_matching_shards():
+    """
+    Test that each LPAR is added in exactly one of multiple shards.
+    """
+    lpars = [fake_lpar(i) for i in range(50)]
+    added_uris = []
+    for index in range(3):
+        forwarded_lpars = ForwardedLpars(
+            None, CONFIG_DATA, 'config.yaml', shard=(index, 3))
+        for lpar in lpars:
+            forwarded_lpars.add_if_matching(lpar)
+        assert forwarded_lpars.forwarded_lpar_infos
+        added_uris.extend(forwarded_lpars.forwarded_lpar_infos)
+    assert sorted(added_uris) == sorted(lpar.uri for lpar in lpars)
+
+
+def test_forwarded_lpar_info_compact():
+    """
+    Test that a ForwardedLparInfo keeps the names and URIs of the LPAR instead
+    of its resource object, and creates a resource object on demand.
+    """
+    lpar_info = ForwardedLparInfo(fake_lpar(1))
+    assert lpar_info.name == 'LPAR1'
+    assert lpar_info.uri == '/api/logical-partitions/1'
+    assert lpar_info.cpc_name == 'CPC1'
+    assert lpar_info.cpc_uri == '/api/cpcs/1'
+    assert not hasattr(lpar_info, '__dict__')
+    with pytest.raises(AttributeError):
+        lpar_info.foo = 1  # pylint: disable=assigning-non-slot
+    lpar = lpar_info.lpar
+    assert lpar.uri == '/api/logical-partitions/1'
+    assert lpar.name == 'LPAR1'
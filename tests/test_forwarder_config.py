@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the forwarder_config module.
+"""
+
+import sys
+
+import pytest
+
+from zhmc_os_forwarder.forwarder_config import ForwarderConfig
+from zhmc_os_forwarder.utils import ImproperExit
+
+
+def config_data(*file_items):
+    """
+    Return forwarder config data with one forwarding definition for each
+    file destination.
+    """
+    return {
+        'hmc': {'host': 'hmc1', 'userid': 'user', 'password': 'password'},
+        'forwarding': [
+            {
+                'files': [file_item],
+                'cpcs': [{'cpc': f'CPC{i}',
+                          'partitions': [{'partition': '.*'}]}],
+            }
+            for i, file_item in enumerate(file_items)
+        ],
+    }
+
+
+def test_config_shared_directory():
+    """
+    Test that file destinations with the same directory in multiple
+    forwarding definitions share a single file destination.
+    """
+    config = ForwarderConfig(
+        config_data({'directory': 'logs'}, {'directory': './logs/'},
+                    {'directory': 'other'}),
+        '/etc/fwd/config.yaml')
+    files = [cpc_info.lpar_infos[0].files[0]
+             for cpc_info in config.config_cpc_infos]
+    assert files[0] is files[1]
+    assert files[0] is not files[2]
+
+
+def test_config_shared_directory_conflict():
+    """
+    Test that file destinations with the same directory and different
+    properties are rejected.
+    """
+    with pytest.raises(ImproperExit, match='different properties'):
+        ForwarderConfig(
+            config_data({'directory': 'logs', 'per': 'lpar'},
+                        {'directory': 'logs', 'per': 'cpc'}),
+            '/etc/fwd/config.yaml')
+
+
+def test_config_zstd_missing(monkeypatch):
+    """
+    Test that zstd compression without the zstandard package is rejected
+    when the forwarder config is loaded.
+    """
+    monkeypatch.setitem(sys.modules, 'zstandard', None)
+    with pytest.raises(ImproperExit, match='zstandard'):
+        ForwarderConfig(
+            config_data({'directory': 'logs', 'compression': 'zstd'}),
+            '/etc/fwd/config.yaml')
+
+
+def test_config_syslog_header_default():
+    """
+    Test that syslog servers default to no syslog header, as in earlier
+    versions, and that a header can be specified.
+    """
+    data = config_data()
+    data['forwarding'] = [{
+        'syslogs': [{'host': 'syslog1'},
+                    {'host': 'syslog2', 'header': 'rfc5424'}],
+        'cpcs': [{'cpc': 'CPC1', 'partitions': [{'partition': '.*'}]}],
+    }]
+    config = ForwarderConfig(data, '/etc/fwd/config.yaml')
+    syslogs = config.config_cpc_infos[0].lpar_infos[0].syslogs
+    assert [s.header for s in syslogs] == ['none', 'rfc5424']
+
+
+def test_config_ha_intervals():
+    """
+    Test that a checkpoint interval that is not less than the lease time is
+    rejected.
+    """
+    data = config_data({'directory': 'logs'})
+    data['ha'] = {'lease_file': 'lease', 'lease_time': 5,
+                  'checkpoint_interval': 5}
+    with pytest.raises(ImproperExit, match='checkpoint interval'):
+        ForwarderConfig(data, '/etc/fwd/config.yaml')
+    data['ha']['checkpoint_interval'] = 2
+    ForwarderConfig(data, '/etc/fwd/config.yaml')
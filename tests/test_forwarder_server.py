@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the forwarder_server module, without an HMC.
+"""
+
+import time
+from types import SimpleNamespace
+from threading import Thread, Event
+
+import pytest
+
+from zhmc_os_forwarder import ha, utils
+from zhmc_os_forwarder.forwarder_server import ForwarderServer, \
+    CHANNEL_RETRY_TIME
+from zhmc_os_forwarder.forwarded_lpars import ForwardedLparInfo, \
+    ForwardedLpars
+from zhmc_os_forwarder.ha import Lease, Checkpoint
+from zhmc_os_forwarder.backfill import Backfiller
+
+from .fake_lpar import FakeLpar
+
+
+class FakeCpc:
+    """
+    Stand-in for a zhmcclient.Cpc in classic mode with LPARs.
+    """
+
+    def __init__(self, name, lpar_names):
+        self.name = name
+        self.uri = f'/api/cpcs/{name}'
+        self.lpars = SimpleNamespace(
+            list=lambda: [self.lpar(n) for n in lpar_names],
+            resource_object=lambda uri, props: self.lpar(props['name']))
+
+    def lpar(self, name):
+        """Return an LPAR of the CPC"""
+        return FakeLpar(range(0, 10), name, cpc=self)
+
+    @staticmethod
+    def prop(name):
+        """Return a property of the CPC"""
+        assert name == 'dpm-enabled'
+        return False
+
+    def pull_full_properties(self):
+        """Retrieve the properties of the CPC"""
+
+
+class FakeReceiver:
+    """
+    Stand-in for a NotificationReceiver, recording the topics that are added
+    and removed.
+    """
+
+    def __init__(self):
+        self.subscribed = []
+        self.unsubscribed = []
+
+    def add_topic(self, topic):
+        """Add a topic"""
+        self.subscribed.append(topic)
+
+    def remove_topic(self, topic):
+        """Remove a topic"""
+        self.unsubscribed.append(topic)
+
+
+@pytest.fixture(autouse=True)
+def fixture_quiet(monkeypatch):
+    """Suppress printing of the log messages and avoid waiting when
+    acquiring leases."""
+    monkeypatch.setattr(utils, 'VERBOSE_LEVEL', 0)
+    monkeypatch.setattr(ha, 'LEASE_SETTLE_TIME', 0)
+
+
+def forwarder_server(forwarding=None):
+    """Return a ForwarderServer that has not been started"""
+    config_data = {
+        'hmc': {'host': 'hmc1', 'userid': 'user', 'password': 'password'},
+        'forwarding': forwarding or [],
+    }
+    return ForwarderServer(config_data, '/etc/fwd/config.yaml')
+
+
+def subscribing_server(receiver, forwarding=None):
+    """Return a ForwarderServer that subscribes for the notifications of
+    the LPARs using a notification receiver"""
+    server = forwarder_server(forwarding)
+    server.receivers = [receiver]
+    server.num_subscriptions = 0
+    server.backfiller = Backfiller(
+        lambda *args: True, server.stop_event, server.metrics)
+    return server
+
+
+def inventory_server(receiver, directory):
+    """Return a ForwarderServer that forwards the LPARs named LPAR* of an
+    HMC with no CPCs yet to files in a directory, and CPC1 and CPC2 with
+    LPARs that can be added to the HMC"""
+    server = subscribing_server(receiver, [{
+        'files': [{'directory': str(directory)}],
+        'cpcs': [{'cpc': 'CPC.*', 'partitions': [{'partition': 'LPAR.*'}]}],
+    }])
+    cpc1 = FakeCpc('CPC1', ['LPAR1', 'LPAR2', 'OTHER'])
+    cpc2 = FakeCpc('CPC2', ['LPAR3'])
+    cpcs = {cpc.uri: cpc for cpc in (cpc1, cpc2)}
+    server.client = SimpleNamespace(
+        cpcs=SimpleNamespace(resource_object=cpcs.get))
+    server.session = SimpleNamespace(
+        get=lambda uri: {'parent': cpc1.uri, 'name': uri.split('/')[-1]})
+    server.all_cpcs = []
+    server.forwarded_lpars = ForwardedLpars(
+        server.session, server.config_data, server.config_filename)
+    return server, cpc1, cpc2
+
+
+def lpar_info(index=1):
+    """Return a ForwardedLparInfo for an LPAR on CPC1"""
+    cpc = SimpleNamespace(name='CPC1', uri='/api/cpcs/1')
+    lpar = SimpleNamespace(
+        name=f'LPAR{index}', uri=f'/api/logical-partitions/{index}',
+        manager=SimpleNamespace(parent=cpc))
+    return ForwardedLparInfo(lpar)
+
+
+def msg(seq_no, priority=False):
+    """Return an OS message with the sequence number"""
+    return {'sequence-number': seq_no, 'message-text': f'msg {seq_no}',
+            'is-priority': priority}
+
+
+def deliver_next(server):
+    """Deliver the next OS message in the delivery queue, like the delivery
+    thread does"""
+    (lpar_info_, msg_info, _), _ = server.delivery_queue.get()
+    server.deliver(lpar_info_, msg_info)
+    # pylint: disable=protected-access
+    server._delivered(lpar_info_, msg_info['sequence-number'])
+    return msg_info['sequence-number']
+
+
+def test_checkpoint_priority(tmp_path):
+    """
+    Test that the checkpoint does not advance beyond routine OS messages
+    that are still in the delivery queue when a priority OS message has been
+    delivered ahead of them, so that a standby forwarder taking over
+    retrieves them.
+    """
+    # pylint: disable=protected-access
+    server = forwarder_server()
+    lpar = lpar_info()
+    server.forwarded_lpars = SimpleNamespace(
+        forwarded_lpar_infos={lpar.uri: lpar})
+    server.checkpoint = Checkpoint(str(tmp_path / 'checkpoint'))
+    server.active = True
+
+    server._enqueue(lpar, msg(10), 0.0)
+    assert deliver_next(server) == 10
+    server._enqueue(lpar, msg(11), 0.0)
+    server._enqueue(lpar, msg(12), 0.0)
+    server._enqueue(lpar, msg(13, priority=True), 0.0)
+    assert deliver_next(server) == 13
+    server.save_checkpoint()
+
+    # A standby forwarder taking over now resumes after this checkpoint
+    assert Checkpoint(server.checkpoint.path).load() == {lpar.uri: 10}
+
+    assert deliver_next(server) == 11
+    server.save_checkpoint()
+    assert server.checkpoint.load() == {lpar.uri: 11}
+    assert deliver_next(server) == 12
+    server._enqueue(lpar, msg(14), 0.0)
+    assert deliver_next(server) == 14
+    server.save_checkpoint()
+    assert server.checkpoint.load() == {lpar.uri: 14}
+    assert not lpar.pending_seq_nos
+    assert not lpar.delivered_early
+
+
+def test_checkpoint_spilled(tmp_path):
+    """
+    Test that the checkpoint does not advance beyond spilled OS messages.
+    """
+    # pylint: disable=protected-access
+    server = forwarder_server()
+    lpar = lpar_info()
+    server.forwarded_lpars = SimpleNamespace(
+        forwarded_lpar_infos={lpar.uri: lpar})
+    server.checkpoint = Checkpoint(str(tmp_path / 'checkpoint'))
+    server.active = True
+
+    server._enqueue(lpar, msg(10), 0.0)
+    lpar.spilled_seq_no = 11
+    server._enqueue(lpar, msg(12, priority=True), 0.0)
+    assert deliver_next(server) == 12
+    assert deliver_next(server) == 10
+    server.save_checkpoint()
+    assert server.checkpoint.load() == {lpar.uri: 10}
+
+
+def test_health():
+    """
+    Test that health() reports the started forwarder threads and delivery
+    thread, whether they are alive and how long they have been busy.
+    """
+    server = forwarder_server()
+    assert not server.health()
+
+    server.threads = [Thread(target=lambda: None, name='forwarder-0')]
+    server.threads[0].start()
+    server.threads[0].join()
+    release = Event()
+    server.delivery_thread = Thread(target=release.wait, name='delivery')
+    server.delivery_thread.start()
+    server.busy_since['delivery'] = time.monotonic() - 10
+    try:
+        health = {h['name']: h for h in server.health()}
+    finally:
+        release.set()
+        server.delivery_thread.join()
+
+    assert health['delivery']['alive'] is True
+    assert health['delivery']['busy_time'] >= 10
+    assert health['forwarder-0']['alive'] is False
+    assert health['forwarder-0']['busy_time'] == 0.0
+
+
+def test_ha_renew_during_activation(tmp_path):
+    """
+    Test that the lease is renewed while the forwarder is being activated,
+    so that a standby forwarder cannot acquire it even when the activation
+    takes longer than the lease time.
+    """
+    path = str(tmp_path / 'lease')
+    server = forwarder_server()
+    server.lease = Lease(path, lease_time=0.3)
+    activated = Event()
+
+    def activate():
+        time.sleep(1.0)
+        activated.set()
+
+    server.activate = activate
+    server._report_startup = lambda: None  # pylint: disable=protected-access
+    server.checkpoint_interval = 0.1
+    server.ha_thread.start()
+    try:
+        time.sleep(0.6)
+        assert Lease(path).acquire() is False
+        assert activated.wait(5)
+        assert Lease(path).acquire() is False
+        assert server.lease_lost is False
+    finally:
+        server.ha_stop_event.set()
+        server.ha_thread.join()
+        server.lease_thread.join()
+
+
+def test_ha_activation_error(tmp_path):
+    """
+    Test that an unexpected error while activating the forwarder releases
+    the lease and sets lease_lost.
+    """
+    path = str(tmp_path / 'lease')
+    server = forwarder_server()
+    server.lease = Lease(path)
+
+    def activate():
+        raise ValueError("activation failed")
+
+    server.activate = activate
+    server._run_ha()  # pylint: disable=protected-access
+
+    assert server.lease_lost is True
+    assert not server.lease_thread.is_alive()
+    assert Lease(path).acquire() is True
+
+
+def test_ha_lease_lost(tmp_path):
+    """
+    Test that losing the lease to another forwarder sets lease_lost and
+    stops saving the checkpoint.
+    """
+    path = str(tmp_path / 'lease')
+    server = forwarder_server()
+    server.lease = Lease(path, lease_time=0.3)
+    server.checkpoint = Checkpoint(str(tmp_path / 'checkpoint'))
+    server.checkpoint_interval = 0.05
+    server.activate = lambda: setattr(server, 'active', True)
+    server._report_startup = lambda: None  # pylint: disable=protected-access
+    server.forwarded_lpars = SimpleNamespace(forwarded_lpar_infos={})
+    server.ha_thread.start()
+    try:
+        deadline = time.monotonic() + 5
+        while not server.active and time.monotonic() < deadline:
+            time.sleep(0.05)
+        other = Lease(path, lease_time=60)
+        other._write()  # pylint: disable=protected-access
+        server.ha_thread.join(5)
+        assert not server.ha_thread.is_alive()
+        assert server.lease_lost is True
+    finally:
+        server.ha_stop_event.set()
+        server.ha_thread.join()
+        server.lease_thread.join()
+
+
+def test_status_changed():
+    """
+    Test that the notifications of an LPAR are unsubscribed when it is
+    deactivated, and subscribed again when it is activated.
+    """
+    receiver = FakeReceiver()
+    server = subscribing_server(receiver)
+    lpar = ForwardedLparInfo(FakeLpar(range(0, 10)))
+
+    server.status_changed(lpar, 'operating')
+    assert lpar.topic == 'os-LPAR1'
+    assert lpar.receiver is receiver
+    assert receiver.subscribed == ['os-LPAR1']
+    assert server.num_subscriptions == 1
+    lpar.next_seq_no = 10
+
+    server.status_changed(lpar, 'not-operating')
+    assert lpar.topic is None
+    assert lpar.receiver is None
+    assert receiver.unsubscribed == ['os-LPAR1']
+    assert server.num_subscriptions == 0
+    # The sequence numbers restart when the OS is started again
+    assert lpar.next_seq_no is None
+
+    server.status_changed(lpar, 'operating')
+    assert lpar.topic == 'os-LPAR1'
+    assert receiver.subscribed == ['os-LPAR1', 'os-LPAR1']
+    assert server.num_subscriptions == 1
+    assert not server.pending_lpars
+    server.backfiller.shutdown()
+
+
+def test_retry_pending_lpars():
+    """
+    Test that opening the OS message channel of an activated LPAR whose OS
+    does not support OS messages yet is retried until it succeeds, or until
+    the retry time has passed.
+    """
+    # pylint: disable=protected-access
+    receiver = FakeReceiver()
+    server = subscribing_server(receiver)
+    lpar1 = ForwardedLparInfo(FakeLpar(range(0, 10), 'LPAR1'))
+    lpar2 = ForwardedLparInfo(FakeLpar(range(0, 10), 'LPAR2'))
+    lpar1.lpar.os_topic = None
+    lpar2.lpar.os_topic = None
+
+    server.status_changed(lpar1, 'operating')
+    server.status_changed(lpar2, 'operating')
+    assert set(server.pending_lpars) == {lpar1.uri, lpar2.uri}
+    assert lpar1.topic is None
+    assert not receiver.subscribed
+
+    server._retry_pending_lpars()
+    assert set(server.pending_lpars) == {lpar1.uri, lpar2.uri}
+
+    lpar1.lpar.os_topic = 'os-LPAR1'
+    lpar2_activate_time = time.monotonic() - CHANNEL_RETRY_TIME
+    server.pending_lpars[lpar2.uri] = (lpar2, lpar2_activate_time)
+    server._retry_pending_lpars()
+    assert not server.pending_lpars
+    assert lpar1.topic == 'os-LPAR1'
+    assert lpar2.topic is None
+    assert receiver.subscribed == ['os-LPAR1']
+
+    # A deactivated LPAR is no longer retried
+    server.status_changed(lpar2, 'operating')
+    assert lpar2.uri in server.pending_lpars
+    server.status_changed(lpar2, 'not-operating')
+    assert not server.pending_lpars
+    server.backfiller.shutdown()
+
+
+def test_inventory_changed(tmp_path):
+    """
+    Test that the matching LPARs of CPCs and LPARs added to the HMC are
+    forwarded, and that forwarding of LPARs and of the LPARs of CPCs removed
+    from the HMC stops.
+    """
+    receiver = FakeReceiver()
+    server, cpc1, cpc2 = inventory_server(receiver, tmp_path)
+    lpar_infos = server.forwarded_lpars.forwarded_lpar_infos
+
+    server.inventory_changed('add', 'cpc', cpc1.uri)
+    server.inventory_changed('add', 'cpc', cpc2.uri)
+    server.inventory_changed('add', 'cpc', cpc1.uri)
+    assert sorted(lpar_infos) == [
+        '/api/logical-partitions/LPAR1', '/api/logical-partitions/LPAR2',
+        '/api/logical-partitions/LPAR3']
+    assert sorted(receiver.subscribed) == ['os-LPAR1', 'os-LPAR2', 'os-LPAR3']
+    assert server.num_subscriptions == 3
+    assert all(lpar_info.lag_histogram is not None
+               for lpar_info in lpar_infos.values())
+
+    server.inventory_changed(
+        'add', 'logical-partition', '/api/logical-partitions/LPAR4')
+    server.inventory_changed(
+        'add', 'logical-partition', '/api/logical-partitions/OTHER2')
+    assert '/api/logical-partitions/LPAR4' in lpar_infos
+    assert '/api/logical-partitions/OTHER2' not in lpar_infos
+    assert server.num_subscriptions == 4
+
+    lpar1 = lpar_infos['/api/logical-partitions/LPAR1']
+    server.inventory_changed(
+        'remove', 'logical-partition', '/api/logical-partitions/LPAR1')
+    assert '/api/logical-partitions/LPAR1' not in lpar_infos
+    assert receiver.unsubscribed == ['os-LPAR1']
+    assert lpar1.lag_histogram is None
+
+    server.inventory_changed('remove', 'cpc', cpc1.uri)
+    assert list(lpar_infos) == ['/api/logical-partitions/LPAR3']
+    assert sorted(receiver.unsubscribed) == [
+        'os-LPAR1', 'os-LPAR2', 'os-LPAR4']
+    assert server.num_subscriptions == 1
+    assert server.all_cpcs == [cpc2]
+
+    server.backfiller.shutdown()
+    for sink in server.file_sinks:
+        sink.close()
+
+
+def test_remove_lpar_files(tmp_path):
+    """
+    Test that the file of a removed LPAR is closed after its OS messages
+    that were waiting for delivery have been written, and that OS messages
+    put into the delivery queue after that are not written.
+    """
+    server, cpc1, _ = inventory_server(FakeReceiver(), tmp_path)
+    lpar_uri = '/api/logical-partitions/LPAR1'
+    server.inventory_changed('add', 'cpc', cpc1.uri)
+    lpar = server.forwarded_lpars.forwarded_lpar_infos[lpar_uri]
+    sink = lpar.files[0].sink
+
+    # pylint: disable=protected-access
+    server._enqueue(lpar, msg(1), 0.0)
+    assert deliver_next(server) == 1
+    server._enqueue(lpar, msg(2), 0.0)
+    server.inventory_changed('remove', 'logical-partition', lpar_uri)
+    assert sink._files
+    server._enqueue(lpar, msg(3), 0.0)
+    server.delivery_queue.close()
+    server.run_delivery()
+
+    assert not sink._files
+    with open(tmp_path / 'CPC1_LPAR1.log', encoding='utf-8') as fp:
+        records = fp.read().splitlines()
+    assert [r.split()[-1] for r in records] == ['1', '2']
+    assert lpar.pending_seq_nos == []
+    server.backfiller.shutdown()
+    sink.close()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the ha module.
+"""
+
+import time
+
+import pytest
+
+from zhmc_os_forwarder import ha
+from zhmc_os_forwarder.ha import Lease, Checkpoint
+
+
+@pytest.fixture(autouse=True)
+def no_settle_time(monkeypatch):
+    """Avoid waiting when acquiring leases"""
+    monkeypatch.setattr(ha, 'LEASE_SETTLE_TIME', 0)
+
+
+def test_lease_acquire_release(tmp_path):
+    """
+    Test that only one of two forwarders holds the lease, and that the other
+    one can acquire it after it has been released.
+    """
+    path = str(tmp_path / 'lease')
+    lease1 = Lease(path)
+    lease2 = Lease(path)
+    assert lease1.acquire() is True
+    assert lease2.acquire() is False
+    assert lease1.renew() is True
+    assert lease2.current_holder() == lease1.holder
+
+    lease1.release()
+    assert lease2.current_holder() is None
+    assert lease2.acquire() is True
+    assert lease1.renew() is False
+
+
+def test_lease_expired(tmp_path):
+    """
+    Test that an expired lease can be acquired by another forwarder.
+    """
+    path = str(tmp_path / 'lease')
+    lease1 = Lease(path, lease_time=0.1)
+    lease2 = Lease(path)
+    assert lease1.acquire() is True
+    time.sleep(0.2)
+    assert lease2.acquire() is True
+    assert lease1.renew() is False
+
+
+def test_checkpoint(tmp_path):
+    """
+    Test saving and loading a checkpoint.
+    """
+    path = tmp_path / 'checkpoint'
+    checkpoint = Checkpoint(str(path))
+    assert checkpoint.load() == {}
+    checkpoint.save({'/api/logical-partitions/1': 42})
+    assert Checkpoint(str(path)).load() == {'/api/logical-partitions/1': 42}
+
+    path.write_text('{invalid')
+    assert Checkpoint(str(path)).load() == {}
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the HttpSink class, using a local stand-in HTTP server.
+"""
+
+import gzip
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from zhmc_os_forwarder import utils
+from zhmc_os_forwarder.error_aggregator import ErrorAggregator
+from zhmc_os_forwarder.http_sink import HttpSink
+from zhmc_os_forwarder.metrics import MetricsRegistry
+
+
+class _IngestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the stand-in HTTP ingest server.
+    """
+    protocol_version = 'HTTP/1.1'  # Enables keep-alive
+
+    def do_POST(self):
+        # pylint: disable=invalid-name
+        """Handle a POST request"""
+        server = self.server
+        length = int(self.headers['Content-Length'])
+        body = self.rfile.read(length)
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        with server.lock:
+            server.connections.add(self.client_address)
+            if server.fail_count > 0:
+                server.fail_count -= 1
+                status = 503
+            else:
+                server.bodies.append(body)
+                status = 200
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # pylint: disable=redefined-builtin
+        """Suppress logging of requests"""
+
+
+@pytest.fixture(name='ingest_server')
+def fixture_ingest_server():
+    """
+    Fixture for a stand-in HTTP ingest server on a free local port.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _IngestHandler)
+    server.lock = threading.Lock()
+    server.bodies = []
+    server.connections = set()
+    server.fail_count = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _url(server):
+    return f'http://127.0.0.1:{server.server_address[1]}/bulk'
+
+
+def _records(server):
+    lines = []
+    for body in server.bodies:
+        lines.extend(body.decode('utf-8').splitlines())
+    return [json.loads(line) for line in lines]
+
+
+@pytest.mark.parametrize("compression", ['none', 'gzip'])
+def test_http_sink_batches(ingest_server, compression):
+    """
+    Test that records are sent in batches by count over one connection.
+    """
+    sink = HttpSink(_url(ingest_server), batch_max_count=10,
+                    batch_max_delay=60, compression=compression)
+    exp_records = [{'seq': i} for i in range(25)]
+    for record in exp_records:
+        sink.write([json.dumps(record)])
+    sink.close()
+
+    assert _records(ingest_server) == exp_records
+    assert len(ingest_server.bodies) == 3
+    assert len(ingest_server.connections) == 1
+    assert sink.sent_records == 25
+
+
+def test_http_sink_max_delay(ingest_server):
+    """
+    Test that a partial batch is sent after the maximum delay.
+    """
+    sink = HttpSink(_url(ingest_server), batch_max_count=1000,
+                    batch_max_delay=0.1)
+    sink.write([json.dumps({'seq': 1})])
+    for _ in range(50):
+        if ingest_server.bodies:
+            break
+        threading.Event().wait(0.1)
+    assert _records(ingest_server) == [{'seq': 1}]
+    sink.close()
+
+
+def test_http_sink_retry(ingest_server):
+    """
+    Test that a batch is retried when the server returns a retryable status.
+    """
+    ingest_server.fail_count = 2
+    sink = HttpSink(_url(ingest_server), batch_max_count=1,
+                    retry_backoff=0.01)
+    sink.write([json.dumps({'seq': 1})])
+    for _ in range(50):
+        if ingest_server.bodies:
+            break
+        threading.Event().wait(0.1)
+    sink.close()
+
+    assert _records(ingest_server) == [{'seq': 1}]
+    assert sink.failed_requests == 2
+    assert sink.dropped_records == 0
+
+
+def test_http_sink_errors(ingest_server, capsys, monkeypatch):
+    """
+    Test that the OS messages of dropped batches are reported to the error
+    aggregator, and that failed requests and dropped records are counted.
+    """
+    monkeypatch.setattr(utils, 'VERBOSE_LEVEL', 0)
+    ingest_server.fail_count = 100
+    metrics = MetricsRegistry()
+    agg = ErrorAggregator(metrics)
+    sink = HttpSink(_url(ingest_server), batch_max_count=2,
+                    batch_max_delay=60, max_retries=1, retry_backoff=0.01,
+                    error_aggregator=agg, metrics=metrics)
+    for seq_no in range(1, 5):
+        sink.write([json.dumps({'seq': seq_no})], seq_no)
+    for _ in range(50):
+        if sink.dropped_records == 4:
+            break
+        threading.Event().wait(0.1)
+    sink.close()
+
+    assert sink.dropped_records == 4
+    assert sink.failed_requests == 4
+    # Only the first error of a kind is logged
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1
+    assert "Cannot send 2 OS messages (seq_no 1 to 2) to HTTP server" \
+        in lines[0]
+    assert "HTTP status 503" in lines[0]
+    values = {m.name: m.value for m in metrics.metrics()}
+    assert values == {
+        'zhmc_os_forwarder_delivery_errors_total': 4,
+        'zhmc_os_forwarder_http_failed_requests_total': 4,
+        'zhmc_os_forwarder_http_dropped_records_total': 4,
+    }
+    errors = [m.labels for m in metrics.metrics()
+              if m.name == 'zhmc_os_forwarder_delivery_errors_total']
+    assert errors == [{'destination': f'HTTP server {_url(ingest_server)}',
+                       'error': 'HttpStatusError'}]
+
+
+def test_http_sink_verify_cert(tmp_path):
+    """
+    Test that a CA certificate directory and a CA certificate file are
+    passed to the connection pool as such.
+    """
+    ca_file = tmp_path / 'ca.pem'
+    ca_file.write_text('')
+    for verify_cert, exp_kwargs in [
+            (str(tmp_path), {'ca_cert_dir': str(tmp_path)}),
+            (str(ca_file), {'ca_certs': str(ca_file)})]:
+        sink = HttpSink('https://127.0.0.1/bulk', verify_cert=verify_cert)
+        # pylint: disable=protected-access
+        pool_kw = sink._pool.connection_pool_kw
+        sink.close()
+        assert pool_kw['cert_reqs'] == 'CERT_REQUIRED'
+        assert {k: pool_kw.get(k) for k in exp_kwargs} == exp_kwargs
+        assert set(pool_kw) & {'ca_certs', 'ca_cert_dir'} == set(exp_kwargs)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the metrics module.
+"""
+
+import math
+import urllib.request
+
+from zhmc_os_forwarder.metrics import MetricsRegistry, bucket_quantile, \
+    start_metrics_server
+
+
+def test_histogram_observe():
+    """
+    Test observing values in a histogram.
+    """
+    registry = MetricsRegistry()
+    hist = registry.histogram('lag', 'Lag', buckets=(1.0, 10.0),
+                              labels={'lpar': 'LPAR1'})
+    for value in (0.5, 1.0, 5.0, 20.0):
+        hist.observe(value)
+
+    assert hist.counts == [2, 1, 1]
+    assert hist.count == 4
+    assert hist.sum == 26.5
+    assert hist.max == 20.0
+    assert registry.histogram('lag', 'Lag', labels={'lpar': 'LPAR1'}) is hist
+
+
+def test_bucket_quantile():
+    """
+    Test bucket_quantile().
+    """
+    buckets = [1.0, 10.0]
+    assert bucket_quantile(buckets, [0, 0, 0], 0.5) is None
+    assert bucket_quantile(buckets, [9, 1, 0], 0.5) == 1.0
+    assert bucket_quantile(buckets, [9, 1, 0], 0.99) == 10.0
+    assert bucket_quantile(buckets, [0, 0, 3], 0.5) == math.inf
+
+
+def test_prometheus_text():
+    """
+    Test the Prometheus text format of counters and histograms.
+    """
+    registry = MetricsRegistry()
+    registry.counter('msgs_total', 'Messages', labels={'lpar': 'L1'}).inc(3)
+    hist = registry.histogram('lag', 'Lag', buckets=(1.0,))
+    hist.observe(0.5)
+    hist.observe(2.0)
+
+    lines = registry.prometheus_text().splitlines()
+
+    assert '# TYPE msgs_total counter' in lines
+    assert 'msgs_total{lpar="L1"} 3' in lines
+    assert '# TYPE lag histogram' in lines
+    assert 'lag_bucket{le="1.0"} 1' in lines
+    assert 'lag_bucket{le="+Inf"} 2' in lines
+    assert 'lag_sum 2.5' in lines
+    assert 'lag_count 2' in lines
+
+
+def test_metrics_server():
+    """
+    Test that the metrics server exposes the metrics.
+    """
+    registry = MetricsRegistry()
+    registry.counter('msgs_total', 'Messages').inc()
+    server = start_metrics_server(registry, 0, host='127.0.0.1')
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(
+                f'http://127.0.0.1:{port}/metrics') as resp:
+            body = resp.read().decode('utf-8')
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert 'msgs_total 1' in body.splitlines()
+
+
+def test_registry_load_snapshots():
+    """
+    Test aggregating the snapshots of multiple registries.
+    """
+    snapshots = []
+    for value in (1.0, 100.0):
+        registry = MetricsRegistry()
+        registry.counter('c_total', 'C').inc(2)
+        registry.histogram('h_seconds', 'H', buckets=(10.0,)).observe(value)
+        snapshots.append(registry.snapshot())
+
+    aggregated = MetricsRegistry()
+    aggregated.load_snapshots(snapshots)
+    counter = aggregated.counter('c_total', 'C')
+    hist = aggregated.histogram('h_seconds', 'H', buckets=(10.0,))
+    assert counter.value == 4
+    assert hist.counts == [1, 1]
+    assert hist.count == 2
+    assert hist.sum == 101.0
+    assert hist.max == 100.0
+    assert len(aggregated.metrics()) == 2
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the notification_receiver module, without an HMC.
+"""
+
+from types import SimpleNamespace
+from threading import RLock
+
+import pytest
+import zhmcclient
+
+from zhmc_os_forwarder.notification_receiver import NotificationReceiver
+
+
+class FakeConnection:
+    """
+    Stand-in for a STOMP connection, recording the topics subscribed for.
+    """
+
+    def __init__(self):
+        self.connected = True
+        self.subscriptions = {}  # Topic by subscription ID
+
+    def is_connected(self):
+        """Return whether the connection is connected"""
+        return self.connected
+
+    def subscribe(self, destination, id, ack):
+        """Subscribe for a destination"""
+        # pylint: disable=redefined-builtin,unused-argument
+        self.subscriptions[id] = destination.replace('/topic/', '')
+
+    def unsubscribe(self, id):
+        """Unsubscribe a subscription"""
+        # pylint: disable=redefined-builtin
+        del self.subscriptions[id]
+
+    def topics(self):
+        """Return the subscribed topics, in subscription order"""
+        return list(self.subscriptions.values())
+
+
+@pytest.fixture(name='hmc')
+def fixture_hmc(monkeypatch):
+    """
+    Replace connecting to the HMC with creating a FakeConnection. Returns a
+    namespace with the list of connections created, and a function called
+    while connecting, if set.
+    """
+    hmc = SimpleNamespace(connections=[], during_connect=None)
+
+    def connect(receiver):
+        conn = FakeConnection()
+        receiver._conn = conn  # pylint: disable=protected-access
+        hmc.connections.append(conn)
+        if hmc.during_connect:
+            hmc.during_connect()
+
+    monkeypatch.setattr(zhmcclient.NotificationReceiver, 'connect', connect)
+    return hmc
+
+
+def test_receiver_not_connected(hmc):
+    """
+    Test that topics added and removed before the notification receiver
+    connects are subscribed for when it connects.
+    """
+    receiver = NotificationReceiver(['t0'], 'hmc1', 'user', 'pw', RLock())
+    receiver.add_topic('t1')
+    receiver.add_topic('t2')
+    receiver.add_topic('t1')
+    receiver.remove_topic('t2')
+    receiver.remove_topic('t3')
+    assert not hmc.connections
+
+    receiver.connect()
+    assert hmc.connections[0].topics() == ['t0', 't1']
+
+
+def test_receiver_connected(hmc):
+    """
+    Test that topics added and removed while the notification receiver is
+    connected are subscribed for and unsubscribed directly, and that all
+    topics are subscribed for again when it reconnects.
+    """
+    receiver = NotificationReceiver(['t0'], 'hmc1', 'user', 'pw', RLock())
+    receiver.connect()
+    receiver.add_topic('t1')
+    receiver.add_topic('t2')
+    receiver.remove_topic('t0')
+    assert hmc.connections[0].topics() == ['t1', 't2']
+
+    hmc.connections[0].connected = False
+    receiver.add_topic('t3')
+    receiver.connect()
+    assert hmc.connections[1].topics() == ['t1', 't2', 't3']
+
+
+def test_receiver_add_while_connecting(hmc):
+    """
+    Test that a topic added while the notification receiver connects is
+    subscribed for exactly once.
+    """
+    receiver = NotificationReceiver(['t0'], 'hmc1', 'user', 'pw', RLock())
+    hmc.during_connect = lambda: receiver.add_topic('t1')
+    receiver.connect()
+    assert hmc.connections[0].topics() == ['t0', 't1']
@@ -18,9 +18,11 @@
 Unit tests for the parse_args() function.
 """
 
+import pytest
+
 from zhmc_os_forwarder.zhmc_os_forwarder import parse_args
 from zhmc_os_forwarder.utils import DEFAULT_CONFIG_FILE, \
-    DEFAULT_SYSLOG_FACILITY
+    DEFAULT_SYSLOG_FACILITY, DEFAULT_NUM_RECEIVERS, DEFAULT_NUM_WORKERS
 
 
 def test_parse_args_full():
@@ -50,3 +52,42 @@ def test_parse_args_min():
     assert args.log_dest is None
     assert args.log_complevels is None  # default set later
     assert args.syslog_facility == DEFAULT_SYSLOG_FACILITY
+
+
+def test_parse_args_receivers():
+    """
+    Test the --receivers option.
+    """
+    assert parse_args([]).receivers == DEFAULT_NUM_RECEIVERS
+    assert parse_args(["--receivers", "4"]).receivers == 4
+
+
+def test_parse_args_workers():
+    """
+    Test the --workers option.
+    """
+    assert parse_args([]).workers == DEFAULT_NUM_WORKERS
+    assert parse_args(["--workers", "4"]).workers == 4
+
+
+def test_parse_args_shard():
+    """
+    Test the --shard option.
+    """
+    assert parse_args([]).shard is None
+    assert parse_args(["--shard", "1/3"]).shard == (1, 3)
+    for value in ("3/3", "x", "1/0"):
+        with pytest.raises(SystemExit):
+            parse_args(["--shard", value])
+
+
+def test_parse_args_check_config():
+    """
+    Test the --check-config and --schema-cache options.
+    """
+    args = parse_args([])
+    assert args.check_config is False
+    assert args.schema_cache is None
+    args = parse_args(["--check-config", "--schema-cache", "/tmp/cache"])
+    assert args.check_config is True
+    assert args.schema_cache == "/tmp/cache"
@@ -26,7 +26,9 @@ import hashlib
 
 import pytest
 
-from zhmc_os_forwarder.utils import parse_yaml_file, ImproperExit
+from zhmc_os_forwarder import utils
+from zhmc_os_forwarder.utils import parse_yaml_file, schema_validator, \
+    ImproperExit
 
 
 def test_parse_yaml_file_simple():
@@ -113,3 +115,46 @@ def test_parse_yaml_file_notfound():
                    hexdigest())
     with pytest.raises(ImproperExit):
         parse_yaml_file(filename, 'test file')
+
+
+def test_parse_yaml_file_schema_cache(tmp_path, monkeypatch):
+    """
+    Tests validation against the JSON schema, with the parsed JSON schema
+    cached in a directory.
+    """
+    cache_dir = tmp_path / 'cache'
+    monkeypatch.setattr(utils, 'SCHEMA_CACHE_DIR', str(cache_dir))
+    filename = tmp_path / 'config.yaml'
+    filename.write_text("""
+hmc:
+  host: 10.11.12.13
+  userid: "myuser"
+  password: "mypassword"
+forwarding:
+  - syslogs:
+     - host: 10.11.12.14
+    cpcs:
+      - cpc: MYCPC
+        partitions:
+          - partition: ".*"
+""", encoding='utf-8')
+
+    schema_validator.cache_clear()
+    result = parse_yaml_file(
+        str(filename), 'test file', 'config_schema.yaml')
+    assert result['hmc']['host'] == '10.11.12.13'
+    cache_files = list(cache_dir.iterdir())
+    assert len(cache_files) == 1
+    assert cache_files[0].name.startswith('config_schema.yaml.')
+
+    # The validator is created once, from the cached schema
+    schema_validator.cache_clear()
+    validator = schema_validator('config_schema.yaml')
+    assert schema_validator('config_schema.yaml') is validator
+    assert list(cache_dir.iterdir()) == cache_files
+
+    filename.write_text("hmc: {}\nforwarding: []\n", encoding='utf-8')
+    with pytest.raises(ImproperExit) as exc_info:
+        parse_yaml_file(str(filename), 'test file', 'config_schema.yaml')
+    assert "Validation of test file" in str(exc_info.value)
+    schema_validator.cache_clear()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the profiler module.
+"""
+
+import os
+import time
+import threading
+import tracemalloc
+
+from zhmc_os_forwarder import utils
+from zhmc_os_forwarder.profiler import Profiler
+
+
+def _busy_function(stop_event, data):
+    """
+    A function that keeps a thread busy and allocates memory.
+    """
+    while not stop_event.is_set():
+        data.append(b'x' * 1000)
+        time.sleep(0.001)
+
+
+def test_profiler(tmp_path, monkeypatch):
+    """
+    Test that a profiler toggled with request_toggle() and check() samples
+    the stacks of other threads and writes its results.
+    """
+    monkeypatch.setattr(utils, 'VERBOSE_LEVEL', 0)
+    profiler = Profiler(str(tmp_path / 'profile'), interval=0.001)
+    profiler.check()
+    assert not profiler.active
+
+    profiler.request_toggle()
+    profiler.check()
+    assert profiler.active
+    assert tracemalloc.is_tracing()
+
+    stop_event = threading.Event()
+    thread = threading.Thread(target=_busy_function,
+                              args=(stop_event, []), name='busy')
+    thread.start()
+    time.sleep(0.2)
+    stop_event.set()
+    thread.join()
+
+    profiler.request_toggle()
+    profiler.check()
+    assert not profiler.active
+    assert not tracemalloc.is_tracing()
+
+    filenames = sorted(os.listdir(tmp_path / 'profile'))
+    assert [fn.split('.', 1)[1] for fn in filenames] == \
+        ['memory.txt', 'stacks.txt', 'top.txt', 'tracemalloc']
+    prefix = str(tmp_path / 'profile' / filenames[0].split('.', 1)[0])
+    with open(prefix + '.stacks.txt', encoding='utf-8') as fp:
+        stacks = fp.read().splitlines()
+    busy_stacks = [s for s in stacks if s.startswith('busy;')]
+    assert busy_stacks
+    assert all('_busy_function (test_profiler.py:' in s
+               for s in busy_stacks)
+    with open(prefix + '.top.txt', encoding='utf-8') as fp:
+        assert '_busy_function' in fp.read()
+    with open(prefix + '.memory.txt', encoding='utf-8') as fp:
+        assert 'test_profiler.py' in fp.read()
+
+    # Stopping an inactive profiler writes nothing
+    assert profiler.stop() == []
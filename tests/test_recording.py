@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the recording module, and for replaying recordings with the
+forwarder server.
+"""
+
+import os
+import threading
+from types import SimpleNamespace
+
+from zhmc_os_forwarder import utils
+from zhmc_os_forwarder.recording import Recorder, read_recording, \
+    RECORDING_VERSION
+from zhmc_os_forwarder.forwarder_server import ForwarderServer
+
+LPAR_URI = '/api/logical-partitions/1'
+
+
+def os_message_notification(seq_nos):
+    """Return headers and message of an OS message notification of LPAR1"""
+    headers = {
+        'notification-type': 'os-message',
+        'object-uri': LPAR_URI,
+        'class': 'logical-partition',
+        'name': 'LPAR1',
+    }
+    message = {'os-messages': [
+        {'sequence-number': seq_no, 'message-text': f'Message {seq_no}\n',
+         'timestamp': 1700000000000}
+        for seq_no in seq_nos
+    ]}
+    return headers, message
+
+
+def test_recorder(tmp_path, monkeypatch):
+    """
+    Test that the recorder writes a start record, an LPAR record before the
+    first notification of a forwarded LPAR, and the notifications, and that
+    read_recording() skips a partially written last line.
+    """
+    monkeypatch.setattr(utils, 'VERBOSE_LEVEL', 0)
+    filename = str(tmp_path / 'recording.jsonl')
+    lpar_info = SimpleNamespace(
+        uri=LPAR_URI, name='LPAR1', cpc_uri='/api/cpcs/1', cpc_name='CPC1')
+    recorder = Recorder(filename, {LPAR_URI: lpar_info})
+    recorder.record(*os_message_notification([1, 2]))
+    recorder.record(*os_message_notification([3]))
+    recorder.record({'notification-type': 'inventory-change',
+                     'object-uri': '/api/cpcs/2'}, {})
+    recorder.close()
+    assert recorder.num_notifications == 3
+    with open(filename, 'a', encoding='utf-8') as fp:
+        fp.write('{"time":')
+
+    records = list(read_recording(filename))
+    assert len(records) == 5
+    assert records[0]['recording'] == RECORDING_VERSION
+    assert records[1] == {'lpar': {
+        'uri': LPAR_URI, 'name': 'LPAR1', 'class': 'logical-partition',
+        'cpc-uri': '/api/cpcs/1', 'cpc-name': 'CPC1'}}
+    assert [r['headers']['notification-type'] for r in records[2:]] == \
+        ['os-message', 'os-message', 'inventory-change']
+    assert records[3]['message'] == os_message_notification([3])[1]
+
+
+def test_recorder_flush(tmp_path):
+    """
+    Test that the recorder buffers the records and flushes them
+    periodically and when it is closed.
+    """
+    filename = str(tmp_path / 'recording.jsonl')
+    recorder = Recorder(filename, {}, flush_interval=60)
+    recorder.record(*os_message_notification([1]))
+    assert os.path.getsize(filename) == 0
+    recorder.close()
+    assert len(list(read_recording(filename))) == 2
+
+    recorder = Recorder(filename, {}, flush_interval=0.05)
+    recorder.record(*os_message_notification([2]))
+    for _ in range(50):
+        if len(list(read_recording(filename))) == 4:
+            break
+        threading.Event().wait(0.1)
+    assert len(list(read_recording(filename))) == 4
+    recorder.close()
+
+
+def test_replay(tmp_path, monkeypatch):
+    """
+    Test that a recording is replayed to the destinations without an HMC,
+    and that a gap in the sequence numbers is counted as missing.
+    """
+    monkeypatch.setattr(utils, 'VERBOSE_LEVEL', 0)
+    filename = str(tmp_path / 'recording.jsonl')
+    lpar_info = SimpleNamespace(
+        uri=LPAR_URI, name='LPAR1', cpc_uri='/api/cpcs/1', cpc_name='CPC1')
+    recorder = Recorder(filename, {LPAR_URI: lpar_info})
+    recorder.record(*os_message_notification([1, 2]))
+    recorder.record({'notification-type': 'status-change',
+                     'object-uri': LPAR_URI}, {})
+    recorder.record(*os_message_notification([5]))
+    recorder.close()
+
+    out_dir = tmp_path / 'out'
+    config_data = {
+        'hmc': {'host': 'hmc1', 'userid': 'user', 'password': 'password'},
+        'forwarding': [{
+            'files': [{'directory': str(out_dir), 'per': 'lpar'}],
+            'cpcs': [{'cpc': 'CPC1', 'partitions': [{'partition': '.*'}]}],
+        }],
+    }
+    server = ForwarderServer(config_data, str(tmp_path / 'config.yaml'),
+                             stats_interval=0)
+    server.startup_replay()
+    result = server.replay(filename, speed=0)
+    server.shutdown()
+
+    assert result['notifications'] == 2
+    assert result['messages'] == 3
+    assert result['skipped'] == 1
+    assert server.backfiller.missing_counter.value == 2
+    lines = []
+    for name in os.listdir(out_dir):
+        with open(out_dir / name, encoding='utf-8') as fp:
+            lines.extend(fp.read().splitlines())
+    assert lines == ['CPC1 LPAR1 1: Message 1', 'CPC1 LPAR1 2: Message 2',
+                     'CPC1 LPAR1 5: Message 5']
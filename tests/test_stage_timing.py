@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the stage_timing module.
+"""
+
+from zhmc_os_forwarder.stage_timing import StageTimer, STAGES
+from zhmc_os_forwarder.metrics import MetricsRegistry
+
+
+def test_stage_timer_disabled():
+    """
+    Test that a disabled stage timer does not measure and does not create
+    histograms.
+    """
+    metrics = MetricsRegistry()
+    timer = StageTimer(metrics)
+    assert timer.start() is None
+    timer.stop('format', None)
+    timer.observe('queue', 0.1)
+    assert timer.histograms == {}
+    assert metrics.metrics() == []
+
+
+def test_stage_timer_enabled():
+    """
+    Test that an enabled stage timer measures the stages.
+    """
+    metrics = MetricsRegistry()
+    timer = StageTimer(metrics, enabled=True)
+    assert set(timer.histograms) == set(STAGES)
+    start_time = timer.start()
+    assert start_time is not None
+    timer.stop('format', start_time)
+    timer.observe('queue', 0.5)
+    assert sum(timer.histograms['format'].counts) == 1
+    assert sum(timer.histograms['queue'].counts) == 1
+    assert timer.histograms['queue'].max == 0.5
+    assert sum(timer.histograms['deliver'].counts) == 0
+
+
+def test_stage_timer_toggle():
+    """
+    Test toggling a stage timer, including a stage that was started while
+    the measurement was enabled.
+    """
+    timer = StageTimer(MetricsRegistry())
+    assert timer.toggle() is True
+    start_time = timer.start()
+    assert timer.toggle() is False
+    timer.stop('handle', start_time)
+    timer.observe('handle', 0.1)
+    assert sum(timer.histograms['handle'].counts) == 1
+    assert timer.toggle() is True
+    assert sum(timer.histograms['handle'].counts) == 1
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the startup_timing module.
+"""
+
+import json
+
+import pytest
+
+from zhmc_os_forwarder import utils, startup_timing
+from zhmc_os_forwarder.startup_timing import StartupTimer, MAX_SLOWEST_ITEMS
+from zhmc_os_forwarder.metrics import MetricsRegistry
+
+
+def test_startup_timer(capsys, monkeypatch):
+    """
+    Test that the startup timer measures the phases with the slowest items,
+    and reports them.
+    """
+    monkeypatch.setattr(utils, 'VERBOSE_LEVEL', 2)
+    metrics = MetricsRegistry()
+    timer = StartupTimer(metrics)
+    with timer.measure('logon'):
+        pass
+    for index in range(MAX_SLOWEST_ITEMS + 2):
+        timer.record('lpar_list', 0.1 * index, f'CPC{index}')
+    with pytest.raises(RuntimeError):
+        with timer.measure('channel_open', 'CPC1/LPAR1'):
+            raise RuntimeError('failed')
+    timer.finish()
+    timer.record('logon', 1.0)  # Ignored after finish()
+    with timer.measure('subscribe', 'CPC1/LPAR1'):
+        pass
+
+    timing = timer.as_dict()
+    assert set(timing['phases']) == {'logon', 'lpar_list', 'channel_open'}
+    assert timing['phases']['logon']['count'] == 1
+    assert timing['phases']['logon']['slowest'] == []
+    lpar_list = timing['phases']['lpar_list']
+    assert lpar_list['count'] == MAX_SLOWEST_ITEMS + 2
+    assert lpar_list['max'] == pytest.approx(0.1 * (MAX_SLOWEST_ITEMS + 1))
+    assert [item for item, _ in lpar_list['slowest']] == \
+        [f'CPC{i}' for i in range(MAX_SLOWEST_ITEMS + 1, 1, -1)]
+    assert timing['phases']['channel_open']['slowest'][0][0] == 'CPC1/LPAR1'
+
+    timer.report()
+    out = capsys.readouterr().out
+    assert "Startup phase lpar_list: 7 operations" in out
+    assert "slowest: CPC6 (0.600 sec)" in out
+    json_line = [line for line in out.splitlines()
+                 if line.startswith("Startup timing as JSON: ")][0]
+    assert json.loads(json_line.split(': ', 1)[1]) == \
+        json.loads(json.dumps(timing))
+
+    # The durations are also available as metrics
+    assert 'zhmc_os_forwarder_startup_phase_seconds_count' \
+        '{phase="lpar_list"} 7' in metrics.prometheus_text()
+
+
+def test_startup_timer_standby(capsys, monkeypatch):
+    """
+    Test that the time waited for the lease in standby mode is not included
+    in the total startup time, but reported separately.
+    """
+    monkeypatch.setattr(utils, 'VERBOSE_LEVEL', 1)
+    now = [100.0]
+    monkeypatch.setattr(startup_timing.time, 'monotonic', lambda: now[0])
+    timer = StartupTimer(MetricsRegistry())
+    assert timer.as_dict()['standby'] is None
+    now[0] += 2.0
+    timer.begin_standby()
+    now[0] += 30.0
+    assert timer.as_dict() == {'total': 2.0, 'standby': 30.0, 'phases': {}}
+    now[0] += 50.0
+    timer.end_standby()
+    now[0] += 3.0
+    timer.finish()
+    now[0] += 10.0
+
+    assert timer.as_dict() == {'total': 5.0, 'standby': 80.0, 'phases': {}}
+    timer.report()
+    out = capsys.readouterr().out
+    assert "Startup took 5.000 sec" in out
+    assert "Standby waited 80.000 sec for the lease" in out
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the supervisor module.
+"""
+
+import pytest
+
+from zhmc_os_forwarder import utils
+from zhmc_os_forwarder.supervisor import Supervisor, \
+    WORKER_THREAD_STALL_TIMEOUT
+
+
+class FakeProcess:
+    """
+    Stand-in for a running multiprocessing.Process.
+    """
+
+    def __init__(self):
+        self.exitcode = None
+        self.killed = False
+
+    def kill(self):
+        """Kill the process"""
+        self.killed = True
+        self.exitcode = -9
+
+    def join(self):
+        """Wait for the process to end"""
+
+
+class FakeConn:
+    """
+    Stand-in for the connection to a worker, with pending reports.
+    """
+
+    def __init__(self, reports):
+        self.reports = list(reports)
+
+    def poll(self):
+        """Return whether a report is pending"""
+        return bool(self.reports)
+
+    def recv(self):
+        """Return the next pending report"""
+        return self.reports.pop(0)
+
+    def close(self):
+        """Close the connection"""
+
+
+@pytest.fixture(autouse=True)
+def fixture_quiet(monkeypatch):
+    """Suppress printing of the log messages."""
+    monkeypatch.setattr(utils, 'VERBOSE_LEVEL', 0)
+
+
+@pytest.mark.parametrize(
+    "health, exp_restart",
+    [
+        ([{'name': 'delivery', 'alive': True, 'busy_time': 0.0},
+          {'name': 'forwarder-0', 'alive': True, 'busy_time': 1.0}],
+         False),
+        ([{'name': 'delivery', 'alive': True, 'busy_time': 0.0},
+          {'name': 'forwarder-0', 'alive': False, 'busy_time': 0.0}],
+         True),
+        ([{'name': 'delivery', 'alive': True,
+           'busy_time': WORKER_THREAD_STALL_TIMEOUT + 1}],
+         True),
+        ([], False),
+    ]
+)
+def test_supervisor_health(health, exp_restart):
+    """
+    Test that the supervisor restarts workers that report a thread that has
+    ended or has not made progress.
+    """
+    supervisor = Supervisor(None, 1)
+    worker = supervisor.workers[0]
+    process = FakeProcess()
+    worker.process = process
+    worker.conn = FakeConn([([], health)])
+    worker.start_time = 0.0
+
+    supervisor.check()
+
+    assert worker.health == health
+    assert process.killed is exp_restart
+    assert (worker.process is None) is exp_restart
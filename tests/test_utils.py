@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the utils module.
+"""
+
+import logging
+
+from zhmc_os_forwarder import utils
+from zhmc_os_forwarder.utils import shard_index, logprint, PRINT_V
+
+
+def test_shard_index():
+    """
+    Test that shard_index() is stable and distributes URIs across shards.
+    """
+    uris = [f'/api/logical-partitions/{i:04d}' for i in range(100)]
+    indexes = [shard_index(uri, 4) for uri in uris]
+    assert indexes == [shard_index(uri, 4) for uri in uris]
+    assert set(indexes) == {0, 1, 2, 3}
+    assert shard_index('/api/partitions/abc', 1) == 0
+
+
+def test_shard_index_domain():
+    """
+    Test that the distribution in a domain is independent of the
+    distribution across shards, so that the URIs of one shard are spread
+    across all receivers.
+    """
+    uris = [f'/api/logical-partitions/{i:04d}' for i in range(1000)]
+    for shard in range(2):
+        shard_uris = [uri for uri in uris if shard_index(uri, 2) == shard]
+        receivers = {shard_index(uri, 2, 'receiver') for uri in shard_uris}
+        assert receivers == {0, 1}
+    assert shard_index(uris[0], 4, 'receiver') == \
+        shard_index(uris[0], 4, 'receiver')
+
+
+def test_shard_index_rebalance():
+    """
+    Test that adding a shard moves only URIs to the added shard.
+    """
+    uris = [f'/api/logical-partitions/{i:04d}' for i in range(200)]
+    for uri in uris:
+        old_index = shard_index(uri, 4)
+        new_index = shard_index(uri, 5)
+        assert new_index in (old_index, 4)
+
+
+class FormatCounter:  # pylint: disable=too-few-public-methods
+    """Format argument that counts how often it is formatted"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __format__(self, format_spec):
+        self.count += 1
+        return 'x'
+
+
+def test_logprint_lazy(capsys, monkeypatch):
+    """
+    Test that logprint() formats a message with format arguments only if it
+    is printed or logged, and only once.
+    """
+    arg = FormatCounter()
+    monkeypatch.setattr(utils, 'VERBOSE_LEVEL', 0)
+    monkeypatch.setattr(utils, 'LOG_LEVEL', logging.CRITICAL + 1)
+    logprint(logging.WARNING, PRINT_V, "Message {a}", a=arg)
+    assert arg.count == 0
+    assert capsys.readouterr().out == ''
+
+    monkeypatch.setattr(utils, 'VERBOSE_LEVEL', 1)
+    monkeypatch.setattr(utils, 'LOG_LEVEL', logging.WARNING)
+    logprint(logging.WARNING, PRINT_V, "Message {a}", a=arg)
+    assert arg.count == 1
+    assert capsys.readouterr().out == 'Message x\n'
+
+    # Messages without format arguments are not formatted
+    logprint(None, PRINT_V, "Message {a}")
+    assert capsys.readouterr().out == 'Message {a}\n'
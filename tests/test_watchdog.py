@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the watchdog module.
+"""
+
+from zhmc_os_forwarder.watchdog import Watchdog
+from zhmc_os_forwarder.forwarded_lpars import ForwardedLparInfo
+from zhmc_os_forwarder.metrics import MetricsRegistry
+
+from .fake_lpar import FakeLpar
+
+
+def lpar_info(name, last_seq_no, next_seq_no, recv_time):
+    """Return a subscribed ForwardedLparInfo for a FakeLpar"""
+    info = ForwardedLparInfo(FakeLpar(range(0, last_seq_no + 1), name),
+                             topic=f'{name}-t')
+    info.next_seq_no = next_seq_no
+    info.recv_time = recv_time
+    return info
+
+
+def test_watchdog_check():
+    """
+    Test that only LPARs that have been idle for the stall timeout are
+    probed, and that those with OS messages on the HMC are stalled.
+    """
+    stalled = lpar_info('stalled', 11, 10, 0.0)
+    quiet = lpar_info('quiet', 9, 10, 0.0)
+    active = lpar_info('active', 11, 10, 90.0)
+    unknown = lpar_info('unknown', 11, None, 0.0)
+    lpar_infos = [stalled, quiet, active, unknown]
+    metrics = MetricsRegistry()
+    watchdog = Watchdog(metrics, stall_timeout=60)
+
+    assert watchdog.check(lpar_infos, 100.0) == [stalled]
+    assert stalled.lpar.requests == [(10, 109)]
+    assert quiet.lpar.requests == [(10, 109)]
+    assert not active.lpar.requests
+    assert not unknown.lpar.requests
+    assert watchdog.probes_counter.value == 2
+    assert watchdog.stalls_counter.value == 1
+
+    # Probed LPARs are not probed again within the stall timeout
+    assert watchdog.check(lpar_infos, 140.0) == []
+    assert watchdog.probes_counter.value == 2
+    assert watchdog.check(lpar_infos, 160.0) == [active, stalled]
+
+
+def test_watchdog_max_probes():
+    """
+    Test that at most max_probes LPARs are probed at each check, least
+    recently probed first.
+    """
+    lpar_infos = [lpar_info(f'lpar{i}', 9, 10, 0.0) for i in range(5)]
+    lpar_infos[0].probe_time = 50.0
+    watchdog = Watchdog(MetricsRegistry(), stall_timeout=60, max_probes=2)
+    candidates = watchdog.candidates(lpar_infos, 200.0)
+    assert candidates == lpar_infos[1:3]
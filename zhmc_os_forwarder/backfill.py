@@ -0,0 +1,456 @@
+#!/usr/bin/env python
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A class for detecting gaps in the sequence numbers of received OS messages
+and retrieving the missing OS messages from the HMC
+"""
+
+import time
+import logging
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+import zhmcclient
+
+from .utils import logprint, PRINT_ALWAYS, PRINT_V
+from .delivery_queue import delivery_class, PRIORITY_CLASS
+
+# Default number of most recent OS messages per LPAR that are retrieved when
+# the first OS message of the LPAR is received after startup
+DEFAULT_BACKFILL_STARTUP_MESSAGES = 0
+
+# Default maximum number of OS messages retrieved for a single gap
+DEFAULT_BACKFILL_MAX_MESSAGES = 1000
+
+# Default number of sequence numbers retrieved with a single request
+DEFAULT_BACKFILL_PAGE_SIZE = 500
+
+# Default maximum number of LPARs whose OS messages are retrieved in parallel
+DEFAULT_BACKFILL_CONCURRENCY = 4
+
+
+def list_os_messages(lpar, begin, end, page_size, max_count=None):
+    """
+    Retrieve the OS messages of an LPAR in a range of sequence numbers from
+    the HMC, using one 'List OS Messages' request per page of sequence
+    numbers.
+
+    Parameters:
+      lpar (zhmcclient.Partition/Lpar): The LPAR.
+      begin (int): First sequence number of the range.
+      end (int): Last sequence number of the range, or None for the
+        available OS messages starting at begin. In that case, retrieval ends
+        with the first page without OS messages, and any OS messages after
+        such a page are not retrieved.
+      page_size (int): Number of sequence numbers per request.
+      max_count (int): Maximum number of sequence numbers to retrieve if end
+        is None, or None for no limit.
+
+    Returns:
+      iterator of list of dict: The OS messages of each page, as items of the
+      'os-messages' list in the result of the 'List OS Messages' operation.
+
+    Raises:
+      zhmcclient.Error: Error retrieving the OS messages.
+    """
+    if end is None:
+        # Partitions do not support limiting the number of OS messages in
+        # the request, so the pages are ranges of sequence numbers as well.
+        count = 0
+        while max_count is None or count < max_count:
+            size = page_size
+            if max_count is not None:
+                size = min(size, max_count - count)
+            page_end = begin + size - 1
+            result = lpar.list_os_messages(begin=begin, end=page_end)
+            page = result['os-messages']
+            yield page
+            if not page:
+                return
+            count += size
+            begin = page_end + 1
+        return
+    while begin <= end:
+        page_end = min(begin + page_size - 1, end)
+        result = lpar.list_os_messages(begin=begin, end=page_end)
+        yield result['os-messages']
+        begin = page_end + 1
+
+
+class Backfiller:
+    """
+    Detects gaps in the sequence numbers of the OS messages received for
+    each LPAR, and retrieves the missing OS messages from the HMC.
+
+    The OS messages are retrieved in a pool of worker threads, for multiple
+    LPARs in parallel. While OS messages are retrieved for an LPAR, newly
+    received OS messages of that LPAR are held back, so that all OS messages
+    of the LPAR are passed on in the order of their sequence numbers.
+
+    When an OS message cannot be passed on because the LPAR has too many
+    OS messages waiting for delivery, the OS messages of the LPAR are
+    spilled: Starting with that OS message, its routine OS messages are
+    dropped and are retrieved from the HMC again when refill() is called
+    after its backlog has been reduced. Priority OS messages are still
+    passed on while the LPAR is spilled.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, put, stop_event, metrics,
+                 startup_messages=DEFAULT_BACKFILL_STARTUP_MESSAGES,
+                 max_messages=DEFAULT_BACKFILL_MAX_MESSAGES,
+                 page_size=DEFAULT_BACKFILL_PAGE_SIZE,
+                 concurrency=DEFAULT_BACKFILL_CONCURRENCY):
+        """
+        Parameters:
+          put (callable): Function that passes on an OS message, with
+            parameters (lpar_info, msg_info, recv_time). Returns a bool
+            indicating whether the OS message was passed on.
+          stop_event (threading.Event): Event that is set when the forwarder
+            is stopping.
+          metrics (MetricsRegistry): Registry for the backfill metrics.
+          startup_messages (int): Number of most recent OS messages to be
+            retrieved when the first OS message of an LPAR is received.
+          max_messages (int): Maximum number of OS messages to be retrieved
+            for a single gap, or by resume().
+          page_size (int): Number of sequence numbers per request.
+          concurrency (int): Maximum number of LPARs whose OS messages are
+            retrieved in parallel.
+        """
+        self.put = put
+        self.stop_event = stop_event
+        self.startup_messages = startup_messages
+        self.max_messages = max_messages
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.backfilled_counter = metrics.counter(
+            'zhmc_os_forwarder_backfilled_messages_total',
+            "Number of OS messages retrieved from the HMC to fill gaps")
+        self.missing_counter = metrics.counter(
+            'zhmc_os_forwarder_missing_messages_total',
+            "Number of OS messages in gaps that could not be retrieved")
+        self.spilled_counter = metrics.counter(
+            'zhmc_os_forwarder_spilled_messages_total',
+            "Number of OS messages dropped because their LPAR had too many "
+            "OS messages waiting for delivery, to be retrieved again")
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix='backfill')
+        # Protects held_messages of the LPARs. The thread that sets
+        # held_messages of an LPAR from None to a list owns the LPAR: Only
+        # that thread passes on OS messages of the LPAR and updates its
+        # next_seq_no, spilled_seq_no and spilled_priority, until it sets
+        # held_messages back to None. Other threads append their received
+        # OS messages to held_messages in the meantime. This way, the OS
+        # messages are passed on in order without holding the lock.
+        self._lock = Lock()
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "startup_messages={s.startup_messages!r}, "
+                "max_messages={s.max_messages!r}, "
+                "page_size={s.page_size!r}, "
+                "concurrency={s.concurrency!r}"
+                ")".format(s=self))
+
+    def receive(self, lpar_info, msg_infos, recv_time):
+        """
+        Pass on OS messages received for an LPAR, or hold them back while
+        missing OS messages of the LPAR are retrieved.
+
+        Parameters:
+          lpar_info (ForwardedLparInfo): The forwarded LPAR.
+          msg_infos (list of dict): The received OS messages, as the
+            'os-messages' list in the OS message notification.
+          recv_time (float): time.monotonic() when the OS messages were
+            received.
+        """
+        items = [(msg_info, recv_time) for msg_info in msg_infos]
+        with self._lock:
+            if lpar_info.held_messages is not None:
+                lpar_info.held_messages.extend(items)
+                return
+            lpar_info.held_messages = []
+        self._pass_on_items(lpar_info, items)
+
+    def resume(self, lpar_info, begin):
+        """
+        Retrieve the OS messages of an LPAR that are available on the HMC
+        starting at a sequence number, e.g. when resuming from a checkpoint.
+        At most max_messages OS messages are retrieved, up to the first page
+        without OS messages.
+
+        Nothing is done if OS messages are already being retrieved for the
+        LPAR, or if the LPAR is spilled (the spilled OS messages are
+        retrieved by refill()).
+
+        Parameters:
+          lpar_info (ForwardedLparInfo): The forwarded LPAR.
+          begin (int): Sequence number of the first OS message to retrieve.
+        """
+        with self._lock:
+            if lpar_info.held_messages is not None or \
+                    lpar_info.spilled_seq_no is not None:
+                return
+            lpar_info.held_messages = []
+            self._executor.submit(self._run, lpar_info, begin, None)
+
+    def refill(self, lpar_info, max_count):
+        """
+        Retrieve spilled OS messages of an LPAR from the HMC and pass them on,
+        once the LPAR has room for them in the delivery queue.
+
+        Nothing is done if the LPAR is not spilled or if OS messages are
+        already being retrieved for the LPAR.
+
+        Parameters:
+          lpar_info (ForwardedLparInfo): The forwarded LPAR.
+          max_count (int): Maximum number of OS messages to retrieve. Any
+            further spilled OS messages remain spilled.
+        """
+        with self._lock:
+            begin = lpar_info.spilled_seq_no
+            if begin is None or lpar_info.held_messages is not None or \
+                    max_count <= 0:
+                return
+            spill_end = lpar_info.next_seq_no - 1
+            end = min(spill_end, begin + max_count - 1)
+            lpar_info.held_messages = []
+            self._executor.submit(self._run, lpar_info, begin, end, spill_end)
+
+    def reset(self, lpar_info):
+        """
+        Forget the expected sequence number of an LPAR, e.g. when the LPAR
+        has been deactivated, so that its next OS message is handled like the
+        first OS message after startup. Spilled OS messages of the LPAR are
+        counted as missing.
+
+        Parameters:
+          lpar_info (ForwardedLparInfo): The forwarded LPAR.
+        """
+        with self._lock:
+            if lpar_info.held_messages is None:
+                begin = lpar_info.spilled_seq_no
+                if begin is not None:
+                    end = lpar_info.next_seq_no - 1
+                    num_missing = end - begin + 1 - len(
+                        lpar_info.spilled_priority)
+                    if num_missing > 0:
+                        self._log_missing(lpar_info, begin, end, num_missing)
+                    lpar_info.spilled_seq_no = None
+                    lpar_info.spilled_priority = None
+                lpar_info.next_seq_no = None
+
+    def shutdown(self):
+        """
+        Wait for running retrievals to complete. Retrievals that have not
+        completed when the stop event is set pass on the OS messages held
+        back so far without retrieving further OS messages.
+        """
+        self._executor.shutdown(wait=True)
+
+    def _pass_on_items(self, lpar_info, items):
+        """
+        Pass on received OS messages of an LPAR in the order of their
+        sequence numbers, and start retrieving missing OS messages when a gap
+        is detected.
+
+        The calling thread must own the LPAR. Ownership ends when this method
+        returns, or is passed on to the retrieval.
+
+        Parameters:
+          lpar_info (ForwardedLparInfo): The forwarded LPAR.
+          items (list of tuple(msg_info, recv_time)): The OS messages.
+        """
+        while True:
+            for index, (msg_info, recv_time) in enumerate(items):
+                seq_no = msg_info['sequence-number']
+                if lpar_info.spilled_seq_no is not None:
+                    # Gaps are filled when the spilled OS messages are
+                    # retrieved
+                    lpar_info.next_seq_no = seq_no + 1
+                    self._pass_on(lpar_info, msg_info, recv_time)
+                    continue
+                next_seq_no = lpar_info.next_seq_no
+                if next_seq_no is None:
+                    begin = max(seq_no - self.startup_messages, 0)
+                elif seq_no > next_seq_no:
+                    begin = max(seq_no - self.max_messages, next_seq_no)
+                    if begin > next_seq_no:
+                        self._log_missing(lpar_info, next_seq_no, begin - 1)
+                else:
+                    # In sequence, or the sequence numbers of the LPAR have
+                    # been reset
+                    begin = seq_no
+                if begin < seq_no and not self.stop_event.is_set():
+                    with self._lock:
+                        # Held back before any OS messages received by other
+                        # threads in the meantime
+                        lpar_info.held_messages[:0] = items[index:]
+                    self._executor.submit(
+                        self._run, lpar_info, begin, seq_no - 1)
+                    return
+                lpar_info.next_seq_no = seq_no + 1
+                self._pass_on(lpar_info, msg_info, recv_time)
+            with self._lock:
+                items = lpar_info.held_messages
+                if not items:
+                    lpar_info.held_messages = None
+                    return
+                lpar_info.held_messages = []
+
+    def _run(self, lpar_info, begin, end, spill_end=None):
+        """
+        The method running in a worker thread, for retrieving the missing
+        OS messages of an LPAR in a range of sequence numbers (end=None for
+        all available OS messages starting at begin), and then passing on
+        the OS messages held back in the meantime.
+
+        For retrieving spilled OS messages, spill_end is the last spilled
+        sequence number. Spilled OS messages after end remain spilled.
+
+        The worker thread owns the LPAR.
+        """
+        if spill_end is not None:
+            next_seq_no = spill_end + 1
+        else:
+            next_seq_no = begin if end is None else end + 1
+        try:
+            next_seq_no = self._retrieve(lpar_info, begin, end, spill_end)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            logprint(logging.ERROR, PRINT_ALWAYS,
+                     "Unexpected error retrieving OS messages {b} to {e} "
+                     "from LPAR {p!r} on CPC {c!r}: {t}: {m}",
+                     b=begin, e='latest' if end is None else end,
+                     p=lpar_info.name, c=lpar_info.cpc_name,
+                     t=exc.__class__.__name__, m=exc)
+        finally:
+            with self._lock:
+                items = lpar_info.held_messages
+                lpar_info.held_messages = []
+            # OS messages up to next_seq_no have already been passed on
+            lpar_info.next_seq_no = next_seq_no
+            self._pass_on_items(
+                lpar_info,
+                [item for item in items
+                 if item[0]['sequence-number'] >= next_seq_no])
+
+    def _retrieve(self, lpar_info, begin, end, spill_end):
+        """
+        Retrieve the missing OS messages of an LPAR and pass them on (see
+        _run()).
+
+        Returns:
+          int: Sequence number of the next OS message to be passed on.
+        """
+        lpar = lpar_info.lpar
+        logprint(logging.INFO, PRINT_V,
+                 "Retrieving OS messages {b} to {e} from LPAR {p!r} on CPC "
+                 "{c!r}", b=begin, e='latest' if end is None else end,
+                 p=lpar_info.name, c=lpar_info.cpc_name)
+        msg_infos = []
+        try:
+            for page in list_os_messages(lpar, begin, end, self.page_size,
+                                         self.max_messages):
+                msg_infos.extend(page)
+                if self.stop_event.is_set():
+                    break
+        except zhmcclient.Error as exc:
+            logprint(logging.ERROR, PRINT_ALWAYS,
+                     "Error retrieving OS messages {b} to {e} from LPAR "
+                     "{p!r} on CPC {c!r}: {m}",
+                     b=begin, e=end, p=lpar_info.name,
+                     c=lpar_info.cpc_name, m=exc)
+        msg_infos.sort(key=lambda m: m['sequence-number'])
+        recv_time = time.monotonic()
+        self.backfilled_counter.inc(len(msg_infos))
+        if end is None:
+            end = msg_infos[-1]['sequence-number'] if msg_infos else begin - 1
+        else:
+            num_missing = end - begin + 1 - len(msg_infos)
+            if num_missing > 0:
+                self._log_missing(lpar_info, begin, end, num_missing)
+        if spill_end is None:
+            for msg_info in msg_infos:
+                self._pass_on(lpar_info, msg_info, recv_time)
+            return end + 1
+
+        # The LPAR remains marked as spilled until the spilled OS messages
+        # have been passed on, so that the checkpoint does not advance
+        # beyond them.
+        passed = lpar_info.spilled_priority
+        spilled_seq_no = None  # First OS message spilled again
+        for msg_info in msg_infos:
+            seq_no = msg_info['sequence-number']
+            if seq_no in passed:
+                continue
+            if spilled_seq_no is None:
+                if self.put(lpar_info, msg_info, recv_time):
+                    continue
+                spilled_seq_no = seq_no
+            elif delivery_class(msg_info) == PRIORITY_CLASS and \
+                    self.put(lpar_info, msg_info, recv_time):
+                passed.add(seq_no)
+                continue
+            self.spilled_counter.inc()
+        if spilled_seq_no is None and spill_end > end:
+            spilled_seq_no = end + 1
+        if spilled_seq_no is None:
+            lpar_info.spilled_priority = None
+        else:
+            lpar_info.spilled_priority = {
+                s for s in passed if s >= spilled_seq_no}
+        lpar_info.spilled_seq_no = spilled_seq_no
+        return spill_end + 1
+
+    def _pass_on(self, lpar_info, msg_info, recv_time):
+        """
+        Pass on an OS message of an LPAR, or spill it if the LPAR has too
+        many OS messages waiting for delivery. Must be called by the thread
+        owning the LPAR.
+        """
+        seq_no = msg_info['sequence-number']
+        if lpar_info.spilled_seq_no is None:
+            if self.put(lpar_info, msg_info, recv_time):
+                return
+            lpar_info.spilled_seq_no = seq_no
+            lpar_info.spilled_priority = set()
+            if not self.stop_event.is_set():
+                logprint(logging.WARNING, PRINT_ALWAYS,
+                         "Warning: Too many OS messages from LPAR {p!r} on "
+                         "CPC {c!r} are waiting for delivery; OS messages "
+                         "starting with sequence number {s} will be "
+                         "retrieved from the HMC when the backlog has been "
+                         "reduced",
+                         p=lpar_info.name, c=lpar_info.cpc_name, s=seq_no)
+        elif delivery_class(msg_info) == PRIORITY_CLASS and \
+                self.put(lpar_info, msg_info, recv_time):
+            lpar_info.spilled_priority.add(seq_no)
+            return
+        self.spilled_counter.inc()
+
+    def _log_missing(self, lpar_info, begin, end, num_missing=None):
+        """
+        Log and count OS messages in a gap that are not retrieved.
+        """
+        if num_missing is None:
+            num_missing = end - begin + 1
+        self.missing_counter.inc(num_missing)
+        logprint(logging.WARNING, PRINT_ALWAYS,
+                 "Warning: {n} OS messages in sequence numbers {b} to {e} "
+                 "from LPAR {p!r} on CPC {c!r} are missing",
+                 n=num_missing, b=begin, e=end, p=lpar_info.name,
+                 c=lpar_info.cpc_name)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A class for queueing OS messages between their receipt and their delivery
+to the destinations
+"""
+
+from collections import deque
+from threading import Lock, Condition
+
+# Maximum number of routine OS messages per LPAR in the delivery queue. When
+# exceeded, further OS messages of the LPAR are not put into the queue (see
+# Backfiller for how they are retrieved from the HMC later).
+DEFAULT_MAX_KEY_SIZE = 10000
+
+# Delivery classes
+PRIORITY_CLASS = 'priority'
+NORMAL_CLASS = 'normal'
+
+
+def delivery_class(msg_info):
+    """
+    Return the delivery class of an OS message.
+
+    OS messages flagged by the HMC as priority or held (i.e. operator action
+    is required) are in the priority class, all others in the normal class.
+
+    Parameters:
+      msg_info (dict): The OS message, as an item of the 'os-messages' list
+        in the OS message notification.
+
+    Returns:
+      string: PRIORITY_CLASS or NORMAL_CLASS.
+    """
+    if msg_info.get('is-priority') or msg_info.get('is-held'):
+        return PRIORITY_CLASS
+    return NORMAL_CLASS
+
+
+class DeliveryQueue:
+    """
+    A queue of OS messages waiting to be delivered, with two classes:
+
+    * Priority: Always returned before any normal items, in FIFO order.
+      Never blocks.
+    * Normal: Returned when there are no priority items. Normal items are
+      kept in one FIFO queue per key (i.e. per LPAR), and the queues of the
+      keys are served in weighted round-robin order: In each round, up to
+      'weight' items are returned from the queue of a key before moving on
+      to the next key. The number of normal items is limited per key;
+      items of a key that has reached the limit are rejected.
+
+    This way, the latency of OS messages from a quiet LPAR is independent
+    of any backlog of OS messages from other LPARs, and putting items never
+    blocks, so an LPAR with a backlog does not hold up the receipt of OS
+    messages of other LPARs.
+
+    The queue is thread-safe. Any number of threads can put items, and
+    any number of threads can get items.
+    """
+
+    def __init__(self, max_key_size=DEFAULT_MAX_KEY_SIZE):
+        """
+        Parameters:
+          max_key_size (int): Maximum number of normal items per key in the
+            queue.
+        """
+        self.max_key_size = max_key_size
+        self._priority_queue = deque()
+        # Normal items
+        # - key: key of the items
+        # - value: deque of items
+        self._normal_queues = {}
+        # Keys with normal items, in round-robin order. The first key is
+        # being served.
+        self._ring = deque()
+        self._weights = {}  # Weight by key
+        self._credit = 0  # Items left to return for the first key in _ring
+        self._normal_size = 0
+        self._lock = Lock()
+        self._not_empty = Condition(self._lock)
+        self._closed = False
+
+    def __len__(self):
+        with self._lock:
+            return len(self._priority_queue) + self._normal_size
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "max_key_size={s.max_key_size!r}, "
+                "priority_items={p!r}, "
+                "normal_items={s._normal_size!r}, "
+                "normal_keys={n!r}"
+                ")".format(s=self, p=len(self._priority_queue),
+                           n=len(self._ring)))
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def put(self, item, dclass=NORMAL_CLASS, key=None, weight=1,
+            force=False):
+        """
+        Put an item into the queue.
+
+        Never blocks. Normal items of a key that already has the maximum
+        number of items in the queue are rejected, unless forced, as are items
+        put after the queue has been closed.
+
+        Parameters:
+          item (object): The item.
+          dclass (string): Delivery class of the item (PRIORITY_CLASS or
+            NORMAL_CLASS).
+          key (object): Key of the item for weighted round-robin of normal
+            items (e.g. the LPAR URI).
+          weight (int): Weight of the key, as a positive integer. Ignored for
+            priority items.
+          force (bool): Put a normal item even if its key already has the
+            maximum number of items in the queue.
+
+        Returns:
+          bool: Indicates whether the item was put into the queue.
+        """
+        with self._lock:
+            if self._closed:
+                return False
+            if dclass == PRIORITY_CLASS:
+                self._priority_queue.append(item)
+                self._not_empty.notify()
+                return True
+            queue = self._normal_queues.get(key)
+            if queue is not None:
+                if len(queue) >= self.max_key_size and not force:
+                    return False
+                queue.append(item)
+            else:
+                self._normal_queues[key] = deque((item,))
+                self._ring.append(key)
+                if len(self._ring) == 1:
+                    self._credit = weight
+            self._weights[key] = weight
+            self._normal_size += 1
+            self._not_empty.notify()
+            return True
+
+    def key_size(self, key):
+        """
+        Return the number of normal items of a key in the queue.
+
+        Parameters:
+          key (object): Key of the items.
+
+        Returns:
+          int: Number of normal items of the key.
+        """
+        with self._lock:
+            queue = self._normal_queues.get(key)
+            return len(queue) if queue is not None else 0
+
+    def get(self):
+        """
+        Get the next item from the queue, blocking while the queue is empty.
+
+        Returns:
+          tuple(item, dclass): The item and its delivery class, or None if
+          the queue has been closed and all items have been returned.
+        """
+        with self._lock:
+            while True:
+                if self._priority_queue:
+                    return self._priority_queue.popleft(), PRIORITY_CLASS
+                if self._ring:
+                    return self._get_normal(), NORMAL_CLASS
+                if self._closed:
+                    return None
+                self._not_empty.wait()
+
+    def _get_normal(self):
+        """
+        Return the next normal item in weighted round-robin order. Must be
+        called with the lock held and with normal items in the queue.
+        """
+        key = self._ring[0]
+        queue = self._normal_queues[key]
+        item = queue.popleft()
+        self._normal_size -= 1
+        self._credit -= 1
+        if not queue:
+            del self._normal_queues[key]
+            del self._weights[key]
+            self._ring.popleft()
+            self._credit = 0
+        elif self._credit <= 0:
+            self._ring.rotate(-1)
+            self._credit = 0
+        if self._ring and self._credit == 0:
+            self._credit = self._weights[self._ring[0]]
+        return item
+
+    def close(self):
+        """
+        Close the queue. Items remaining in the queue can still be retrieved
+        with get(). Once the queue is empty, get() returns None.
+        """
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A class for aggregating the errors delivering OS messages to destinations
+"""
+
+import time
+import logging
+from threading import Lock
+
+from .utils import logprint, PRINT_ALWAYS
+
+# Default interval in seconds for reporting the aggregated errors
+DEFAULT_ERROR_REPORT_INTERVAL = 60
+
+# Maximum number of sequence numbers reported as samples for each kind of
+# error
+MAX_SAMPLE_SEQ_NOS = 5
+
+
+# pylint: disable=too-few-public-methods
+class _ErrorInfo:
+    """
+    Errors of one kind at one destination since the last report
+    """
+
+    def __init__(self, counter):
+        self.counter = counter  # metrics.Counter: Errors since startup
+        self.count = 0  # int: Number of errors since the last report
+        self.first_time = None  # float: time.time() of the first error
+        self.last_time = None  # float: time.time() of the last error
+        self.last_exc = None  # Exception: The last error
+        self.seq_nos = []  # list of int: Sample sequence numbers
+
+
+class ErrorAggregator:
+    """
+    Aggregates the errors delivering OS messages to destinations, so that a
+    destination that is down does not cause a log message for each OS
+    message.
+
+    The errors are counted by destination and error class. The first error
+    of a kind since the last report is to be logged by the caller. The
+    further errors are logged as a summary with their number, the times of
+    the first and last error, and sample sequence numbers when report() is
+    called. The errors are also counted in a metric.
+    """
+
+    def __init__(self, metrics, interval=DEFAULT_ERROR_REPORT_INTERVAL):
+        """
+        Parameters:
+          metrics (MetricsRegistry): Registry for the error counters.
+          interval (float): Interval in seconds at which report() is called.
+        """
+        self.metrics = metrics
+        self.interval = interval
+        self._lock = Lock()
+        # Errors by tuple(destination, error class name)
+        self._errors = {}
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "interval={s.interval!r}, "
+                "errors={n}"
+                ")".format(s=self, n=len(self._errors)))
+
+    def record(self, destination, exc, seq_no):
+        """
+        Record an error delivering an OS message to a destination.
+
+        Parameters:
+          destination (string): The destination, e.g. 'syslog host:port'.
+          exc (Exception): The error.
+          seq_no (int): Sequence number of the OS message.
+
+        Returns:
+          bool: Indicates that this is the first error of its kind since the
+          last report, which should be logged by the caller.
+        """
+        error = exc.__class__.__name__
+        key = (destination, error)
+        now = time.time()
+        with self._lock:
+            try:
+                info = self._errors[key]
+            except KeyError:
+                counter = self.metrics.counter(
+                    'zhmc_os_forwarder_delivery_errors_total',
+                    "Number of OS messages that could not be delivered to a "
+                    "destination",
+                    labels={'destination': destination, 'error': error})
+                info = _ErrorInfo(counter)
+                self._errors[key] = info
+            info.counter.inc()
+            info.count += 1
+            if info.count == 1:
+                info.first_time = now
+            info.last_time = now
+            info.last_exc = exc
+            if len(info.seq_nos) < MAX_SAMPLE_SEQ_NOS:
+                info.seq_nos.append(seq_no)
+            return info.count == 1
+
+    def report(self):
+        """
+        Log a summary of the errors of each kind since the last report, and
+        start a new report interval.
+
+        Errors of a kind that occurred only once are not logged again, since
+        the caller logged them when they were recorded.
+        """
+        summaries = []
+        with self._lock:
+            for (destination, error), info in self._errors.items():
+                if info.count > 1:
+                    summaries.append(
+                        (destination, error, info.count, info.first_time,
+                         info.last_time, info.seq_nos, info.last_exc))
+                info.count = 0
+                info.seq_nos = []
+        for destination, error, count, first_time, last_time, seq_nos, \
+                last_exc in summaries:
+            logprint(logging.WARNING, PRINT_ALWAYS,
+                     "Warning: {n} OS messages could not be delivered to "
+                     "{d} due to {e} between {f} and {l} (sample sequence "
+                     "numbers: {s}). Last error: {m}",
+                     n=count, d=destination, e=error, f=_time_str(first_time),
+                     l=_time_str(last_time),
+                     s=', '.join(str(s) for s in seq_nos), m=last_exc)
+
+
+def _time_str(timestamp):
+    """
+    Return a timestamp as a string in UTC, as in the log of the forwarder.
+    """
+    return time.strftime('%Y-%m-%d %H:%M:%S+0000', time.gmtime(timestamp))
@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A class for writing OS messages to rotating local files
+"""
+
+import os
+import gzip
+import shutil
+import time
+import queue
+import logging
+from threading import Thread, Event, Lock
+
+from .utils import logprint, PRINT_ALWAYS, PRINT_VV, ImproperExit
+
+# Valid values for the 'per' property of file destinations
+VALID_FILE_PER = ['lpar', 'cpc']
+
+# Valid values for the 'compression' property of file destinations
+VALID_FILE_COMPRESSIONS = ['none', 'gzip', 'zstd']
+
+# File name suffixes of compressed segments, by compression
+COMPRESSION_SUFFIXES = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+# Size of the write buffer of each open file in Bytes
+FILE_BUFFER_SIZE = 64 * 1024
+
+# Chunk size for copying data during compression in Bytes
+COMPRESS_CHUNK_SIZE = 1024 * 1024
+
+# Suffix of file names
+LOG_SUFFIX = '.log'
+
+
+# pylint: disable=too-few-public-methods
+class _OpenFile:
+    """
+    Info for a single open (active) file of a file sink
+    """
+
+    def __init__(self, path, fp, size, open_time):
+        self.path = path  # string: Path name of the file
+        self.fp = fp  # Binary file object, buffered
+        self.size = size  # int: Current size of the file in Bytes
+        self.open_time = open_time  # float: time.time() when opened
+
+
+class FileSink:
+    """
+    A sink that writes OS message records to local files, with one file
+    per LPAR or per CPC.
+
+    The files are rotated when they reach a maximum size or a maximum age.
+    Rotated (closed) segments are compressed in a background thread.
+    Writes are buffered and the buffers are flushed periodically in a
+    background thread.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, directory, per='lpar', max_size=0, rotate_interval=0,
+                 compression='gzip', flush_interval=1.0):
+        """
+        Parameters:
+          directory (string): Path name of the directory for the files.
+            Is created if it does not exist.
+          per (string): Granularity of files: 'lpar' for one file per LPAR,
+            'cpc' for one file per CPC.
+          max_size (int): Size in Bytes at which a file is rotated, or 0 for
+            no size based rotation.
+          rotate_interval (float): Age in seconds at which a file is rotated,
+            or 0 for no time based rotation.
+          compression (string): Compression of rotated segments: 'none',
+            'gzip', 'zstd'.
+          flush_interval (float): Time in seconds between flushes of the
+            write buffers.
+
+        Raises:
+          ImproperExit: Cannot use the specified compression.
+          OSError: Cannot create the directory.
+        """
+        self.directory = directory
+        self.per = per
+        self.max_size = max_size
+        self.rotate_interval = rotate_interval
+        self.compression = compression
+        self.flush_interval = flush_interval
+
+        check_compression(compression, directory)
+
+        os.makedirs(directory, exist_ok=True)
+
+        # Open files
+        # - key: file name without directory and suffix
+        # - value: _OpenFile
+        self._files = {}
+        self._lock = Lock()  # Protects self._files
+
+        # Path names of rotated segments to be compressed
+        self._compress_queue = queue.Queue()
+
+        self._stop_event = Event()
+        self._flush_thread = Thread(target=self._run_flush, daemon=True)
+        self._compress_thread = Thread(target=self._run_compress, daemon=True)
+        self._flush_thread.start()
+        self._compress_thread.start()
+
+    def __str__(self):
+        return ("{s.__class__.__name__}("
+                "directory={s.directory!r}"
+                ")".format(s=self))
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "directory={s.directory!r}, "
+                "per={s.per!r}, "
+                "max_size={s.max_size!r}, "
+                "rotate_interval={s.rotate_interval!r}, "
+                "compression={s.compression!r}, "
+                "flush_interval={s.flush_interval!r}"
+                ")".format(s=self))
+
+    def file_name(self, cpc_name, lpar_name):
+        """
+        Return the file name (without directory and suffix) for an LPAR.
+        """
+        if self.per == 'cpc':
+            return cpc_name
+        return f'{cpc_name}_{lpar_name}'
+
+    def write(self, cpc_name, lpar_name, records):
+        """
+        Write records to the file for an LPAR.
+
+        The records are buffered and will be written to the file system
+        at the next flush.
+
+        Parameters:
+          cpc_name (string): Name of the CPC of the LPAR.
+          lpar_name (string): Name of the LPAR.
+          records (list of string): The records, without newlines.
+
+        Raises:
+          OSError: Error writing the file.
+        """
+        data = ('\n'.join(records) + '\n').encode('utf-8')
+        name = self.file_name(cpc_name, lpar_name)
+        with self._lock:
+            try:
+                file = self._files[name]
+            except KeyError:
+                file = self._open(name)
+            if self._needs_rotation(file, time.time()):
+                self._rotate(name)
+                file = self._open(name)
+            file.fp.write(data)
+            file.size += len(data)
+
+    def flush(self):
+        """
+        Flush the write buffers of all open files, and rotate files that
+        have reached their maximum age.
+        """
+        now = time.time()
+        with self._lock:
+            for name, file in list(self._files.items()):
+                if self._needs_rotation(file, now):
+                    self._rotate(name)
+                else:
+                    file.fp.flush()
+
+    def close_file(self, cpc_name, lpar_name):
+        """
+        Flush and close the open file of an LPAR that is no longer forwarded,
+        so that the files of removed LPARs do not remain open. Nothing is done
+        for files per CPC, since they are shared with the other LPARs of the
+        CPC. The file is opened again when records are written to it.
+
+        Parameters:
+          cpc_name (string): Name of the CPC of the LPAR.
+          lpar_name (string): Name of the LPAR.
+
+        Raises:
+          OSError: Error writing the file.
+        """
+        if self.per == 'cpc':
+            return
+        with self._lock:
+            file = self._files.pop(self.file_name(cpc_name, lpar_name), None)
+            if file is not None:
+                file.fp.close()
+
+    def close(self):
+        """
+        Stop the background threads, and flush and close all open files.
+        Waits for the compression of rotated segments to complete.
+        """
+        self._stop_event.set()
+        self._flush_thread.join()
+        with self._lock:
+            for file in self._files.values():
+                file.fp.close()
+            self._files.clear()
+        self._compress_queue.put(None)  # Causes compress thread to end
+        self._compress_thread.join()
+
+    def _needs_rotation(self, file, now):
+        """
+        Return whether an open file has reached its maximum size or age.
+        """
+        if self.max_size and file.size >= self.max_size:
+            return True
+        age = now - file.open_time
+        return bool(self.rotate_interval) and age >= self.rotate_interval
+
+    def _open(self, name):
+        """
+        Open the active file with the specified name and return its _OpenFile.
+        Must be called with self._lock held.
+        """
+        path = os.path.join(self.directory, name + LOG_SUFFIX)
+        # pylint: disable=consider-using-with
+        fp = open(path, 'ab', buffering=FILE_BUFFER_SIZE)
+        file = _OpenFile(path, fp, fp.tell(), time.time())
+        self._files[name] = file
+        return file
+
+    def _rotate(self, name):
+        """
+        Close the active file with the specified name, rename it to a segment
+        file and queue the segment for compression.
+        Must be called with self._lock held.
+        """
+        file = self._files.pop(name)
+        file.fp.close()
+        if file.size == 0:
+            return
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+        base = os.path.join(self.directory, f'{name}.{stamp}')
+        seg_path = base + LOG_SUFFIX
+        i = 1
+        while os.path.exists(seg_path) or os.path.exists(
+                seg_path + COMPRESSION_SUFFIXES.get(self.compression, '')):
+            seg_path = f'{base}-{i}{LOG_SUFFIX}'
+            i += 1
+        os.rename(file.path, seg_path)
+        logprint(logging.INFO, PRINT_VV,
+                 "Rotated file {f} to {s}", f=file.path, s=seg_path)
+        if self.compression != 'none':
+            self._compress_queue.put(seg_path)
+
+    def _run_flush(self):
+        """
+        The method running as the flush thread.
+        """
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError as exc:
+                logprint(logging.WARNING, PRINT_ALWAYS,
+                         "Warning: Cannot flush files in directory {d}: {m}".
+                         format(d=self.directory, m=exc))
+
+    def _run_compress(self):
+        """
+        The method running as the compression thread.
+        """
+        while True:
+            seg_path = self._compress_queue.get()
+            if seg_path is None:
+                break
+            try:
+                compress_file(seg_path, self.compression)
+            except OSError as exc:
+                logprint(logging.WARNING, PRINT_ALWAYS,
+                         "Warning: Cannot compress file {f}: {m}".
+                         format(f=seg_path, m=exc))
+
+
+def check_compression(compression, directory):
+    """
+    Check that a compression of the rotated segments of a file destination
+    can be used.
+
+    Parameters:
+      compression (string): Compression: 'none', 'gzip', 'zstd'.
+      directory (string): Path name of the directory of the file destination,
+        for the error message.
+
+    Raises:
+      ImproperExit: Cannot use the specified compression.
+    """
+    if compression == 'zstd':
+        try:
+            # pylint: disable=import-outside-toplevel,unused-import
+            import zstandard  # noqa: F401
+        except ImportError:
+            raise ImproperExit(
+                "The 'zstandard' Python package must be installed for "
+                "zstd compression of files in directory {d}".
+                format(d=directory))
+
+
+def compress_file(path, compression):
+    """
+    Compress a file into a new file with a compression specific suffix,
+    and remove the original file.
+
+    Parameters:
+      path (string): Path name of the file.
+      compression (string): Compression: 'gzip', 'zstd'.
+
+    Returns:
+      string: Path name of the compressed file.
+    """
+    comp_path = path + COMPRESSION_SUFFIXES[compression]
+    tmp_path = comp_path + '.tmp'
+    with open(path, 'rb') as in_fp:
+        if compression == 'zstd':
+            # pylint: disable=import-outside-toplevel,import-error
+            import zstandard
+            with open(tmp_path, 'wb') as out_fp:
+                zstandard.ZstdCompressor().copy_stream(in_fp, out_fp)
+        else:
+            assert compression == 'gzip'
+            with gzip.open(tmp_path, 'wb') as out_fp:
+                shutil.copyfileobj(in_fp, out_fp, COMPRESS_CHUNK_SIZE)
+    os.rename(tmp_path, comp_path)
+    os.remove(path)
+    return comp_path
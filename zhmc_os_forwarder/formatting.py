@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Functions for formatting OS messages into records sent to destinations
+"""
+
+import time
+import json
+from json.encoder import encode_basestring_ascii
+
+# Valid values for the 'format' property of destinations
+VALID_FORMATS = ['text', 'json']
+
+# Valid values for the 'header' property of syslog servers
+VALID_SYSLOG_HEADERS = ['none', 'rfc3164', 'rfc5424']
+
+# Application name in syslog headers
+SYSLOG_APP_NAME = 'zhmc_os_forwarder'
+
+# Month names in RFC 3164 timestamps (independent of the locale)
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep',
+           'Oct', 'Nov', 'Dec')
+
+# Default maximum length of a syslog record in Bytes, including the syslog
+# header. 2048 is the typical maximum length most syslog implementations
+# accept (see also setup_logging() in utils.py).
+DEFAULT_MAX_RECORD_LENGTH = 2048
+
+# Length in Bytes reserved for the syslog header that is added by the
+# SysLogHandler ('<PRI>' and a trailing NUL character).
+SYSLOG_HEADER_LENGTH = 8
+
+# Length in Bytes reserved for the part indicator of continuation records
+# (e.g. '-12/34').
+PART_INDICATOR_LENGTH = 12
+
+# Minimum number of Bytes of message text in a record. Guarantees that
+# splitting always makes progress, even for 4-Byte UTF-8 characters.
+MIN_TEXT_LENGTH = 16
+
+# Field that is added to JSON records whose message text has been truncated
+JSON_TRUNCATED_FIELD = 'truncated'
+
+
+def split_message(msg_txt, max_bytes):
+    """
+    Split the text of an OS message into parts that can be sent as separate
+    records.
+
+    The text is split at line boundaries first. Lines whose UTF-8
+    representation is longer than `max_bytes` are split further, without
+    splitting any multi-byte UTF-8 sequences.
+
+    The UTF-8 representation of each long line is created only once, and its
+    parts are decoded directly from a memoryview on it, so that there are no
+    repeated copies of the remainder of the line.
+
+    Parameters:
+      msg_txt (string): The OS message text, without trailing newlines.
+      max_bytes (int): Maximum length of each part in Bytes (UTF-8), or
+        None for splitting only at line boundaries.
+
+    Returns:
+      list of string: The parts of the message text. Contains at least one
+      item, which may be an empty string.
+    """
+    lines = msg_txt.splitlines()
+    if not lines:
+        return ['']
+    if max_bytes is None:
+        return lines
+    max_bytes = max(max_bytes, MIN_TEXT_LENGTH)
+    parts = []
+    for line in lines:
+        # Each character takes at most 4 Bytes in UTF-8
+        if len(line) * 4 <= max_bytes:
+            parts.append(line)
+            continue
+        data = line.encode('utf-8')
+        data_len = len(data)
+        if data_len <= max_bytes:
+            parts.append(line)
+            continue
+        view = memoryview(data)
+        start = 0
+        while start < data_len:
+            end = start + max_bytes
+            if end >= data_len:
+                end = data_len
+            else:
+                # Move back to the first byte of a UTF-8 sequence
+                while data[end] & 0xC0 == 0x80:
+                    end -= 1
+            parts.append(str(view[start:end], 'utf-8'))
+            start = end
+    return parts
+
+
+def format_text_records(cpc_name, lpar_name, seq_no, msg_txt, max_length):
+    """
+    Format an OS message into one or more text records of the form::
+
+        {cpc} {lpar} {seq}: {text}
+
+    If the message has multiple lines or is longer than the maximum record
+    length, it is split into continuation records that can be correlated
+    using the sequence number and a part indicator::
+
+        {cpc} {lpar} {seq}-{part}/{parts}: {text}
+
+    Parameters:
+      cpc_name (string): Name of the CPC of the LPAR.
+      lpar_name (string): Name of the LPAR.
+      seq_no (int): Sequence number of the OS message.
+      msg_txt (string): The OS message text, without trailing newlines.
+      max_length (int): Maximum length of a record in Bytes, including the
+        syslog header, or None for no maximum length (multi-line messages
+        are still split into one record per line).
+
+    Returns:
+      list of string: The records.
+    """
+    prefix = f'{cpc_name} {lpar_name} {seq_no}'
+    if max_length is None:
+        max_bytes = None
+    else:
+        overhead = SYSLOG_HEADER_LENGTH + PART_INDICATOR_LENGTH + 2
+        max_bytes = max_length - overhead - len(prefix.encode('utf-8'))
+    parts = split_message(msg_txt, max_bytes)
+    num_parts = len(parts)
+    if num_parts == 1:
+        return [f'{prefix}: {parts[0]}']
+    return [f'{prefix}-{i}/{num_parts}: {part}'
+            for i, part in enumerate(parts, 1)]
+
+
+def message_time(msg_info):
+    """
+    Return the time the OS issued an OS message, from its 'timestamp' field.
+
+    Parameters:
+      msg_info (dict): The OS message, as an item of the 'os-messages' list
+        in the OS message notification.
+
+    Returns:
+      float: Seconds since the epoch, or None if the OS message does not
+      have a timestamp.
+    """
+    timestamp = msg_info.get('timestamp')
+    if timestamp is None or timestamp < 0:
+        return None
+    return timestamp / 1000.0
+
+
+def syslog_header(header, msg_time, hostname):
+    """
+    Return the syslog header for a record, without the leading '<PRI>' that
+    is added by the SysLogHandler.
+
+    RFC 5424 headers have the form::
+
+        1 2023-11-14T22:13:20.123Z {hostname} zhmc_os_forwarder - - -{space}
+
+    RFC 3164 headers have the form (the time is in UTC)::
+
+        Nov 14 22:13:20 {hostname} zhmc_os_forwarder:{space}
+
+    Parameters:
+      header (string): Header type: 'none', 'rfc3164', 'rfc5424'.
+      msg_time (float): Time in seconds since the epoch for the header,
+        usually the time the OS issued the message.
+      hostname (string): Host name for the header (the LPAR name).
+
+    Returns:
+      string: The syslog header, or an empty string for header 'none'.
+    """
+    if header == 'rfc5424':
+        ms = int(msg_time * 1000) % 1000
+        ts = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(msg_time))
+        return f'1 {ts}.{ms:03d}Z {hostname} {SYSLOG_APP_NAME} - - - '
+    if header == 'rfc3164':
+        tm = time.gmtime(msg_time)
+        month = _MONTHS[tm.tm_mon - 1]
+        ts = f'{month} {tm.tm_mday:2d} {time.strftime("%H:%M:%S", tm)}'
+        return f'{ts} {hostname} {SYSLOG_APP_NAME}: '
+    return ''
+
+
+def json_lpar_fragment(cpc_name, lpar_name, lpar_uri):
+    """
+    Return the pre-serialized JSON fragment with the constant fields of an
+    LPAR, for use with format_json_record().
+
+    The fragment is the start of a JSON object, up to and including the comma
+    after the last constant field, e.g.::
+
+        {"cpc":"CPC1","lpar":"LPAR1","lpar-uri":"/api/logical-partitions/1",
+
+    Parameters:
+      cpc_name (string): Name of the CPC of the LPAR.
+      lpar_name (string): Name of the LPAR.
+      lpar_uri (string): URI of the LPAR.
+
+    Returns:
+      string: The JSON fragment.
+    """
+    fields = (('cpc', cpc_name), ('lpar', lpar_name), ('lpar-uri', lpar_uri))
+    return '{' + ''.join(
+        f'{_json_key(key)}{_json_value(value)},' for key, value in fields)
+
+
+def format_json_record(lpar_fragment, msg_info, msg_txt):
+    """
+    Format an OS message into a JSON record (a single line) that has the
+    constant fields of the LPAR and all fields of the OS message as provided
+    by the HMC (e.g. 'sequence-number', 'message-id', 'timestamp',
+    'is-priority', 'is-held', 'prompt-text', 'message-text').
+
+    Only the fields of the OS message are encoded, using the C accelerated
+    string encoder of the json module. The constant fields of the LPAR are
+    taken from the pre-serialized fragment.
+
+    Multi-line OS messages are not split, since the JSON representation of
+    the message text escapes the newlines.
+
+    Parameters:
+      lpar_fragment (string): JSON fragment for the LPAR, as returned by
+        json_lpar_fragment().
+      msg_info (dict): The OS message, as an item of the 'os-messages' list
+        in the OS message notification.
+      msg_txt (string): The OS message text, without trailing newlines.
+        Replaces the 'message-text' field of the OS message.
+
+    Returns:
+      string: The JSON record.
+    """
+    items = []
+    for key, value in msg_info.items():
+        if key == 'message-text':
+            value = msg_txt
+        items.append(_json_key(key) + _json_value(value))
+    if not items:
+        # Remove the comma after the last field of the LPAR fragment
+        return lpar_fragment[:-1] + '}'
+    return lpar_fragment + ','.join(items) + '}'
+
+
+def truncate_json_record(record, max_length):
+    """
+    Truncate the message text of a JSON record that is longer than a maximum
+    length, so that the record fits into the maximum length, and mark the
+    record as truncated by adding a field 'truncated' with value true.
+
+    The record remains valid JSON. If the record does not fit into the maximum
+    length even with an empty message text, the message text is emptied.
+
+    Parameters:
+      record (string): The JSON record, as returned by format_json_record().
+        It is ASCII only, so its length in characters is its length in
+        Bytes.
+      max_length (int): Maximum length of the record in Bytes.
+
+    Returns:
+      string: The JSON record, truncated if needed.
+    """
+    if len(record) <= max_length:
+        return record
+    obj = json.loads(record)
+    msg_txt = obj.get('message-text') or ''
+    obj['message-text'] = ''
+    obj[JSON_TRUNCATED_FIELD] = True
+    available = max_length - len(json.dumps(obj, separators=(',', ':')))
+    length = 0
+    for index, char in enumerate(msg_txt):
+        # Length of the escaped character, without the enclosing quotes
+        length += len(encode_basestring_ascii(char)) - 2
+        if length > available:
+            obj['message-text'] = msg_txt[:index]
+            break
+    return json.dumps(obj, separators=(',', ':'))
+
+
+# Pre-encoded JSON object keys, including the colon
+# - key: field name
+# - value: encoded field name
+_JSON_KEYS = {}
+
+
+def _json_key(key):
+    """
+    Return the JSON encoded object key, including the colon.
+    """
+    try:
+        return _JSON_KEYS[key]
+    except KeyError:
+        encoded = encode_basestring_ascii(key) + ':'
+        _JSON_KEYS[key] = encoded
+        return encoded
+
+
+def _json_value(value):
+    """
+    Return the JSON encoded value, with fast paths for the scalar types
+    used in OS messages.
+    """
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(value, int):
+        return int.__repr__(value)
+    return json.dumps(value, separators=(',', ':'))
@@ -15,47 +15,135 @@
 # limitations under the License.
 
 """
-A class for storing forwarded LPARs and their syslog servers
+A class for storing forwarded LPARs and their destinations
 """
 
 from .forwarder_config import ForwarderConfig
+from .formatting import json_lpar_fragment
+from .utils import shard_index
 
 
-# pylint: disable=too-few-public-methods
+# pylint: disable=too-many-instance-attributes
 class ForwardedLparInfo:
     """
-    Info for a single forwarded LPAR
+    Info for a single forwarded LPAR.
+
+    The zhmcclient resource object of the LPAR is not kept, in order to keep
+    the memory used for a large number of LPARs low and to avoid attribute
+    chasing when delivering OS messages. A resource object for HMC operations
+    is created when needed (see lpar).
     """
 
-    def __init__(self, lpar, syslogs=None, topic=None):
-        self.lpar = lpar
+    __slots__ = (
+        'uri', 'name', 'cpc_name', 'cpc_uri', '_manager', 'syslogs', 'topic',
+        'receiver', 'files', 'http_servers', 'weight', 'json_fragment',
+        'lag_histogram', 'next_seq_no', 'delivered_seq_no', 'pending_seq_nos',
+        'delivered_early', 'held_messages', 'spilled_seq_no',
+        'spilled_priority', 'recv_time', 'probe_time')
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, lpar, syslogs=None, topic=None, files=None,
+                 http_servers=None, weight=1):
+        cpc = lpar.manager.parent
+        self.uri = lpar.uri  # string: URI of the LPAR
+        self.name = lpar.name  # string: Name of the LPAR
+        self.cpc_name = cpc.name  # string: Name of the CPC of the LPAR
+        self.cpc_uri = cpc.uri  # string: URI of the CPC of the LPAR
+        # Manager of the LPAR, for creating its resource object
+        self._manager = lpar.manager
         if not syslogs:
             syslogs = []
         self.syslogs = syslogs
         self.topic = topic
+        # Notification receiver the topic is subscribed on
+        self.receiver = None
+        if not files:
+            files = []
+        self.files = files
+        if not http_servers:
+            http_servers = []
+        self.http_servers = http_servers
+        # Delivery weight of the LPAR, relative to other LPARs
+        self.weight = weight
+        # Pre-serialized JSON fragment with the constant fields of the LPAR,
+        # if any of its destinations uses the JSON format, or None.
+        self.json_fragment = None
+        # Histogram of the forwarding lag of the LPAR (metrics.Histogram)
+        self.lag_histogram = None
+        # Expected sequence number of the next OS message, or None if no
+        # OS message has been received yet
+        self.next_seq_no = None
+        # Sequence number of the last delivered OS message, or None
+        self.delivered_seq_no = None
+        # Sequence numbers of the OS messages in the delivery queue, as a
+        # heap (see heapq). Priority OS messages are delivered before routine
+        # OS messages that were queued earlier, so the checkpoint must not
+        # advance beyond the lowest of them.
+        self.pending_seq_nos = []
+        # Number of deliveries of OS messages that were delivered while OS
+        # messages with a lower sequence number were in the delivery queue,
+        # by sequence number. They are removed from pending_seq_nos lazily.
+        self.delivered_early = {}
+        # OS messages held back while missing OS messages are retrieved, as
+        # list of tuple(msg_info, recv_time), or None if not retrieving
+        self.held_messages = None
+        # Sequence number of the first OS message that was dropped because
+        # too many OS messages of the LPAR were waiting for delivery, or None
+        # if not spilled (see Backfiller)
+        self.spilled_seq_no = None
+        # Sequence numbers of the priority OS messages passed on while
+        # spilled, as set of int, or None if not spilled
+        self.spilled_priority = None
+        # time.monotonic() when the last notification was received, or when
+        # the LPAR was subscribed
+        self.recv_time = 0.0
+        # time.monotonic() when the watchdog last probed the LPAR
+        self.probe_time = 0.0
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "uri={s.uri!r}, "
+                "name={s.name!r}, "
+                "cpc_name={s.cpc_name!r}, "
+                "topic={s.topic!r}"
+                ")".format(s=self))
+
+    @property
+    def lpar(self):
+        """
+        zhmcclient.Partition/Lpar: A new resource object for the LPAR, with
+        only its URI and name, for performing HMC operations on the LPAR.
+        """
+        return self._manager.resource_object(self.uri, {'name': self.name})
 
 
 class ForwardedLpars:
     """
-    A data structure to maintain forwarded LPARs and their syslog servers,
-    based on the forwarder config.
+    A data structure to maintain forwarded LPARs and their destinations
+    (syslog servers, files and HTTP servers), based on the forwarder config.
     """
 
-    def __init__(self, session, config_data, config_filename):
+    def __init__(self, session, config_data, config_filename, shard=None):
         """
         Parameters:
           session (zhmcclient.Session): Session with the HMC.
           config_data (dict): Content of forwarder config file.
           config_filename (string): Path name of forwarder config file.
+          shard (tuple(int, int)): Index and number of shards, if the LPARs
+            are distributed across multiple forwarders. In that case, only
+            the LPARs that belong to the shard are forwarded. None means that
+            all LPARs are forwarded.
         """
         self.session = session
         self.config_data = config_data
         self.config_filename = config_filename
+        self.shard = shard
 
         # Forwarder config for fast lookup
         self.config = ForwarderConfig(config_data, config_filename)
 
-        # Representation of forwarded LPARs
+        # Representation of forwarded LPARs. LPARs are added and removed
+        # while other threads use it, so iterate over a copy of its items.
         # - key: LPAR URI
         # - value: ForwardedLparInfo
         self.forwarded_lpar_infos = {}
@@ -68,6 +156,7 @@ class ForwardedLpars:
     def __repr__(self):
         return ("{s.__class__.__name__}("
                 "config_filename={s.config_filename!r}, "
+                "shard={s.shard!r}, "
                 "config={s.config!r}, "
                 "forwarded_lpar_infos={s.forwarded_lpar_infos!r}"
                 ")".format(s=self))
@@ -75,10 +164,10 @@ class ForwardedLpars:
     def add_if_matching(self, lpar):
         """
         Add an LPAR to be forwarded if it matches a forwarding definition
-        in the forwarder config.
+        in the forwarder config and belongs to the shard of this forwarder.
 
-        If the LPAR is already being forwarded, its syslog servers are changed
-        to the syslog servers from the forwarder definition.
+        If the LPAR is already being forwarded, its destinations are changed
+        to the destinations from the forwarder definition.
 
         Parameters:
           lpar (zhmcclient.Partition/Lpar or string): The LPAR, as a zhmcclient
@@ -87,11 +176,28 @@ class ForwardedLpars:
         Returns:
             bool: Indicates whether the LPAR was added.
         """
-        syslogs = self.config.get_syslogs(lpar)
-        if syslogs:
+        if self.shard:
+            index, num_shards = self.shard
+            if shard_index(lpar.uri, num_shards) != index:
+                return False
+        config_lpar_info = self.config.get_lpar_info(lpar)
+        if config_lpar_info and any((config_lpar_info.syslogs,
+                                     config_lpar_info.files,
+                                     config_lpar_info.http_servers)):
             if lpar.uri not in self.forwarded_lpar_infos:
                 self.forwarded_lpar_infos[lpar.uri] = ForwardedLparInfo(lpar)
-            self.forwarded_lpar_infos[lpar.uri].syslogs = syslogs
+            lpar_info = self.forwarded_lpar_infos[lpar.uri]
+            lpar_info.syslogs = config_lpar_info.syslogs
+            lpar_info.files = config_lpar_info.files
+            lpar_info.http_servers = config_lpar_info.http_servers
+            lpar_info.weight = config_lpar_info.weight
+            dests = config_lpar_info.syslogs + config_lpar_info.files + \
+                config_lpar_info.http_servers
+            if any(dest.format == 'json' for dest in dests):
+                lpar_info.json_fragment = json_lpar_fragment(
+                    lpar_info.cpc_name, lpar_info.name, lpar_info.uri)
+            else:
+                lpar_info.json_fragment = None
             return True
         return False
 
@@ -102,8 +208,8 @@ class ForwardedLpars:
         If the LPAR is not currently being forwarded, Nothing is done.
 
         Parameters:
-          lpar (zhmcclient.Partition/Lpar or string): The LPAR, as a zhmcclient
-            resource object or as a URI string.
+          lpar (zhmcclient.Partition/Lpar or ForwardedLparInfo): The LPAR, as
+            a zhmcclient resource object or as its forwarded LPAR info.
         """
         if lpar.uri in self.forwarded_lpar_infos:
             del self.forwarded_lpar_infos[lpar.uri]
@@ -139,3 +245,44 @@ class ForwardedLpars:
         except KeyError:
             return None
         return lpar_info.syslogs
+
+    def get_files(self, lpar):
+        """
+        Get the file destinations from the forwarder config for a forwarded
+        LPAR.
+
+        If the LPAR is not currently forwarded, returns None.
+
+        Parameters:
+          lpar (zhmcclient.Partition/Lpar or string): The LPAR, as a zhmcclient
+            resource object or as a URI string.
+
+        Returns:
+          list of ConfigFileInfo: The file destinations for the LPAR, or None.
+        """
+        try:
+            lpar_info = self.forwarded_lpar_infos[lpar.uri]
+        except KeyError:
+            return None
+        return lpar_info.files
+
+    def get_http_servers(self, lpar):
+        """
+        Get the HTTP server destinations from the forwarder config for a
+        forwarded LPAR.
+
+        If the LPAR is not currently forwarded, returns None.
+
+        Parameters:
+          lpar (zhmcclient.Partition/Lpar or string): The LPAR, as a zhmcclient
+            resource object or as a URI string.
+
+        Returns:
+          list of ConfigHttpInfo: The HTTP server destinations for the LPAR,
+          or None.
+        """
+        try:
+            lpar_info = self.forwarded_lpar_infos[lpar.uri]
+        except KeyError:
+            return None
+        return lpar_info.http_servers
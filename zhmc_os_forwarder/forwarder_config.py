@@ -18,14 +18,44 @@
 A class for storing forwarded LPARs and their syslog servers
 """
 
+import os
 import re
 
 from collections import namedtuple
 
+from .formatting import DEFAULT_MAX_RECORD_LENGTH
+from .file_sink import check_compression
+from .ha import DEFAULT_LEASE_TIME, DEFAULT_CHECKPOINT_INTERVAL
+from .utils import ImproperExit
+
 # Default syslog properties, if not specified in forwarder config
 DEFAULT_SYSLOG_PORT = 514
 DEFAULT_SYSLOG_PORT_TYPE = 'tcp'
 DEFAULT_SYSLOG_FACILITY = 'user'
+DEFAULT_SYSLOG_MAX_LENGTH = DEFAULT_MAX_RECORD_LENGTH
+DEFAULT_SYSLOG_FORMAT = 'text'
+DEFAULT_SYSLOG_HEADER = 'none'
+
+# Default file properties, if not specified in forwarder config
+DEFAULT_FILE_PER = 'lpar'
+DEFAULT_FILE_MAX_SIZE = 100 * 1024 * 1024
+DEFAULT_FILE_ROTATE_INTERVAL = 86400
+DEFAULT_FILE_COMPRESSION = 'gzip'
+DEFAULT_FILE_FLUSH_INTERVAL = 1.0
+DEFAULT_FILE_FORMAT = 'text'
+
+# Default HTTP server properties, if not specified in forwarder config
+DEFAULT_HTTP_BATCH_MAX_COUNT = 500
+DEFAULT_HTTP_BATCH_MAX_BYTES = 1024 * 1024
+DEFAULT_HTTP_BATCH_MAX_DELAY = 1.0
+DEFAULT_HTTP_COMPRESSION = 'gzip'
+DEFAULT_HTTP_MAX_RETRIES = 5
+DEFAULT_HTTP_RETRY_BACKOFF = 0.5
+DEFAULT_HTTP_TIMEOUT = 10.0
+DEFAULT_HTTP_FORMAT = 'json'
+
+# Default delivery weight of an LPAR
+DEFAULT_LPAR_WEIGHT = 1
 
 # Info for a single CPC pattern in the forwarder config
 ConfigCpcInfo = namedtuple(
@@ -44,6 +74,9 @@ ConfigLparInfo = namedtuple(
     [
         'lpar_pattern',         # string: Compiled pattern for LPAR name
         'syslogs',              # list of ConfigSyslogInfo: Syslogs for the LPAR
+        'files',                # list of ConfigFileInfo: Files for the LPAR
+        'http_servers',         # list of ConfigHttpInfo: HTTP servers for LPAR
+        'weight',               # int: Delivery weight of the LPAR
     ]
 )
 
@@ -54,14 +87,66 @@ class ConfigSyslogInfo:
     Info for a single syslog in the forwarder config
     """
 
-    def __init__(self, host, port, port_type, facility):
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, host, port, port_type, facility,
+                 max_length=DEFAULT_SYSLOG_MAX_LENGTH,
+                 format=DEFAULT_SYSLOG_FORMAT, header=DEFAULT_SYSLOG_HEADER):
+        # pylint: disable=redefined-builtin
         self.host = host  # string: Syslog IP address or hostname
         self.port = port  # int: Syslog port number
         self.port_type = port_type  # int: Syslog port type ('tcp', 'udp')
         self.facility = facility  # string: Syslog facility (e.g. 'user')
+        self.max_length = max_length  # int: Max syslog record length in Bytes
+        self.format = format  # string: Record format ('text', 'json')
+        self.header = header  # string: 'none', 'rfc3164', 'rfc5424'
         self.logger = None  # logging.Logger: Python logger for syslog
 
 
+# pylint: disable=too-few-public-methods
+class ConfigFileInfo:
+    """
+    Info for a single file destination in the forwarder config
+    """
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, directory, per, max_size, rotate_interval, compression,
+                 flush_interval, format=DEFAULT_FILE_FORMAT):
+        # pylint: disable=redefined-builtin
+        self.directory = directory  # string: Directory path name
+        self.per = per  # string: File granularity ('lpar', 'cpc')
+        self.max_size = max_size  # int: Rotation size in Bytes, or 0
+        self.rotate_interval = rotate_interval  # int: Rotation age in sec, or 0
+        self.compression = compression  # string: 'none', 'gzip', 'zstd'
+        self.flush_interval = flush_interval  # float: Flush interval in sec
+        self.format = format  # string: Record format ('text', 'json')
+        self.sink = None  # FileSink: File sink for the directory
+
+
+# pylint: disable=too-few-public-methods,too-many-instance-attributes
+class ConfigHttpInfo:
+    """
+    Info for a single HTTP server destination in the forwarder config
+    """
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, url, headers, verify_cert, batch_max_count,
+                 batch_max_bytes, batch_max_delay, compression, max_retries,
+                 retry_backoff, timeout, format=DEFAULT_HTTP_FORMAT):
+        # pylint: disable=redefined-builtin
+        self.url = url  # string: URL of the HTTP ingest endpoint
+        self.headers = headers  # dict: Additional HTTP headers
+        self.verify_cert = verify_cert  # bool/string: Cert verification
+        self.batch_max_count = batch_max_count  # int: Max records per batch
+        self.batch_max_bytes = batch_max_bytes  # int: Max Bytes per batch
+        self.batch_max_delay = batch_max_delay  # float: Max delay in sec
+        self.compression = compression  # string: 'none', 'gzip'
+        self.max_retries = max_retries  # int: Max retries per batch
+        self.retry_backoff = retry_backoff  # float: First retry delay in sec
+        self.timeout = timeout  # float: Connect/read timeout in sec
+        self.format = format  # string: Record format ('text', 'json')
+        self.sink = None  # HttpSink: HTTP sink for the URL
+
+
 class ForwarderConfig:
     """
     A data structure to keep the forwarder config in an optimized way.
@@ -72,6 +157,10 @@ class ForwarderConfig:
         Parameters:
           config_data (dict): Content of forwarder config file.
           config_filename (string): Path name of forwarder config file.
+
+        Raises:
+          ImproperExit: Invalid file destinations or HA intervals in the
+            forwarder config.
         """
         self.config_data = config_data
         self.config_filename = config_filename
@@ -87,32 +176,114 @@ class ForwarderConfig:
         #   forwarding:
         #     - syslogs:
         #        - server: 10.11.12.14
+        #       files:
+        #        - directory: /var/log/zhmc-os-forwarder
+        #       http_servers:
+        #        - url: https://10.11.12.15:8088/services/collector/raw
         #       cpcs:
         #         - cpc: CPC.*
         #           partitions:
         #             - partition: "dal1-.*"
+        #               weight: 4
+
+        # File destinations by normalized directory path name. A directory
+        # that is specified in multiple forwarding definitions is shared, so
+        # that its files are written and rotated by a single file sink.
+        file_infos = {}
 
         for fwd_item in forwarding:
             syslogs = []
-            for sl_item in fwd_item['syslogs']:
+            for sl_item in fwd_item.get('syslogs', []):
                 sl_host = sl_item['host']
                 sl_port = sl_item.get('port', DEFAULT_SYSLOG_PORT)
                 sl_port_type = sl_item.get('port_type',
                                            DEFAULT_SYSLOG_PORT_TYPE)
                 sl_facility = sl_item.get('facility', DEFAULT_SYSLOG_FACILITY)
+                sl_max_length = sl_item.get('max_length',
+                                            DEFAULT_SYSLOG_MAX_LENGTH)
+                sl_format = sl_item.get('format', DEFAULT_SYSLOG_FORMAT)
+                sl_header = sl_item.get('header', DEFAULT_SYSLOG_HEADER)
                 syslog_info = ConfigSyslogInfo(
-                    sl_host, sl_port, sl_port_type, sl_facility)
+                    sl_host, sl_port, sl_port_type, sl_facility, sl_max_length,
+                    sl_format, sl_header)
                 syslogs.append(syslog_info)
+            files = []
+            for file_item in fwd_item.get('files', []):
+                directory = file_item['directory']
+                if not os.path.isabs(directory):
+                    directory = os.path.join(
+                        os.path.dirname(config_filename), directory)
+                file_info = ConfigFileInfo(
+                    directory,
+                    file_item.get('per', DEFAULT_FILE_PER),
+                    file_item.get('max_size', DEFAULT_FILE_MAX_SIZE),
+                    file_item.get('rotate_interval',
+                                  DEFAULT_FILE_ROTATE_INTERVAL),
+                    file_item.get('compression', DEFAULT_FILE_COMPRESSION),
+                    file_item.get('flush_interval',
+                                  DEFAULT_FILE_FLUSH_INTERVAL),
+                    file_item.get('format', DEFAULT_FILE_FORMAT))
+                check_compression(file_info.compression, directory)
+                dir_key = os.path.normpath(directory)
+                shared_info = file_infos.get(dir_key)
+                if shared_info is None:
+                    file_infos[dir_key] = file_info
+                elif _file_props(shared_info) == _file_props(file_info):
+                    file_info = shared_info
+                else:
+                    raise ImproperExit(
+                        "File destinations for directory {d} in forwarder "
+                        "config file {f} have different properties".
+                        format(d=directory, f=config_filename))
+                files.append(file_info)
+            http_servers = []
+            for http_item in fwd_item.get('http_servers', []):
+                verify_cert = http_item.get('verify_cert', True)
+                if isinstance(verify_cert, str) and \
+                        not os.path.isabs(verify_cert):
+                    verify_cert = os.path.join(
+                        os.path.dirname(config_filename), verify_cert)
+                http_info = ConfigHttpInfo(
+                    http_item['url'],
+                    http_item.get('headers', {}),
+                    verify_cert,
+                    http_item.get('batch_max_count',
+                                  DEFAULT_HTTP_BATCH_MAX_COUNT),
+                    http_item.get('batch_max_bytes',
+                                  DEFAULT_HTTP_BATCH_MAX_BYTES),
+                    http_item.get('batch_max_delay',
+                                  DEFAULT_HTTP_BATCH_MAX_DELAY),
+                    http_item.get('compression', DEFAULT_HTTP_COMPRESSION),
+                    http_item.get('max_retries', DEFAULT_HTTP_MAX_RETRIES),
+                    http_item.get('retry_backoff',
+                                  DEFAULT_HTTP_RETRY_BACKOFF),
+                    http_item.get('timeout', DEFAULT_HTTP_TIMEOUT),
+                    http_item.get('format', DEFAULT_HTTP_FORMAT))
+                http_servers.append(http_info)
             for cpc_item in fwd_item['cpcs']:
                 cpc_pattern = re.compile('^{}$'.format(cpc_item['cpc']))
                 cpc_info = ConfigCpcInfo(cpc_pattern, [])
                 for lpar_item in cpc_item['partitions']:
                     lpar_pattern = re.compile(
                         '^{}$'.format(lpar_item['partition']))
-                    lpar_info = ConfigLparInfo(lpar_pattern, syslogs)
+                    lpar_info = ConfigLparInfo(
+                        lpar_pattern, syslogs, files, http_servers,
+                        lpar_item.get('weight', DEFAULT_LPAR_WEIGHT))
                     cpc_info.lpar_infos.append(lpar_info)
                 self.config_cpc_infos.append(cpc_info)
 
+        ha_data = self.config_data.get('ha')
+        if ha_data:
+            lease_time = ha_data.get('lease_time', DEFAULT_LEASE_TIME)
+            checkpoint_interval = ha_data.get(
+                'checkpoint_interval', DEFAULT_CHECKPOINT_INTERVAL)
+            if checkpoint_interval >= lease_time:
+                raise ImproperExit(
+                    "The checkpoint interval ({c} sec) in forwarder config "
+                    "file {f} must be less than the lease time ({t} sec)".
+                    format(c=checkpoint_interval, f=config_filename,
+                           t=lease_time))
+
     def __str__(self):
         return ("{s.__class__.__name__}("
                 "config_filename={s.config_filename!r}"
@@ -124,9 +295,9 @@ class ForwarderConfig:
                 "config_cpc_infos={s.config_cpc_infos!r}"
                 ")".format(s=self))
 
-    def get_syslogs(self, lpar):
+    def get_lpar_info(self, lpar):
         """
-        Get the syslogs for an LPAR if it matches the forwarder config.
+        Get the forwarding info for an LPAR if it matches the forwarder config.
 
         If it does not match the forwarder config, None is returned.
 
@@ -135,13 +306,81 @@ class ForwarderConfig:
             resource object.
 
         Returns:
-          list of ConfigSyslogInfo: List of syslogs if matching, or None
-          otherwise.
+          ConfigLparInfo: Info of the first matching LPAR pattern if
+          matching, or None otherwise.
         """
         cpc = lpar.manager.parent
         for cpc_info in self.config_cpc_infos:
             if cpc_info.cpc_pattern.match(cpc.name):
                 for lpar_info in cpc_info.lpar_infos:
                     if lpar_info.lpar_pattern.match(lpar.name):
-                        return lpar_info.syslogs
+                        return lpar_info
         return None
+
+    def get_syslogs(self, lpar):
+        """
+        Get the syslogs for an LPAR if it matches the forwarder config.
+
+        If it does not match the forwarder config, None is returned.
+
+        Parameters:
+          lpar (zhmcclient.Partition/Lpar): The LPAR, as a zhmcclient
+            resource object.
+
+        Returns:
+          list of ConfigSyslogInfo: List of syslogs if matching, or None
+          otherwise.
+        """
+        lpar_info = self.get_lpar_info(lpar)
+        if lpar_info is None:
+            return None
+        return lpar_info.syslogs
+
+    def get_files(self, lpar):
+        """
+        Get the file destinations for an LPAR if it matches the forwarder
+        config.
+
+        If it does not match the forwarder config, None is returned.
+
+        Parameters:
+          lpar (zhmcclient.Partition/Lpar): The LPAR, as a zhmcclient
+            resource object.
+
+        Returns:
+          list of ConfigFileInfo: List of file destinations if matching, or
+          None otherwise.
+        """
+        lpar_info = self.get_lpar_info(lpar)
+        if lpar_info is None:
+            return None
+        return lpar_info.files
+
+    def get_http_servers(self, lpar):
+        """
+        Get the HTTP server destinations for an LPAR if it matches the
+        forwarder config.
+
+        If it does not match the forwarder config, None is returned.
+
+        Parameters:
+          lpar (zhmcclient.Partition/Lpar): The LPAR, as a zhmcclient
+            resource object.
+
+        Returns:
+          list of ConfigHttpInfo: List of HTTP server destinations if
+          matching, or None otherwise.
+        """
+        lpar_info = self.get_lpar_info(lpar)
+        if lpar_info is None:
+            return None
+        return lpar_info.http_servers
+
+
+def _file_props(file_info):
+    """
+    Return the properties of a file destination that must be the same for
+    file destinations that share a directory.
+    """
+    return (file_info.per, file_info.max_size, file_info.rotate_interval,
+            file_info.compression, file_info.flush_interval, file_info.format)
@@ -19,49 +19,230 @@ A class for running the forwarder server
 """
 
 import os
+import time
+import math
 import logging
+import logging.handlers
 import socket
-from threading import Thread, Event
+import queue
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Event, Lock, RLock
 
 import zhmcclient
 
 from .forwarded_lpars import ForwardedLpars
+from .formatting import format_text_records, format_json_record, \
+    truncate_json_record, message_time, syslog_header, SYSLOG_HEADER_LENGTH
+from .file_sink import FileSink
+from .http_sink import HttpSink
+from .metrics import MetricsRegistry, bucket_quantile
+from .backfill import Backfiller, DEFAULT_BACKFILL_STARTUP_MESSAGES, \
+    DEFAULT_BACKFILL_MAX_MESSAGES, DEFAULT_BACKFILL_PAGE_SIZE, \
+    DEFAULT_BACKFILL_CONCURRENCY
+from .ha import Lease, Checkpoint, DEFAULT_LEASE_TIME, \
+    DEFAULT_CHECKPOINT_INTERVAL
+from .watchdog import Watchdog, DEFAULT_STALL_TIMEOUT, DEFAULT_MAX_PROBES
+from .error_aggregator import ErrorAggregator
+from .stage_timing import StageTimer, STAGES
+from .startup_timing import StartupTimer
+from .recording import Recorder, read_recording
+from .notification_receiver import NotificationReceiver
+from .delivery_queue import DeliveryQueue, delivery_class, PRIORITY_CLASS, \
+    NORMAL_CLASS
 from .utils import logprint, PRINT_ALWAYS, PRINT_V, PRINT_VV, \
-    RETRY_TIMEOUT_CONFIG
+    DEFAULT_STATS_INTERVAL, DEFAULT_NUM_RECEIVERS, ImproperExit, shard_index
 
+# Retry / timeout configuration for zhmcclient (used at the socket level)
+RETRY_TIMEOUT_CONFIG = zhmcclient.RetryTimeoutConfig(
+    connect_timeout=10,
+    connect_retries=2,
+    read_timeout=300,
+    read_retries=2,
+    max_redirects=zhmcclient.DEFAULT_MAX_REDIRECTS,
+    operation_timeout=zhmcclient.DEFAULT_OPERATION_TIMEOUT,
+    status_timeout=zhmcclient.DEFAULT_STATUS_TIMEOUT,
+    name_uri_cache_timetolive=zhmcclient.DEFAULT_NAME_URI_CACHE_TIMETOLIVE,
+)
 
+# Status values of partitions and LPARs in which their OS can issue OS messages
+ACTIVE_STATUSES = ('active', 'degraded', 'operating', 'exceptions')
+
+# Status values of partitions and LPARs in which their OS cannot issue OS
+# messages
+INACTIVE_STATUSES = ('stopped', 'terminated', 'not-activated',
+                     'not-operating')
+
+# Interval in seconds for retrying to open the OS message channel of an LPAR
+# that has been activated but whose OS does not support OS messages yet
+CHANNEL_RETRY_INTERVAL = 30
+
+# Time in seconds after the activation of an LPAR after which opening its OS
+# message channel is no longer retried
+CHANNEL_RETRY_TIME = 600
+
+# Maximum number of OS message channels that are opened in parallel
+CHANNEL_OPEN_CONCURRENCY = 8
+
+
+# pylint: disable=too-many-instance-attributes
 class ForwarderServer:
     """
     A forwarder server.
     """
 
-    def __init__(self, config_data, config_filename):
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, config_data, config_filename,
+                 stats_interval=DEFAULT_STATS_INTERVAL,
+                 num_receivers=DEFAULT_NUM_RECEIVERS, shard=None, worker=None,
+                 stage_timing=False, record=None):
         """
         Parameters:
           config_data (dict): Content of forwarder config file.
           config_filename (string): Path name of forwarder config file.
+          stats_interval (int): Interval in seconds for logging statistics,
+            or 0 for not logging statistics.
+          num_receivers (int): Maximum number of notification receivers,
+            each with its own forwarder thread.
+          shard (tuple(int, int)): Index and number of shards, if the LPARs
+            are distributed across multiple forwarder instances. In that
+            case, only the LPARs that belong to the shard of this instance are
+            forwarded.
+          worker (tuple(int, int)): Index and number of worker processes, if
+            running as a worker process of a supervisor. In that case, only
+            the LPARs assigned to this worker are forwarded.
+          stage_timing (bool): Enable measuring the duration of the stages of
+            the forwarding hot path. Can be toggled at runtime with
+            stage_timer.
+          record (string): Path name of a recording file to which the
+            received notifications are appended, or None for not recording.
         """
         self.config_data = config_data
         self.config_filename = config_filename
+        self.stats_interval = stats_interval
+        self.num_receivers = num_receivers
+        self.shard = shard
+        self.worker = worker
+        self.record = record
 
-        self.thread = Thread(target=self.run)  # forwarder thread
+        self.threads = []  # forwarder threads, one per receiver
         self.thread_started = False
-        self.stop_event = Event()  # Set event to stop forwarder thread
+        self.delivery_thread = Thread(target=self.run_delivery,
+                                      name='delivery')
+        self.stop_event = Event()  # Set event to stop forwarder threads
+        # time.monotonic() when the forwarder threads and the delivery thread
+        # started working on their current notification or OS message, by
+        # thread name, or None while waiting for work (see health())
+        self.busy_since = {}
 
         self.session = None  # zhmcclient.Session with the HMC
+        self.client = None  # zhmcclient.Client for the session
 
         self.all_cpcs = None  # List of all managed CPCs as zhmcclient.Cpc
-        self.all_lpars = None  # List of all partitions/LPARs as zhmcclient obj
 
         self.forwarded_lpars = None  # ForwardedLpars object
 
-        self.receiver = None  # NotificationReceiver
+        self.receivers = []  # NotificationReceiver objects
+        # time.monotonic() when the last notification was received, by
+        # receiver index
+        self.receiver_recv_times = []
         self.num_subscriptions = None
+        # Protects the subscriptions and the notification receivers of the
+        # LPARs
+        self._subscription_lock = RLock()
+        # Notification topic for status changes of the LPARs
+        self.object_topic = None
+
+        self.file_sinks = []  # FileSink objects, one per file destination
+        self.http_sinks = []  # HttpSink objects, one per HTTP destination
+        # ConfigSyslogInfo objects whose Python logger has been created
+        self.syslog_infos = []
+
+        self.metrics = MetricsRegistry()  # Metrics of the forwarder
+
+        # OS messages received but not yet delivered. The forwarder threads
+        # put them, and the delivery thread gets them, priority first and
+        # then in weighted round-robin order across LPARs.
+        self.delivery_queue = DeliveryQueue()
+        # Protects pending_seq_nos, delivered_early and delivered_seq_no of
+        # the LPARs
+        self._pending_lock = Lock()
+
+        # Histograms of the delivery latency, by delivery class
+        self.delivery_histograms = {
+            dclass: self.metrics.histogram(
+                'zhmc_os_forwarder_delivery_seconds',
+                "Time between the forwarder receiving an OS message and "
+                "delivering it to the destinations, in seconds",
+                labels={'class': dclass})
+            for dclass in (PRIORITY_CLASS, NORMAL_CLASS)
+        }
+
+        # Duration of the stages of the forwarding hot path, if enabled
+        self.stage_timer = StageTimer(self.metrics, enabled=stage_timing)
+
+        # Duration of the phases of the startup, reported when the forwarder
+        # has become active
+        self.startup_timer = StartupTimer(self.metrics)
+
+        self.backfiller = None  # Backfiller for gaps in sequence numbers
+
+        self.recorder = None  # Recorder of the notifications, if recording
+
+        # Errors delivering OS messages to destinations, reported periodically
+        self.error_aggregator = ErrorAggregator(self.metrics)
+        self.error_report_thread = Thread(
+            target=self._run_error_reports, daemon=True)
+
+        # Active/standby high availability
+        self.lease = None  # Lease, if configured
+        self.checkpoint = None  # Checkpoint, if configured
+        self.checkpoint_interval = DEFAULT_CHECKPOINT_INTERVAL
+        # Sequence numbers of the last delivered OS messages, by LPAR URI,
+        # as loaded from the checkpoint
+        self.checkpoint_seq_nos = {}
+        self.active = False  # Indicates that the forwarder is active
+        self.lease_lost = False  # Indicates that the lease has been lost
+        self.ha_thread = Thread(target=self._run_ha, daemon=True)
+        # Renews the lease, independently of activating the forwarder and
+        # saving the checkpoint
+        self.lease_thread = Thread(target=self._run_lease, daemon=True)
+        # Set event to stop the HA thread and the lease thread
+        self.ha_stop_event = Event()
+
+        self.watchdog = None  # Watchdog for stalled notifications, if enabled
+        self.watchdog_thread = Thread(target=self._run_watchdog, daemon=True)
+
+        # Status and inventory changes to be handled, as tuple(method, args).
+        # The forwarder threads put them, and the event thread gets them.
+        self.event_queue = queue.Queue()
+        self.event_thread = Thread(target=self._run_events, daemon=True)
+        # LPARs that have been activated but whose OS message channel could
+        # not be opened yet
+        # - key: LPAR URI
+        # - value: tuple(ForwardedLparInfo, time.monotonic() of activation)
+        self.pending_lpars = {}
+
+        self._logger_id = 0  # ID number used in Python logger name
+
+        self.stats_thread = Thread(target=self._run_stats, daemon=True)
+        self.stats_started = False
+        # Histogram snapshots at the last statistics logging
+        # - key: id of the histogram
+        # - value: list of bucket counts
+        self._last_stats_counts = {}
 
     def startup(self):
         """
-        Set up the forwarder server and start the forwarder thread.
+        Set up the forwarder server and start the forwarder threads.
+
+        If active/standby high availability is configured, the forwarder is
+        set up as a standby, and becomes active when it acquires the lease.
+
+        The duration of the phases of the startup is logged when the
+        forwarder has become active.
         """
+        startup_timer = self.startup_timer
 
         hmc_data = self.config_data['hmc']
         # hmc data structure in config file:
@@ -89,107 +270,971 @@ class ForwarderServer:
             hmc_data['password'],
             verify_cert=verify_cert,
             retry_timeout_config=RETRY_TIMEOUT_CONFIG)
+        with startup_timer.measure('logon'):
+            self.session.logon()
 
-        client = zhmcclient.Client(self.session)
+        self.client = zhmcclient.Client(self.session)
 
         logprint(logging.INFO, PRINT_V,
                  "Gathering information about CPCs and LPARs to forward")
-        self.all_cpcs = client.cpcs.list()
-        self.all_lpars = []
-        for cpc in self.all_cpcs:
-            dpm = cpc.prop('dpm-enabled')
-            if dpm:
-                self.all_lpars.extend(cpc.partitions.list())
-            else:
-                self.all_lpars.extend(cpc.lpars.list())
+        with startup_timer.measure('cpc_list'):
+            self.all_cpcs = self.client.cpcs.list()
 
+        # The workers of a forwarder instance are sub-shards of the shard of
+        # the instance.
+        shard_idx, num_shards = self.shard or (0, 1)
+        worker_idx, num_workers = self.worker or (0, 1)
+        if num_shards * num_workers > 1:
+            lpar_shard = (shard_idx * num_workers + worker_idx,
+                          num_shards * num_workers)
+        else:
+            lpar_shard = None
         self.forwarded_lpars = ForwardedLpars(
-            self.session, self.config_data, self.config_filename)
+            self.session, self.config_data, self.config_filename, lpar_shard)
 
-        for lpar in self.all_lpars:
-            cpc = lpar.manager.parent
-            added = self.forwarded_lpars.add_if_matching(lpar)
-            if added:
-                logprint(logging.INFO, PRINT_V,
-                         "LPAR {p!r} on CPC {c!r} will be forwarded".
-                         format(p=lpar.name, c=cpc.name))
+        if self.record:
+            try:
+                self.recorder = Recorder(
+                    self.record, self.forwarded_lpars.forwarded_lpar_infos)
+            except OSError as exc:
+                raise ImproperExit(
+                    f"Cannot open recording file: {exc}")
+            logprint(logging.INFO, PRINT_ALWAYS,
+                     "Recording the received notifications to {f}".
+                     format(f=self.record))
 
-        self.receiver = zhmcclient.NotificationReceiver(
-            [],  # self.session.object_topic to get notifications to ignore
-            hmc_data['host'],
-            hmc_data['userid'],
-            hmc_data['password'])
+        # Only the forwarded LPARs are kept, in compact form. The zhmcclient
+        # resource objects of the LPARs are released.
+        for cpc in self.all_cpcs:
+            with startup_timer.measure('lpar_list', cpc.name):
+                lpars = _list_lpars(cpc)
+            for lpar in lpars:
+                with startup_timer.measure('config_match'):
+                    added = self.forwarded_lpars.add_if_matching(lpar)
+                if added:
+                    logprint(logging.INFO, PRINT_V,
+                             "LPAR {p!r} on CPC {c!r} will be forwarded".
+                             format(p=lpar.name, c=cpc.name))
+
+        if lpar_shard:
+            logprint(logging.INFO, PRINT_V,
+                     "Forwarding {n} LPARs as shard {i} of {s}".
+                     format(n=len(self.forwarded_lpars.forwarded_lpar_infos),
+                            i=lpar_shard[0], s=lpar_shard[1]))
+
+        backfill_data = self.config_data.get('backfill', {})
+        # backfill data structure in config file:
+        #   backfill:
+        #     startup_messages: 100
+        #     max_messages: 1000
+        #     page_size: 500
+        #     concurrency: 4
+        self.backfiller = Backfiller(
+            self._enqueue, self.stop_event, self.metrics,
+            backfill_data.get('startup_messages',
+                              DEFAULT_BACKFILL_STARTUP_MESSAGES),
+            backfill_data.get('max_messages', DEFAULT_BACKFILL_MAX_MESSAGES),
+            backfill_data.get('page_size', DEFAULT_BACKFILL_PAGE_SIZE),
+            backfill_data.get('concurrency', DEFAULT_BACKFILL_CONCURRENCY))
+
+        ha_data = self.config_data.get('ha')
+        # ha data structure in config file:
+        #   ha:
+        #     lease_file: /shared/zhmc_os_forwarder.lease
+        #     checkpoint_file: /shared/zhmc_os_forwarder.checkpoint
+        #     lease_time: 10
+        #     checkpoint_interval: 1
+        if ha_data:
+            lease_file = self._shared_path(ha_data['lease_file'])
+            checkpoint_file = self._shared_path(ha_data.get(
+                'checkpoint_file', ha_data['lease_file'] + '.checkpoint'))
+            self.lease = Lease(
+                lease_file, ha_data.get('lease_time', DEFAULT_LEASE_TIME))
+            self.checkpoint = Checkpoint(checkpoint_file)
+            self.checkpoint_interval = ha_data.get(
+                'checkpoint_interval', DEFAULT_CHECKPOINT_INTERVAL)
+
+        watchdog_data = self.config_data.get('watchdog', {})
+        # watchdog data structure in config file:
+        #   watchdog:
+        #     stall_timeout: 300
+        #     max_probes: 10
+        stall_timeout = watchdog_data.get(
+            'stall_timeout', DEFAULT_STALL_TIMEOUT)
+        if stall_timeout:
+            self.watchdog = Watchdog(
+                self.metrics, stall_timeout,
+                watchdog_data.get('max_probes', DEFAULT_MAX_PROBES))
+
+        # The topics of the LPARs are distributed across the receivers by
+        # their LPAR URI. Each receiver has its own forwarder thread for
+        # receiving and decoding the notifications.
+        num_receivers = max(1, min(
+            self.num_receivers,
+            len(self.forwarded_lpars.forwarded_lpar_infos)))
+        logprint(logging.INFO, PRINT_VV,
+                 "Creating {n} notification receiver(s)".
+                 format(n=num_receivers))
+        # The first receiver receives the status changes of the LPARs, for
+        # opening the OS message channel of an LPAR when it is activated and
+        # closing it when it is deactivated, and the inventory changes, for
+        # handling added and removed CPCs and LPARs.
+        self.object_topic = self.session.object_topic
+        self.receivers = []
+        for index in range(num_receivers):
+            with startup_timer.measure('receiver_create', str(index)):
+                self.receivers.append(self._create_receiver(
+                    [self.object_topic] if index == 0 else []))
+        self.receiver_recv_times = [time.monotonic()] * num_receivers
 
-        self.num_subscriptions = 0
-        logger_id = 0  # ID number used in Python logger name
         for lpar_info in self.forwarded_lpars.forwarded_lpar_infos.values():
-            lpar = lpar_info.lpar
-            cpc = lpar.manager.parent
+            self._prepare_destinations(lpar_info)
 
-            logprint(logging.INFO, PRINT_VV,
-                     "Opening OS message channel for LPAR {p!r} on CPC {c!r}".
+        if self.stats_interval:
+            self.stats_thread.start()
+            self.stats_started = True
+
+        if self.lease:
+            logprint(logging.INFO, PRINT_ALWAYS,
+                     "Standby: Waiting for the lease {f}".
+                     format(f=self.lease.path))
+            self.startup_timer.begin_standby()
+            self.ha_thread.start()
+        else:
+            self.activate()
+            self._report_startup()
+
+    def activate(self):
+        """
+        Open the OS message channels of the forwarded LPARs, subscribe for
+        their notifications and start the forwarder threads.
+
+        If a checkpoint is used, the OS messages issued since the checkpoint
+        are retrieved from the HMC.
+        """
+        self.num_subscriptions = 0
+        if self.checkpoint:
+            self.checkpoint_seq_nos = self.checkpoint.load()
+        lpar_infos = list(self.forwarded_lpars.forwarded_lpar_infos.values())
+        for lpar_info in lpar_infos:
+            seq_no = self.checkpoint_seq_nos.get(lpar_info.uri)
+            if seq_no is not None:
+                lpar_info.next_seq_no = seq_no + 1
+        self._subscribe_all(lpar_infos)
+        for lpar_info in lpar_infos:
+            seq_no = self.checkpoint_seq_nos.get(lpar_info.uri)
+            if seq_no is not None and lpar_info.topic:
+                self.backfiller.resume(lpar_info, seq_no + 1)
+
+        self._start()
+        self.thread_started = True
+        self.active = True
+        if self.watchdog:
+            self.watchdog_thread.start()
+        self.event_thread.start()
+        self.error_report_thread.start()
+
+    def startup_replay(self):
+        """
+        Set up the forwarder server for replaying a recording of notifications
+        with replay(), and start the delivery thread.
+
+        The HMC is not contacted. The forwarded LPARs are added from the LPAR
+        records of the recording, when they are replayed. Gaps in the
+        sequence numbers of the OS messages are counted as missing OS
+        messages, since they cannot be retrieved from the HMC.
+        """
+        # Offline session for creating the zhmcclient resource objects of the
+        # LPARs, which are needed for matching them against the forwarder
+        # config. It is never logged on.
+        self.client = zhmcclient.Client(zhmcclient.Session('replay'))
+        self.forwarded_lpars = ForwardedLpars(
+            None, self.config_data, self.config_filename)
+        self.backfiller = Backfiller(
+            self._enqueue, self.stop_event, self.metrics,
+            startup_messages=0, max_messages=0)
+        if self.stats_interval:
+            self.stats_thread.start()
+            self.stats_started = True
+        self._start()
+        self.thread_started = True
+        self.error_report_thread.start()
+
+    def replay(self, filename, speed=1.0):
+        """
+        Replay the notifications of a recording file into the forwarding
+        pipeline, and wait until their OS messages have been delivered.
+
+        Only OS message notifications are replayed, since the other
+        notifications (status and inventory changes) would require the HMC.
+        startup_replay() must have been called before.
+
+        Parameters:
+          filename (string): Path name of the recording file.
+          speed (float): Replay speed relative to the original speed, or 0 for
+            replaying as fast as possible.
+
+        Returns:
+          dict: Statistics of the replay, with items 'notifications',
+          'messages' and 'skipped' (int: number of replayed notifications,
+          OS messages in them, and notifications that were not replayed),
+          and 'duration' (float: duration of the replay in seconds, including
+          the delivery).
+
+        Raises:
+          ImproperExit: Error reading the recording file.
+        """
+        logprint(logging.INFO, PRINT_ALWAYS,
+                 "Replaying recording file {f} at {s}".
+                 format(f=filename,
+                        s=f'{speed}x speed' if speed else 'maximum speed'))
+        num_notifications = 0
+        num_messages = 0
+        num_skipped = 0
+        start_time = time.monotonic()
+        # Recording time and replay time of the start of the current part
+        # of the recording. Parts appended by different forwarder runs are
+        # replayed without the time between the runs.
+        base_times = None
+        try:
+            for record in read_recording(filename):
+                if 'lpar' in record:
+                    self._add_replayed_lpar(record['lpar'])
+                    continue
+                if 'recording' in record:
+                    base_times = None
+                    continue
+                if speed:
+                    if base_times is None:
+                        base_times = (record['time'], time.monotonic())
+                    due_time = base_times[1] + \
+                        (record['time'] - base_times[0]) / speed
+                    delay = due_time - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                headers = record['headers']
+                if headers.get('notification-type') != 'os-message':
+                    num_skipped += 1
+                    continue
+                self.handle_notification(headers, record['message'])
+                num_notifications += 1
+                num_messages += len(record['message']['os-messages'])
+        except OSError as exc:
+            raise ImproperExit(f"Cannot read recording file: {exc}")
+        finally:
+            # Wait until all replayed OS messages have been delivered
+            self._stop()
+            self.thread_started = False
+            self.error_aggregator.report()
+        duration = time.monotonic() - start_time
+        logprint(logging.INFO, PRINT_ALWAYS,
+                 "Replayed {n} notifications with {m} OS messages in {t:.3f} "
+                 "sec ({r:.0f} OS messages/sec); skipped {k} other "
+                 "notifications".
+                 format(n=num_notifications, m=num_messages, t=duration,
+                        r=num_messages / duration if duration else 0,
+                        k=num_skipped))
+        return {
+            'notifications': num_notifications,
+            'messages': num_messages,
+            'skipped': num_skipped,
+            'duration': duration,
+        }
+
+    def _add_replayed_lpar(self, lpar_record):
+        """
+        Add an LPAR from an LPAR record of a recording, if it matches the
+        forwarder config.
+        """
+        cpc = self.client.cpcs.resource_object(
+            lpar_record['cpc-uri'], {'name': lpar_record['cpc-name']})
+        manager = cpc.partitions if lpar_record['class'] == 'partition' \
+            else cpc.lpars
+        lpar = manager.resource_object(
+            lpar_record['uri'], {'name': lpar_record['name']})
+        if self.forwarded_lpars.add_if_matching(lpar):
+            lpar_info = self.forwarded_lpars.forwarded_lpar_infos[lpar.uri]
+            self._prepare_destinations(lpar_info)
+            logprint(logging.INFO, PRINT_V,
+                     "LPAR {p!r} on CPC {c!r} will be forwarded".
                      format(p=lpar.name, c=cpc.name))
+
+    def _report_startup(self):
+        """
+        Finish the measurement of the startup phases and log them.
+        """
+        self.startup_timer.finish()
+        self.startup_timer.report()
+
+    def _prepare_destinations(self, lpar_info):
+        """
+        Prepare the destinations of a forwarded LPAR and its lag histogram.
+        """
+        lpar_info.lag_histogram = self.metrics.histogram(
+            'zhmc_os_forwarder_lag_seconds',
+            "Time between the OS issuing a message and the forwarder "
+            "delivering it to the destinations, in seconds",
+            labels={'cpc': lpar_info.cpc_name, 'lpar': lpar_info.name})
+
+        # Prepare sending to syslogs by creating Python loggers
+        for syslog in lpar_info.syslogs:
+            if syslog.logger:
+                continue  # Shared with an LPAR prepared before
             try:
-                os_topic = lpar.open_os_message_channel(
-                    include_refresh_messages=True)
-            except zhmcclient.HTTPError as exc:
-                if exc.http_status == 409 and exc.reason == 331:
-                    # OS message channel is already open for this session,
-                    # reuse its notification topic.
-                    topic_dicts = self.session.get_notification_topics()
-                    os_topic = None
-                    for topic_dict in topic_dicts:
-                        if topic_dict['topic-type'] != \
-                                'os-message-notification':
-                            continue
-                        obj_uri = topic_dict['object-uri']
-                        if lpar.uri == obj_uri:
-                            os_topic = topic_dict['topic-name']
-                            logprint(logging.INFO, PRINT_VV,
-                                     "Using existing OS message notification "
-                                     "topic {t!r} for LPAR {p!r} on CPC {c!r}".
-                                     format(t=os_topic, p=lpar.name,
-                                            c=cpc.name))
-                            break
-                    if os_topic is None:
-                        raise RuntimeError(
-                            "An OS message notification topic for LPAR {p!r} "
-                            "on CPC {c!r} supposedly exists, but cannot be "
-                            "found in the existing topics for this session: "
-                            "{t}".
-                            format(p=lpar.name, c=cpc.name, t=topic_dicts))
-                elif exc.http_status == 409 and exc.reason == 332:
-                    # The OS does not support OS messages.
+                with self.startup_timer.measure(
+                        'syslog_setup', f'{syslog.host}:{syslog.port}'):
+                    logger = self._create_logger(syslog, self._logger_id)
+            except ConnectionError as exc:
+                logprint(logging.WARNING, PRINT_ALWAYS,
+                         f"Warning: Skipping syslog server: {exc}")
+                continue
+            self._logger_id += 1
+            syslog.logger = logger
+            self.syslog_infos.append(syslog)
+
+        # Prepare writing to files by creating file sinks. File
+        # destinations are shared by the LPARs of a forwarding definition.
+        for file_info in lpar_info.files:
+            if file_info.sink is None:
+                try:
+                    file_info.sink = self._create_file_sink(file_info)
+                except OSError as exc:
                     logprint(logging.WARNING, PRINT_ALWAYS,
-                             "Warning: The OS in LPAR {p!r} on CPC {c!r} does "
-                             "not support OS messages - ignoring the LPAR".
-                             format(p=lpar.name, c=cpc.name))
-                    os_topic = None
-                else:
-                    raise
-
-            if os_topic:
-                logprint(logging.INFO, PRINT_VV,
-                         "Subscribing for OS message notifications for LPAR "
-                         "{p!r} on CPC {c!r} (topic: {t})".
-                         format(p=lpar.name, c=cpc.name, t=os_topic))
-                self.receiver.subscribe(os_topic)
+                             "Warning: Skipping file destination: {}".
+                             format(exc))
+                    continue
+
+        # Prepare sending to HTTP servers by creating HTTP sinks. HTTP
+        # destinations are shared by the LPARs of a forwarding definition.
+        for http_info in lpar_info.http_servers:
+            if http_info.sink is None:
+                http_info.sink = self._create_http_sink(http_info)
+
+    def _subscribe_all(self, lpar_infos):
+        """
+        Open the OS message channels of forwarded LPARs in parallel and
+        subscribe for their notifications.
+
+        Raises:
+          zhmcclient.Error: Error opening an OS message channel.
+        """
+        if not lpar_infos:
+            return
+        num_threads = min(CHANNEL_OPEN_CONCURRENCY, len(lpar_infos))
+        with self.startup_timer.measure('subscribe_all'), \
+                ThreadPoolExecutor(max_workers=num_threads,
+                                   thread_name_prefix='subscribe') as executor:
+            # Consuming the results raises the first exception, if any
+            list(executor.map(self._subscribe, lpar_infos))
+
+    def _shared_path(self, path):
+        """
+        Return the path name of a file shared by the active and standby
+        forwarders. Relative path names are relative to the directory of the
+        forwarder config file. When the LPARs are distributed across shards or
+        worker processes, the index of the shard is appended.
+        """
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(self.config_filename), path)
+        if self.forwarded_lpars.shard:
+            path = '{p}.{i}'.format(p=path, i=self.forwarded_lpars.shard[0])
+        return path
+
+    def _run_ha(self):
+        """
+        The method running as the HA thread.
+
+        Waits until the lease is acquired, starts the lease thread for
+        renewing the lease, activates the forwarder, and then saves the
+        checkpoint periodically. If the lease is lost, the thread ends. If
+        activating the forwarder or saving the checkpoint fails unexpectedly,
+        the lease is released, lease_lost is set and the thread ends, so that
+        a standby forwarder takes over.
+        """
+        while True:
+            try:
+                if self.lease.acquire():
+                    break
+            except OSError as exc:
+                logprint(logging.ERROR, PRINT_ALWAYS,
+                         "Error acquiring the lease {f}: {m}".
+                         format(f=self.lease.path, m=exc))
+            if self.ha_stop_event.wait(1):
+                return
+
+        logprint(logging.INFO, PRINT_ALWAYS,
+                 "Acquired the lease {f}; becoming active".
+                 format(f=self.lease.path))
+        self.startup_timer.end_standby()
+        self.lease_thread.start()
+        try:
+            start_time = time.monotonic()
+            self.activate()
+            logprint(logging.INFO, PRINT_ALWAYS,
+                     "Forwarder is active after {t:.1f} sec "
+                     "(subscriptions: {n})".
+                     format(t=time.monotonic() - start_time,
+                            n=self.num_subscriptions))
+            self._report_startup()
+            while not self.ha_stop_event.wait(self.checkpoint_interval):
+                if self.lease_lost:
+                    return
+                self.save_checkpoint()
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            logprint(logging.ERROR, PRINT_ALWAYS,
+                     "Error in active forwarder: {e}: {m}; releasing the "
+                     "lease {f}".
+                     format(e=exc.__class__.__name__, m=exc,
+                            f=self.lease.path))
+            self.lease_lost = True
+            self.ha_stop_event.set()
+            self.lease_thread.join()
+            self.lease.release()
+
+    def _run_lease(self):
+        """
+        The method running as the lease thread.
+
+        Renews the lease every third of the lease time, while the forwarder
+        is being activated and while it is active. If the lease has been
+        acquired by another forwarder or could not be renewed within the
+        lease time, lease_lost is set and the thread ends.
+        """
+        renew_interval = self.lease.lease_time / 3
+        renew_time = time.monotonic()  # Time of the last renewal
+        while not self.ha_stop_event.wait(renew_interval):
+            try:
+                if self.lease.renew():
+                    renew_time = time.monotonic()
+                    continue
+                logprint(logging.ERROR, PRINT_ALWAYS,
+                         "Error: The lease {f} has been acquired by {h}".
+                         format(f=self.lease.path,
+                                h=self.lease.current_holder()))
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logprint(logging.ERROR, PRINT_ALWAYS,
+                         "Error renewing the lease {f}: {e}: {m}".
+                         format(f=self.lease.path,
+                                e=exc.__class__.__name__, m=exc))
+                if time.monotonic() - renew_time < self.lease.lease_time:
+                    continue
+                logprint(logging.ERROR, PRINT_ALWAYS,
+                         "Error: The lease {f} could not be renewed within "
+                         "the lease time", f=self.lease.path)
+            self.lease_lost = True
+            return
+
+    def save_checkpoint(self):
+        """
+        Save the sequence numbers of the last delivered OS messages to the
+        checkpoint, if a checkpoint is used.
+        """
+        if not self.checkpoint or not self.active or self.lease_lost:
+            return
+        seq_nos = dict(self.checkpoint_seq_nos)
+        # The event thread adds and removes forwarded LPARs in the meantime
+        for lpar_uri, lpar_info in \
+                list(self.forwarded_lpars.forwarded_lpar_infos.items()):
+            seq_no = self._checkpoint_seq_no(lpar_info)
+            if seq_no is not None:
+                seq_nos[lpar_uri] = seq_no
+        try:
+            self.checkpoint.save(seq_nos)
+        except OSError as exc:
+            logprint(logging.ERROR, PRINT_ALWAYS,
+                     "Error saving the checkpoint {f}: {m}".
+                     format(f=self.checkpoint.path, m=exc))
+
+    def _checkpoint_seq_no(self, lpar_info):
+        """
+        Return the sequence number up to which all OS messages of an LPAR
+        have been delivered, for the checkpoint.
+
+        That is the sequence number of the last delivered OS message, limited
+        by the OS messages of the LPAR that are still in the delivery queue
+        or that have been spilled (see Backfiller). OS messages that were
+        delivered ahead of them (i.e. priority OS messages) may be delivered
+        again after a failover.
+
+        Returns:
+          int: The sequence number, or None if no OS message of the LPAR has
+          been delivered.
+        """
+        with self._pending_lock:
+            seq_no = lpar_info.delivered_seq_no
+            if seq_no is None:
+                return None
+            if lpar_info.pending_seq_nos:
+                seq_no = min(seq_no, lpar_info.pending_seq_nos[0] - 1)
+        spilled_seq_no = lpar_info.spilled_seq_no
+        if spilled_seq_no is not None:
+            seq_no = min(seq_no, spilled_seq_no - 1)
+        return seq_no
+
+    def _subscribe(self, lpar_info, retry=False):
+        """
+        Open the OS message channel of a forwarded LPAR and subscribe for its
+        notifications.
+
+        Parameters:
+          lpar_info (ForwardedLparInfo): The forwarded LPAR.
+          retry (bool): Indicates that opening the OS message channel is
+            retried, so that an OS that does not support OS messages is not
+            reported as a warning again.
+        """
+        logprint(logging.INFO, PRINT_VV,
+                 "Opening OS message channel for LPAR {p!r} on CPC {c!r}",
+                 p=lpar_info.name, c=lpar_info.cpc_name)
+        startup_timer = self.startup_timer
+        lpar_item = f'{lpar_info.cpc_name}/{lpar_info.name}'
+        start_time = time.monotonic()
+        try:
+            # OS messages issued before startup are retrieved by the
+            # backfiller, if configured.
+            os_topic = lpar_info.lpar.open_os_message_channel(
+                include_refresh_messages=False)
+        except zhmcclient.HTTPError as exc:
+            if exc.http_status == 409 and exc.reason == 331:
+                # OS message channel is already open for this session,
+                # reuse its notification topic.
+                with startup_timer.measure('topic_lookup', lpar_item):
+                    topic_dicts = self.session.get_notification_topics()
+                os_topic = None
+                for topic_dict in topic_dicts:
+                    if topic_dict['topic-type'] != \
+                            'os-message-notification':
+                        continue
+                    obj_uri = topic_dict['object-uri']
+                    if lpar_info.uri == obj_uri:
+                        os_topic = topic_dict['topic-name']
+                        logprint(logging.INFO, PRINT_VV,
+                                 "Using existing OS message notification "
+                                 "topic {t!r} for LPAR {p!r} on CPC {c!r}",
+                                 t=os_topic, p=lpar_info.name,
+                                 c=lpar_info.cpc_name)
+                        break
+                if os_topic is None:
+                    raise RuntimeError(
+                        "An OS message notification topic for LPAR {p!r} "
+                        "on CPC {c!r} supposedly exists, but cannot be "
+                        "found in the existing topics for this session: "
+                        "{t}".
+                        format(p=lpar_info.name, c=lpar_info.cpc_name,
+                               t=topic_dicts))
+            elif exc.http_status == 409 and exc.reason == 332:
+                # The OS does not support OS messages, e.g. because the LPAR
+                # is not active.
+                logprint(logging.WARNING, PRINT_VV if retry else PRINT_ALWAYS,
+                         "Warning: The OS in LPAR {p!r} on CPC {c!r} does "
+                         "not support OS messages - forwarding starts when "
+                         "the LPAR is active and its OS supports OS messages",
+                         p=lpar_info.name, c=lpar_info.cpc_name)
+                os_topic = None
+            else:
+                raise
+        finally:
+            startup_timer.record(
+                'channel_open', time.monotonic() - start_time, lpar_item)
+
+        if os_topic:
+            logprint(logging.INFO, PRINT_VV,
+                     "Subscribing for OS message notifications for LPAR "
+                     "{p!r} on CPC {c!r} (topic: {t})",
+                     p=lpar_info.name, c=lpar_info.cpc_name, t=os_topic)
+            with self._subscription_lock:
+                receiver = self.receivers[self._receiver_index(lpar_info)]
+                with startup_timer.measure('subscribe', lpar_item):
+                    receiver.add_topic(os_topic)
                 lpar_info.topic = os_topic
+                lpar_info.receiver = receiver
+                lpar_info.recv_time = time.monotonic()
                 self.num_subscriptions += 1
 
-            # Prepare sending to syslogs by creating Python loggers
-            for syslog in self.forwarded_lpars.get_syslogs(lpar):
+    def _receiver_index(self, lpar_info):
+        """
+        Return the index of the notification receiver of a forwarded LPAR.
+
+        The LPARs are distributed across the notification receivers
+        independently of their distribution across shards and worker
+        processes, so that the LPARs of each shard use all receivers.
+        """
+        return shard_index(lpar_info.uri, len(self.receivers), 'receiver')
+
+    def _unsubscribe(self, lpar_info):
+        """
+        Unsubscribe from the notifications of a forwarded LPAR.
+
+        The HMC has no operation for closing an OS message channel; the
+        channel is closed when the session ends.
+        """
+        with self._subscription_lock:
+            logprint(logging.INFO, PRINT_VV,
+                     "Unsubscribing OS message channel for LPAR {p!r} "
+                     "on CPC {c!r} (topic: {t})",
+                     p=lpar_info.name, c=lpar_info.cpc_name,
+                     t=lpar_info.topic)
+            try:
+                lpar_info.receiver.remove_topic(lpar_info.topic)
+            except zhmcclient.Error as exc:
+                logprint(logging.ERROR, PRINT_ALWAYS,
+                         "Error unsubscribing OS message channel for "
+                         "LPAR {p!r} on CPC {c!r} (topic: {t}): {m}".
+                         format(p=lpar_info.name, c=lpar_info.cpc_name,
+                                t=lpar_info.topic, m=exc))
+            lpar_info.topic = None
+            lpar_info.receiver = None
+            self.num_subscriptions -= 1
+
+    def _run_events(self):
+        """
+        The method running as the event thread.
+
+        Handles the status changes and inventory changes received by the
+        forwarder threads, and periodically retries opening the OS message
+        channels of activated LPARs whose OS did not support OS messages yet.
+        """
+        retry_time = time.monotonic() + CHANNEL_RETRY_INTERVAL
+        while True:
+            timeout = max(retry_time - time.monotonic(), 0)
+            try:
+                entry = self.event_queue.get(timeout=timeout)
+            except queue.Empty:
+                entry = ()
+            if entry is None:
+                break  # Stop request
+            try:
+                if entry:
+                    method, args = entry
+                    method(*args)
+                if time.monotonic() >= retry_time:
+                    retry_time = time.monotonic() + CHANNEL_RETRY_INTERVAL
+                    self._retry_pending_lpars()
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logprint(logging.ERROR, PRINT_ALWAYS,
+                         "Error handling status or inventory change: {e}: "
+                         "{m}", e=exc.__class__.__name__, m=exc)
+
+    def status_changed(self, lpar_info, status):
+        """
+        Open the OS message channel of a forwarded LPAR that has been
+        activated, or unsubscribe from the notifications of a forwarded LPAR
+        that has been deactivated.
+
+        Parameters:
+          lpar_info (ForwardedLparInfo): The forwarded LPAR.
+          status (string): New value of the 'status' property of the LPAR.
+        """
+        if status in ACTIVE_STATUSES:
+            if lpar_info.topic or lpar_info.uri in self.pending_lpars:
+                return
+            logprint(logging.INFO, PRINT_ALWAYS,
+                     "LPAR {p!r} on CPC {c!r} has been activated (status: "
+                     "{s}); starting to forward its OS messages".
+                     format(p=lpar_info.name, c=lpar_info.cpc_name, s=status))
+            self._subscribe(lpar_info)
+            if not lpar_info.topic:
+                self.pending_lpars[lpar_info.uri] = (
+                    lpar_info, time.monotonic())
+        elif status in INACTIVE_STATUSES:
+            self.pending_lpars.pop(lpar_info.uri, None)
+            if not lpar_info.topic:
+                return
+            logprint(logging.INFO, PRINT_ALWAYS,
+                     "LPAR {p!r} on CPC {c!r} has been deactivated (status: "
+                     "{s}); stopping to forward its OS messages".
+                     format(p=lpar_info.name, c=lpar_info.cpc_name, s=status))
+            self._unsubscribe(lpar_info)
+            # The sequence numbers restart when the OS is started again
+            self.backfiller.reset(lpar_info)
+
+    def inventory_changed(self, action, obj_class, obj_uri):
+        """
+        Start forwarding the matching LPARs of a CPC or the LPAR that has been
+        added to the HMC, or stop forwarding the LPARs of a CPC or the LPAR
+        that has been removed from the HMC.
+
+        Parameters:
+          action (string): 'add' or 'remove'.
+          obj_class (string): Class of the added or removed object.
+          obj_uri (string): URI of the added or removed object.
+        """
+        lpar_infos = list(self.forwarded_lpars.forwarded_lpar_infos.values())
+        if obj_class == 'cpc':
+            if action == 'add':
+                self._add_cpc(obj_uri)
+            elif action == 'remove':
+                self._remove_lpars(
+                    [lpar_info for lpar_info in lpar_infos
+                     if lpar_info.cpc_uri == obj_uri])
+                self.all_cpcs = [
+                    cpc for cpc in self.all_cpcs if cpc.uri != obj_uri]
+        elif obj_class in ('partition', 'logical-partition'):
+            if action == 'add':
+                self._add_lpar(obj_uri)
+            elif action == 'remove':
+                self._remove_lpars(
+                    [lpar_info for lpar_info in lpar_infos
+                     if lpar_info.uri == obj_uri])
+
+    def _add_cpc(self, cpc_uri):
+        """
+        Start forwarding the matching LPARs of a CPC that has been added to
+        the HMC.
+        """
+        if any(cpc.uri == cpc_uri for cpc in self.all_cpcs):
+            return
+        cpc = self.client.cpcs.resource_object(cpc_uri)
+        cpc.pull_full_properties()
+        logprint(logging.INFO, PRINT_ALWAYS,
+                 "CPC {c!r} has been added to the HMC", c=cpc.name)
+        self.all_cpcs.append(cpc)
+        self._add_lpars(_list_lpars(cpc))
+
+    def _add_lpar(self, lpar_uri):
+        """
+        Start forwarding an LPAR that has been added to the HMC, if it
+        matches.
+        """
+        if lpar_uri in self.forwarded_lpars.forwarded_lpar_infos:
+            return
+        props = self.session.get(lpar_uri)
+        for cpc in self.all_cpcs:
+            if cpc.uri == props['parent']:
+                if cpc.prop('dpm-enabled'):
+                    manager = cpc.partitions
+                else:
+                    manager = cpc.lpars
+                self._add_lpars([manager.resource_object(lpar_uri, props)])
+                break
+
+    def _add_lpars(self, lpars):
+        """
+        Start forwarding the matching LPARs of LPARs that have been added to
+        the HMC.
+        """
+        lpar_infos = []
+        for lpar in lpars:
+            if self.forwarded_lpars.add_if_matching(lpar):
+                logprint(logging.INFO, PRINT_ALWAYS,
+                         "LPAR {p!r} on CPC {c!r} will be forwarded".
+                         format(p=lpar.name, c=lpar.manager.parent.name))
+                lpar_info = self.forwarded_lpars.forwarded_lpar_infos[
+                    lpar.uri]
+                self._prepare_destinations(lpar_info)
+                lpar_infos.append(lpar_info)
+        self._subscribe_all(lpar_infos)
+
+    def _remove_lpars(self, lpar_infos):
+        """
+        Stop forwarding forwarded LPARs that have been removed from the HMC.
+        """
+        for lpar_info in lpar_infos:
+            logprint(logging.INFO, PRINT_ALWAYS,
+                     "LPAR {p!r} on CPC {c!r} has been removed from the HMC; "
+                     "stopping to forward its OS messages".
+                     format(p=lpar_info.name, c=lpar_info.cpc_name))
+            if lpar_info.topic:
+                self._unsubscribe(lpar_info)
+            self.pending_lpars.pop(lpar_info.uri, None)
+            self.forwarded_lpars.remove(lpar_info)
+            # Release the per-LPAR resources, so that they do not accumulate
+            # when LPARs are added and removed over time
+            if lpar_info.lag_histogram is not None:
+                self.metrics.remove(lpar_info.lag_histogram)
+                self._last_stats_counts.pop(id(lpar_info.lag_histogram), None)
+                lpar_info.lag_histogram = None
+            if lpar_info.files:
+                # The files are closed by the delivery thread, after the OS
+                # messages of the LPAR that are still waiting for delivery
+                # have been written. If the delivery queue has been closed,
+                # the file sinks are closed at shutdown.
+                self.delivery_queue.put(
+                    (lpar_info, None, time.monotonic()), NORMAL_CLASS,
+                    lpar_info.uri, lpar_info.weight, force=True)
+
+    @staticmethod
+    def _close_files(lpar_info):
+        """
+        Close the files of a forwarded LPAR that has been removed from the
+        HMC. Called by the delivery thread, when the OS messages of the LPAR
+        that were waiting for delivery when it was removed have been written.
+        OS messages of the LPAR put into the delivery queue after that are no
+        longer written to files, so that the files are not opened again.
+        """
+        files = lpar_info.files
+        lpar_info.files = []
+        for file_info in files:
+            if file_info.sink is not None:
                 try:
-                    logger = self._create_logger(syslog, logger_id)
-                except ConnectionError as exc:
+                    file_info.sink.close_file(
+                        lpar_info.cpc_name, lpar_info.name)
+                except OSError as exc:
                     logprint(logging.WARNING, PRINT_ALWAYS,
-                             f"Warning: Skipping syslog server: {exc}")
-                    continue
-                logger_id += 1
-                syslog.logger = logger
+                             "Warning: Cannot close file of LPAR {p!r} "
+                             "in directory {d}: {m}",
+                             p=lpar_info.name,
+                             d=file_info.sink.directory, m=exc)
 
-        self._start()
-        self.thread_started = True
+    def _retry_pending_lpars(self):
+        """
+        Retry opening the OS message channels of the activated LPARs whose OS
+        did not support OS messages yet.
+        """
+        now = time.monotonic()
+        for lpar_uri, (lpar_info, activate_time) in \
+                list(self.pending_lpars.items()):
+            self._subscribe(lpar_info, retry=True)
+            if lpar_info.topic:
+                del self.pending_lpars[lpar_uri]
+            elif now - activate_time >= CHANNEL_RETRY_TIME:
+                logprint(logging.WARNING, PRINT_ALWAYS,
+                         "Warning: The OS in LPAR {p!r} on CPC {c!r} does "
+                         "not support OS messages {t} sec after the LPAR "
+                         "was activated - ignoring the LPAR until it is "
+                         "activated again".
+                         format(p=lpar_info.name, c=lpar_info.cpc_name,
+                                t=CHANNEL_RETRY_TIME))
+                del self.pending_lpars[lpar_uri]
+
+    def _create_receiver(self, topics):
+        """
+        Create a notification receiver for the HMC, that subscribes for the
+        specified topics when it connects.
+        """
+        hmc_data = self.config_data['hmc']
+        return NotificationReceiver(
+            topics,
+            hmc_data['host'],
+            hmc_data['userid'],
+            hmc_data['password'],
+            self._subscription_lock)
+
+    def _run_watchdog(self):
+        """
+        The method running as the watchdog thread.
+
+        Periodically checks the connections of the notification receivers and
+        probes the LPARs without notifications. Notification receivers that
+        stay disconnected or that have stalled are rebuilt. LPARs whose
+        notifications have stalled while their notification receiver still
+        receives notifications for other LPARs are subscribed again. The OS
+        messages missed during a stall are retrieved from the HMC.
+        """
+        disconnected = set()  # Indexes of receivers disconnected at last check
+        while not self.stop_event.wait(self.watchdog.check_interval):
+            try:
+                self._check_receivers(disconnected)
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logprint(logging.ERROR, PRINT_ALWAYS,
+                         "Error in watchdog: {e}: {m}".
+                         format(e=exc.__class__.__name__, m=exc))
+
+    def _check_receivers(self, disconnected):
+        """
+        Perform one check of the watchdog.
+
+        Parameters:
+          disconnected (set of int): Indexes of the receivers that were
+            disconnected at the last check. Updated by this method.
+        """
+        now = time.monotonic()
+        rebuild = set()
+        for index, receiver in enumerate(self.receivers):
+            if receiver.is_connected():
+                disconnected.discard(index)
+            elif index in disconnected:
+                logprint(logging.WARNING, PRINT_ALWAYS,
+                         "Warning: Notification receiver {i} has not been "
+                         "connected to the HMC for {t} sec".
+                         format(i=index, t=self.watchdog.check_interval))
+                rebuild.add(index)
+            else:
+                disconnected.add(index)
+
+        lpar_infos = list(self.forwarded_lpars.forwarded_lpar_infos.values())
+        for lpar_info in self.watchdog.check(lpar_infos, now):
+            index = self._receiver_index(lpar_info)
+            if now - self.receiver_recv_times[index] >= \
+                    self.watchdog.stall_timeout:
+                # No notifications for any LPAR of the receiver
+                rebuild.add(index)
+            elif index not in rebuild and not self._resubscribe(lpar_info):
+                rebuild.add(index)
+
+        for index in sorted(rebuild):
+            disconnected.discard(index)
+            self._rebuild_receiver(index)
+
+    def _resubscribe(self, lpar_info):
+        """
+        Subscribe again for the notifications of a forwarded LPAR on its
+        notification receiver, and retrieve the missed OS messages.
+
+        Returns:
+          bool: Indicates whether the LPAR has been subscribed again.
+        """
+        logprint(logging.WARNING, PRINT_ALWAYS,
+                 "Subscribing again for OS message notifications for LPAR "
+                 "{p!r} on CPC {c!r}".
+                 format(p=lpar_info.name, c=lpar_info.cpc_name))
+        self.watchdog.resubscriptions_counter.inc()
+        with self._subscription_lock:
+            receiver = lpar_info.receiver
+            if receiver is None:
+                return True  # Unsubscribed in the meantime
+            try:
+                receiver.unsubscribe(lpar_info.topic)
+            except zhmcclient.Error:
+                pass  # The subscription may have been lost on the HMC
+            try:
+                receiver.subscribe(lpar_info.topic)
+            except zhmcclient.Error as exc:
+                logprint(logging.ERROR, PRINT_ALWAYS,
+                         "Error subscribing again for LPAR {p!r}: {m}".
+                         format(p=lpar_info.name, m=exc))
+                return False
+            lpar_info.recv_time = time.monotonic()
+        self.backfiller.resume(lpar_info, lpar_info.next_seq_no)
+        return True
+
+    def _rebuild_receiver(self, index):
+        """
+        Replace a notification receiver with a new one that subscribes for the
+        same topics, and retrieve the OS messages missed by its LPARs.
+
+        The forwarder thread of the receiver continues with the new receiver
+        when the old receiver has been closed.
+        """
+        with self._subscription_lock:
+            old_receiver = self.receivers[index]
+            lpar_infos = [
+                lpar_info for lpar_info in
+                list(self.forwarded_lpars.forwarded_lpar_infos.values())
+                if lpar_info.receiver is old_receiver]
+            logprint(logging.WARNING, PRINT_ALWAYS,
+                     "Rebuilding notification receiver {i} for {n} LPARs".
+                     format(i=index, n=len(lpar_infos)))
+            self.watchdog.rebuilds_counter.inc()
+            topics = [lpar_info.topic for lpar_info in lpar_infos]
+            if index == 0:
+                topics.insert(0, self.object_topic)
+            receiver = self._create_receiver(topics)
+            now = time.monotonic()
+            for lpar_info in lpar_infos:
+                lpar_info.receiver = receiver
+                lpar_info.recv_time = now
+            self.receiver_recv_times[index] = now
+            self.receivers[index] = receiver
+        try:
+            old_receiver.close()
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            # The STOMP connection may be broken
+            logprint(logging.WARNING, PRINT_V,
+                     "Warning: Cannot close old notification receiver {i}: "
+                     "{m}", i=index, m=exc)
+        for lpar_info in lpar_infos:
+            if lpar_info.next_seq_no is not None:
+                self.backfiller.resume(lpar_info, lpar_info.next_seq_no)
 
     @staticmethod
     def _create_logger(syslog, logger_id):
@@ -206,50 +1251,107 @@ class ForwarderServer:
             handler = logging.handlers.SysLogHandler(
                 (syslog.host, syslog.port), facility_code,
                 socktype=socktype)
-        # pylint: disable=broad-exception-caught
-        except Exception as exc:
+        except Exception as exc:  # pylint: disable=broad-exception-caught
             raise ConnectionError(
                 "Cannot create log handler for syslog server at "
                 "{host}, port {port}/{port_type}: {msg}".
                 format(host=syslog.host, port=syslog.port,
                        port_type=syslog.port_type, msg=str(exc)))
+        # Errors sending to the syslog server are raised to
+        # send_to_syslogs() for aggregated reporting, instead of being
+        # printed with a traceback for each OS message.
+        handler.handleError = _raise_handler_error
         handler.setFormatter(logging.Formatter('%(message)s'))
-        logger_name = f'zhmcosfwd_syslog_{logger_id}'
-        logger = logging.getLogger(logger_name)
+        # The logger is not registered with the logging module, so that it
+        # does not remain in the registry of loggers, and is not shared with
+        # a forwarder server created later in the same process. It is closed
+        # with _close_logger().
+        logger = logging.Logger(f'zhmcosfwd_syslog_{logger_id}')
         logger.addHandler(handler)
         logger.setLevel(logging.INFO)
         return logger
 
+    @staticmethod
+    def _close_logger(logger):
+        """
+        Remove the handlers of a Python logger created with _create_logger()
+        and close them, which closes their sockets.
+        """
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+
+    def _create_file_sink(self, file_info):
+        logprint(logging.INFO, PRINT_VV,
+                 "Creating file sink for directory {d} (per: {p}, "
+                 "compression: {c})".
+                 format(d=file_info.directory, p=file_info.per,
+                        c=file_info.compression))
+        sink = FileSink(
+            file_info.directory, file_info.per, file_info.max_size,
+            file_info.rotate_interval, file_info.compression,
+            file_info.flush_interval)
+        self.file_sinks.append(sink)
+        return sink
+
+    def _create_http_sink(self, http_info):
+        logprint(logging.INFO, PRINT_VV,
+                 "Creating HTTP sink for URL {u} (compression: {c})".
+                 format(u=http_info.url, c=http_info.compression))
+        headers = dict(http_info.headers)
+        if http_info.format == 'text':
+            headers.setdefault('Content-Type', 'text/plain; charset=utf-8')
+        sink = HttpSink(
+            http_info.url, headers, http_info.batch_max_count,
+            http_info.batch_max_bytes, http_info.batch_max_delay,
+            http_info.compression, http_info.max_retries,
+            http_info.retry_backoff, http_info.timeout,
+            http_info.verify_cert, self.error_aggregator, self.metrics)
+        self.http_sinks.append(sink)
+        return sink
+
     def shutdown(self):
         """
-        Stop the forwarder thread and clean up the forwarder server.
+        Stop the forwarder threads and clean up the forwarder server.
         """
 
-        if self.forwarded_lpars:
-            for lpar_info in self.forwarded_lpars.forwarded_lpar_infos.values():
-                lpar = lpar_info.lpar
-                cpc = lpar.manager.parent
+        self.ha_stop_event.set()
+        if self.ha_thread.is_alive():
+            self.ha_thread.join()
+        if self.lease_thread.is_alive():
+            self.lease_thread.join()
 
+        # Stop the forwarder threads from receiving again once their
+        # notification receivers are closed, and stop the watchdog from
+        # rebuilding notification receivers.
+        self.stop_event.set()
+        if self.watchdog_thread.is_alive():
+            self.watchdog_thread.join()
+
+        if self.stats_started:
+            # The stats thread ends when the forwarder threads are stopped.
+            # Log the statistics of the last partial interval.
+            self.stats_started = False
+            self.log_stats()
+
+        if self.event_thread.is_alive():
+            self.event_queue.put(None)  # Stop request
+            self.event_thread.join()
+
+        if self.forwarded_lpars:
+            lpar_infos = self.forwarded_lpars.forwarded_lpar_infos
+            for lpar_info in list(lpar_infos.values()):
                 if lpar_info.topic:
-                    logprint(logging.INFO, PRINT_VV,
-                             "Unsubscribing OS message channel for LPAR {p!r} "
-                             "on CPC {c!r} (topic: {t})".
-                             format(p=lpar.name, c=cpc.name, t=lpar_info.topic))
-                    try:
-                        self.receiver.unsubscribe(lpar_info.topic)
-                    except zhmcclient.Error as exc:
-                        logprint(logging.ERROR, PRINT_ALWAYS,
-                                 "Error unsubscribing OS message channel for "
-                                 "LPAR {p!r} on CPC {c!r} (topic: {t}): {m}".
-                                 format(p=lpar.name, c=cpc.name,
-                                        t=lpar_info.topic, m=exc))
-
-        if self.receiver:
+                    self._unsubscribe(lpar_info)
+
+        for receiver in self.receivers:
             try:
                 logprint(logging.INFO, PRINT_ALWAYS,
                          "Closing notification receiver")
-                self.receiver.close()
-            except zhmcclient.Error as exc:
+                receiver.close()
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                # The notification receiver may not have connected yet, or
+                # its STOMP connection may be broken
                 logprint(logging.ERROR, PRINT_ALWAYS,
                          "Error closing notification receiver: {m}".
                          format(m=exc))
@@ -257,14 +1359,55 @@ class ForwarderServer:
         if self.thread_started:
             try:
                 logprint(logging.INFO, PRINT_ALWAYS,
-                         "Stopping forwarder thread")
+                         "Stopping forwarder threads")
                 self._stop()
-            # pylint: disable=broad-exception-caught
-            except Exception as exc:
+            except Exception as exc:  # pylint: disable=broad-exception-caught
                 logprint(logging.ERROR, PRINT_ALWAYS,
-                         "Error stopping forwarder thread: {m}".
+                         "Error stopping forwarder threads: {m}".
                          format(m=exc))
             self.thread_started = False
+            # Report the errors of the last partial interval
+            self.error_aggregator.report()
+
+        if self.recorder:
+            self.recorder.close()
+            logprint(logging.INFO, PRINT_ALWAYS,
+                     "Recorded {n} notifications to {f}".
+                     format(n=self.recorder.num_notifications,
+                            f=self.recorder.filename))
+            self.recorder = None
+
+        for sink in self.file_sinks:
+            logprint(logging.INFO, PRINT_ALWAYS,
+                     f"Closing file sink for directory {sink.directory}")
+            try:
+                sink.close()
+            except OSError as exc:
+                logprint(logging.ERROR, PRINT_ALWAYS,
+                         "Error closing file sink for directory {d}: {m}".
+                         format(d=sink.directory, m=exc))
+        self.file_sinks = []
+
+        for sink in self.http_sinks:
+            logprint(logging.INFO, PRINT_ALWAYS,
+                     f"Closing HTTP sink for URL {sink.url}")
+            sink.close()
+        self.http_sinks = []
+
+        for syslog in self.syslog_infos:
+            logprint(logging.INFO, PRINT_VV,
+                     "Closing logger for syslog server at {h}, port {p}",
+                     h=syslog.host, p=syslog.port)
+            self._close_logger(syslog.logger)
+            syslog.logger = None
+        self.syslog_infos = []
+
+        if self.active:
+            # All received OS messages have been delivered at this point
+            self.save_checkpoint()
+            self.active = False
+        if self.lease and not self.lease_lost:
+            self.lease.release()
 
         # logprint(logging.INFO, PRINT_ALWAYS,
         #          "Cleaning up partition notifications on HMC")
@@ -294,33 +1437,168 @@ class ForwarderServer:
 
     def _start(self):
         """
-        Start the forwarder thread.
+        Start the forwarder threads and the delivery thread.
         """
         self.stop_event.clear()
-        self.thread.start()
+        self.delivery_thread.start()
+        self.threads = [
+            Thread(target=self.run, args=(index,),
+                   name=f'forwarder-{index}')
+            for index in range(len(self.receivers))
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def health(self):
+        """
+        Return the health of the forwarder threads and the delivery thread,
+        for reporting it to the supervisor.
+
+        Returns:
+          list of dict: For each thread that has been started, a dict with
+          items 'name' (string: thread name), 'alive' (bool: thread is
+          running) and 'busy_time' (float: time in seconds the thread has
+          been working on its current notification or OS message without
+          progress, or 0 while waiting for work). Empty while the forwarder
+          is stopping.
+        """
+        if self.stop_event.is_set():
+            return []
+        now = time.monotonic()
+        health = []
+        for thread in [self.delivery_thread] + self.threads:
+            if thread.ident is None:
+                continue  # Not started, e.g. while standby
+            busy_since = self.busy_since.get(thread.name)
+            health.append({
+                'name': thread.name,
+                'alive': thread.is_alive(),
+                'busy_time': now - busy_since if busy_since else 0.0,
+            })
+        return health
 
     def _stop(self):
         """
-        Stop the forwarder thread.
+        Stop the forwarder threads, and stop the delivery thread after it
+        has delivered the OS messages that were already received.
         """
         self.stop_event.set()
-        self.thread.join()
+        for thread in self.threads:
+            thread.join()
+        self.backfiller.shutdown()
+        self.delivery_queue.close()
+        self.delivery_thread.join()
 
-    def run(self):
+    def _run_stats(self):
+        """
+        The method running as the statistics thread.
+        """
+        while not self.stop_event.wait(self.stats_interval):
+            self.log_stats()
+
+    def _run_error_reports(self):
+        """
+        The method running as the error report thread.
         """
-        The method running as the forwarder server thread.
+        while not self.stop_event.wait(self.error_aggregator.interval):
+            self.error_aggregator.report()
+
+    def log_stats(self):
+        """
+        Log a summary of the statistics since the last call.
+
+        The delivery latency for each delivery class is logged. If the stage
+        timing is enabled, the duration of each stage of the hot path is
+        logged. For each forwarded LPAR that had OS messages, the forwarding
+        lag is logged.
+        """
+        for dclass, hist in self.delivery_histograms.items():
+            delta = self._stats_delta(hist)
+            num = sum(delta)
+            if num == 0:
+                continue
+            p50 = bucket_quantile(hist.buckets, delta, 0.5)
+            p99 = bucket_quantile(hist.buckets, delta, 0.99)
+            logprint(logging.INFO, PRINT_V,
+                     "Delivery latency for {d} OS messages: {n} messages, "
+                     "p50 <= {p50} sec, p99 <= {p99} sec, queued: {q}".
+                     format(d=dclass, n=num, p50=_bound_str(p50),
+                            p99=_bound_str(p99), q=len(self.delivery_queue)))
+        for stage in STAGES:
+            hist = self.stage_timer.histograms.get(stage)
+            if hist is None:
+                continue
+            delta = self._stats_delta(hist)
+            num = sum(delta)
+            if num == 0:
+                continue
+            p50 = bucket_quantile(hist.buckets, delta, 0.5)
+            p99 = bucket_quantile(hist.buckets, delta, 0.99)
+            logprint(logging.INFO, PRINT_V,
+                     "Duration of stage {s}: {n} samples, p50 <= {p50} sec, "
+                     "p99 <= {p99} sec, max since start: {m:.6f} sec".
+                     format(s=stage, n=num, p50=_bound_str(p50),
+                            p99=_bound_str(p99), m=hist.max))
+        if not self.forwarded_lpars:
+            return
+        lpar_infos = self.forwarded_lpars.forwarded_lpar_infos
+        for lpar_info in list(lpar_infos.values()):
+            hist = lpar_info.lag_histogram
+            if hist is None:
+                continue
+            delta = self._stats_delta(hist)
+            num = sum(delta)
+            if num == 0:
+                continue
+            p50 = bucket_quantile(hist.buckets, delta, 0.5)
+            p99 = bucket_quantile(hist.buckets, delta, 0.99)
+            logprint(logging.INFO, PRINT_V,
+                     "Forwarding lag for LPAR {p!r} on CPC {c!r}: {n} "
+                     "messages, p50 <= {p50} sec, p99 <= {p99} sec, "
+                     "max since start: {m:.3f} sec".
+                     format(p=hist.labels['lpar'], c=hist.labels['cpc'],
+                            n=num, p50=_bound_str(p50), p99=_bound_str(p99),
+                            m=hist.max))
+
+    def _stats_delta(self, hist):
+        """
+        Return the bucket counts of a histogram since the last call for the
+        histogram.
+        """
+        counts = list(hist.counts)
+        last_counts = self._last_stats_counts.get(id(hist), [0] * len(counts))
+        self._last_stats_counts[id(hist)] = counts
+        return [c - lc for c, lc in zip(counts, last_counts)]
+
+    def run(self, index):
+        """
+        The method running as a forwarder thread, for receiving the
+        notifications of one notification receiver.
+
+        Parameters:
+          index (int): Index of the notification receiver in receivers. The
+            watchdog may replace the notification receiver while the thread
+            runs.
         """
         logprint(logging.INFO, PRINT_V,
                  "Entering forwarder thread")
+        thread_name = f'forwarder-{index}'
         while True:
 
             if self.stop_event.is_set():
                 break
 
+            receiver = self.receivers[index]
             try:
                 # pylint: disable=unused-variable
-                for headers, message in self.receiver.notifications():
+                for headers, message in receiver.notifications():
+                    recv_time = time.monotonic()
+                    self.receiver_recv_times[index] = recv_time
+                    self.busy_since[thread_name] = recv_time
+                    if self.recorder:
+                        self.recorder.record(headers, message)
                     self.handle_notification(headers, message)
+                    self.busy_since[thread_name] = None
 
             except zhmcclient.NotificationJMSError as exc:
                 logprint(logging.ERROR, PRINT_ALWAYS,
@@ -329,6 +1607,13 @@ class ForwarderServer:
                 logprint(logging.ERROR, PRINT_ALWAYS,
                          "Receiving notifications again")
 
+            except zhmcclient.NotificationError as exc:
+                # E.g. a lost STOMP connection, which is reconnected
+                logprint(logging.ERROR, PRINT_ALWAYS,
+                         "Error receiving notifications {}: {}".
+                         format(exc.__class__.__name__, exc))
+                self.stop_event.wait(1)
+
         logprint(logging.INFO, PRINT_V,
                  "Leaving forwarder thread")
 
@@ -338,14 +1623,36 @@ class ForwarderServer:
         """
         noti_type = headers['notification-type']
         if noti_type == 'os-message':
-            for msg_info in message['os-messages']:
-                lpar_uri = headers['object-uri']
-                lpar_infos = self.forwarded_lpars.forwarded_lpar_infos
-                lpar_info = lpar_infos[lpar_uri]
-                lpar = lpar_info.lpar
-                seq_no = msg_info['sequence-number']
-                msg_txt = msg_info['message-text'].strip('\n')
-                self.send_to_syslogs(lpar, seq_no, msg_txt)
+            stage_timer = self.stage_timer
+            start_time = stage_timer.start()
+            lpar_uri = headers['object-uri']
+            lpar_infos = self.forwarded_lpars.forwarded_lpar_infos
+            lpar_info = lpar_infos.get(lpar_uri)
+            stage_timer.stop('lookup', start_time)
+            if lpar_info is None:
+                return  # Removed in the meantime
+            recv_time = time.monotonic()
+            lpar_info.recv_time = recv_time
+            self.backfiller.receive(
+                lpar_info, message['os-messages'], recv_time)
+            if lpar_info.spilled_seq_no is not None:
+                self._refill(lpar_info)
+            stage_timer.stop('handle', start_time)
+        elif noti_type == 'status-change':
+            lpar_infos = self.forwarded_lpars.forwarded_lpar_infos
+            lpar_info = lpar_infos.get(headers['object-uri'])
+            if lpar_info:
+                # Opening the OS message channel is done in the event thread,
+                # in order not to delay the notifications.
+                status = message['change-reports'][-1]['new-status']
+                self.event_queue.put(
+                    (self.status_changed, (lpar_info, status)))
+        elif noti_type == 'inventory-change':
+            self.event_queue.put(
+                (self.inventory_changed,
+                 (headers['action'], headers['class'], headers['object-uri'])))
+        elif noti_type == 'property-change':
+            pass  # Received on the object topic, not needed
         else:
             dest = headers['destination']
             sub_id = headers['subscription']
@@ -357,23 +1664,295 @@ class ForwarderServer:
                      format(nt=noti_type, c=obj_class, n=obj_name, s=sub_id,
                             d=dest))
 
-    def send_to_syslogs(self, lpar, seq_no, msg_txt):
+    def _enqueue(self, lpar_info, msg_info, recv_time):
+        """
+        Put an OS message into the delivery queue, and return whether it
+        was put into the queue.
+        """
+        if not self.delivery_queue.put(
+                (lpar_info, msg_info, recv_time), delivery_class(msg_info),
+                lpar_info.uri, lpar_info.weight):
+            return False
+        with self._pending_lock:
+            heapq.heappush(lpar_info.pending_seq_nos,
+                           msg_info['sequence-number'])
+            self._drop_delivered(lpar_info)
+        return True
+
+    def _delivered(self, lpar_info, seq_no):
+        """
+        Record that an OS message of an LPAR has been delivered (or failed to
+        be delivered), for the checkpoint.
+        """
+        with self._pending_lock:
+            delivered_early = lpar_info.delivered_early
+            delivered_early[seq_no] = delivered_early.get(seq_no, 0) + 1
+            self._drop_delivered(lpar_info)
+            lpar_info.delivered_seq_no = seq_no
+
+    @staticmethod
+    def _drop_delivered(lpar_info):
+        """
+        Remove delivered OS messages from the top of the pending sequence
+        numbers of an LPAR. Must be called with _pending_lock held.
+        """
+        pending_seq_nos = lpar_info.pending_seq_nos
+        delivered_early = lpar_info.delivered_early
+        while pending_seq_nos and pending_seq_nos[0] in delivered_early:
+            seq_no = heapq.heappop(pending_seq_nos)
+            if delivered_early[seq_no] == 1:
+                del delivered_early[seq_no]
+            else:
+                delivered_early[seq_no] -= 1
+
+    def _refill(self, lpar_info):
+        """
+        Retrieve spilled OS messages of an LPAR from the HMC, once at least
+        half of its share of the delivery queue is free again.
+
+        Called by the delivery thread after delivering an OS message of a
+        spilled LPAR, and by the receiving threads after receiving one.
+        """
+        max_key_size = self.delivery_queue.max_key_size
+        free = max_key_size - self.delivery_queue.key_size(lpar_info.uri)
+        if free >= max_key_size // 2:
+            self.backfiller.refill(lpar_info, free)
+
+    def run_delivery(self):
+        """
+        The method running as the delivery thread.
+
+        Delivers the OS messages from the delivery queue to their
+        destinations, OS messages in the priority class first. Closes the
+        files of removed LPARs when their OS messages have been written (see
+        _remove_lpars()).
+        """
+        logprint(logging.INFO, PRINT_V,
+                 "Entering delivery thread")
+        while True:
+            self.busy_since['delivery'] = None
+            entry = self.delivery_queue.get()
+            if entry is None:
+                break
+            self.busy_since['delivery'] = time.monotonic()
+            (lpar_info, msg_info, recv_time), dclass = entry
+            if msg_info is None:
+                self._close_files(lpar_info)
+                continue
+            self.stage_timer.observe('queue', time.monotonic() - recv_time)
+            try:
+                self.deliver(lpar_info, msg_info)
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logprint(logging.ERROR, PRINT_ALWAYS,
+                         "Error delivering seq_no {s} from LPAR {p!r}: "
+                         "{e}: {m}",
+                         s=msg_info.get('sequence-number'),
+                         p=lpar_info.name,
+                         e=exc.__class__.__name__, m=exc)
+                continue
+            finally:
+                self._delivered(lpar_info, msg_info['sequence-number'])
+            self.delivery_histograms[dclass].observe(
+                time.monotonic() - recv_time)
+            if lpar_info.spilled_seq_no is not None:
+                self._refill(lpar_info)
+        logprint(logging.INFO, PRINT_V,
+                 "Leaving delivery thread")
+
+    def deliver(self, lpar_info, msg_info):
+        """
+        Deliver a single OS message to all configured destinations for its
+        LPAR, and measure the forwarding lag.
+
+        Parameters:
+          lpar_info (ForwardedLparInfo): The forwarded LPAR.
+          msg_info (dict): The OS message, as an item of the 'os-messages'
+            list in the OS message notification.
+        """
+        stage_timer = self.stage_timer
+        start_time = stage_timer.start()
+        seq_no = msg_info['sequence-number']
+        msg_txt = msg_info['message-text'].strip('\n')
+        msg_time = message_time(msg_info)
+        if lpar_info.json_fragment:
+            format_time = stage_timer.start()
+            json_record = format_json_record(
+                lpar_info.json_fragment, msg_info, msg_txt)
+            stage_timer.stop('format', format_time)
+        else:
+            json_record = None
+        self.send_to_syslogs(lpar_info, seq_no, msg_txt, json_record, msg_time)
+        self.send_to_files(lpar_info, seq_no, msg_txt, json_record)
+        self.send_to_http_servers(lpar_info, seq_no, msg_txt, json_record)
+        stage_timer.stop('deliver', start_time)
+        # Set to None when the LPAR is removed in the meantime
+        lag_histogram = lpar_info.lag_histogram
+        if msg_time is not None and lag_histogram:
+            # A negative lag can result from clock differences between the
+            # HMC and the forwarder system.
+            lag = max(time.time() - msg_time, 0.0)
+            lag_histogram.observe(lag)
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def send_to_syslogs(self, lpar_info, seq_no, msg_txt, json_record,
+                        msg_time=None):
         """
         Send a single OS message to the configured syslogs for its LPAR.
+
+        In text format, multi-line and oversize OS messages are sent as
+        multiple continuation records (see format_text_records()). In JSON
+        format, the OS message is sent as a single record, whose message text
+        is truncated if the record is oversize (see truncate_json_record()).
+
+        If a syslog header is configured, it contains the time the OS issued
+        the message (msg_time), or the current time if that is not known.
         """
-        cpc = lpar.manager.parent
-        for syslog in self.forwarded_lpars.get_syslogs(lpar):
+        cpc_name = lpar_info.cpc_name
+        lpar_name = lpar_info.name
+        stage_timer = self.stage_timer
+        # Formatted records, by (format, header, max record length)
+        records_by_key = {}
+        for syslog in lpar_info.syslogs:
             if syslog.logger:
-                syslog_txt = ('{c} {p} {s}: {m}'.
-                              format(c=cpc.name, p=lpar.name, s=seq_no,
-                                     m=msg_txt))
+                key = (syslog.format, syslog.header, syslog.max_length)
                 try:
-                    syslog.logger.info(syslog_txt)
-                # pylint: disable=broad-exception-caught
-                except Exception as exc:
-                    logprint(logging.WARNING, PRINT_ALWAYS,
-                             "Warning: Cannot send seq_no {s} from LPAR {p!r} "
-                             "on CPC {c!r} to syslog host {h}: {m}".
-                             format(s=seq_no, p=lpar.name, c=cpc.name,
-                                    h=syslog.host, m=exc))
+                    records = records_by_key[key]
+                except KeyError:
+                    format_time = stage_timer.start()
+                    if syslog.header == 'none':
+                        header = ''
+                    else:
+                        header = syslog_header(
+                            syslog.header,
+                            time.time() if msg_time is None else msg_time,
+                            lpar_name)
+                    if syslog.format == 'json':
+                        max_length = syslog.max_length - len(header)
+                        max_length -= SYSLOG_HEADER_LENGTH
+                        records = [header + truncate_json_record(
+                            json_record, max_length)]
+                    else:
+                        records = format_text_records(
+                            cpc_name, lpar_name, seq_no, msg_txt,
+                            syslog.max_length - len(header))
+                        if header:
+                            records = [header + r for r in records]
+                    records_by_key[key] = records
+                    stage_timer.stop('format', format_time)
+                send_time = stage_timer.start()
+                try:
+                    for syslog_txt in records:
+                        syslog.logger.info(syslog_txt)
+                    stage_timer.stop('syslog_send', send_time)
+                except Exception as exc:  # pylint: disable=broad-except
+                    if self.error_aggregator.record(
+                            f'syslog {syslog.host}:{syslog.port}', exc,
+                            seq_no):
+                        logprint(logging.WARNING, PRINT_ALWAYS,
+                                 "Warning: Cannot send seq_no {s} from LPAR "
+                                 "{p!r} on CPC {c!r} to syslog host {h}: {m} "
+                                 "- further errors of this kind are reported "
+                                 "every {i} sec",
+                                 s=seq_no, p=lpar_name, c=cpc_name,
+                                 h=syslog.host, m=exc,
+                                 i=self.error_aggregator.interval)
                     continue
+
+    def send_to_files(self, lpar_info, seq_no, msg_txt, json_record):
+        """
+        Write a single OS message to the configured files for its LPAR.
+
+        In text format, multi-line OS messages are written as one continuation
+        record per line (see format_text_records()). In JSON format, the OS
+        message is written as a single record.
+        """
+        if not lpar_info.files:
+            return
+        cpc_name = lpar_info.cpc_name
+        lpar_name = lpar_info.name
+        stage_timer = self.stage_timer
+        text_records = None
+        for file_info in lpar_info.files:
+            if file_info.sink:
+                if file_info.format == 'json':
+                    records = [json_record]
+                else:
+                    if text_records is None:
+                        format_time = stage_timer.start()
+                        text_records = format_text_records(
+                            cpc_name, lpar_name, seq_no, msg_txt, None)
+                        stage_timer.stop('format', format_time)
+                    records = text_records
+                write_time = stage_timer.start()
+                try:
+                    file_info.sink.write(cpc_name, lpar_name, records)
+                    stage_timer.stop('file_write', write_time)
+                except OSError as exc:
+                    if self.error_aggregator.record(
+                            f'directory {file_info.directory}', exc, seq_no):
+                        logprint(logging.WARNING, PRINT_ALWAYS,
+                                 "Warning: Cannot write seq_no {s} from LPAR "
+                                 "{p!r} on CPC {c!r} to directory {d}: {m} "
+                                 "- further errors of this kind are reported "
+                                 "every {i} sec",
+                                 s=seq_no, p=lpar_name, c=cpc_name,
+                                 d=file_info.directory, m=exc,
+                                 i=self.error_aggregator.interval)
+
+    def send_to_http_servers(self, lpar_info, seq_no, msg_txt, json_record):
+        """
+        Send a single OS message to the configured HTTP servers for its LPAR.
+
+        The OS message is added to the current batch of each HTTP server; the
+        batches are sent in the background. In text format, multi-line OS
+        messages are added as one continuation record per line (see
+        format_text_records()). In JSON format, the OS message is added as a
+        single record.
+        """
+        if not lpar_info.http_servers:
+            return
+        stage_timer = self.stage_timer
+        text_records = None
+        for http_info in lpar_info.http_servers:
+            if http_info.sink:
+                if http_info.format == 'json':
+                    records = [json_record]
+                else:
+                    if text_records is None:
+                        format_time = stage_timer.start()
+                        text_records = format_text_records(
+                            lpar_info.cpc_name, lpar_info.name, seq_no,
+                            msg_txt, None)
+                        stage_timer.stop('format', format_time)
+                    records = text_records
+                batch_time = stage_timer.start()
+                http_info.sink.write(records, seq_no)
+                stage_timer.stop('http_batch', batch_time)
+
+
+def _raise_handler_error(record):
+    # pylint: disable=unused-argument
+    """
+    Replacement for the handleError() method of the syslog handlers, that
+    raises the exception being handled by the handler.
+    """
+    raise  # pylint: disable=misplaced-bare-raise
+
+
+def _list_lpars(cpc):
+    """
+    Return the partitions of a CPC in DPM mode or the LPARs of a CPC in
+    classic mode.
+    """
+    if cpc.prop('dpm-enabled'):
+        return cpc.partitions.list()
+    return cpc.lpars.list()
+
+
+def _bound_str(bound):
+    """
+    Return a bucket bound as a string for statistics messages.
+    """
+    if bound == math.inf:
+        return 'inf'
+    return f'{bound:g}'
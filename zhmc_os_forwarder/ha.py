@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Classes for active/standby high availability: A lease on a shared file that
+determines the active forwarder, and a checkpoint of the delivered OS message
+sequence numbers
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+
+from .utils import logprint, PRINT_ALWAYS
+
+# Default time in seconds after which a lease expires if it is not renewed
+DEFAULT_LEASE_TIME = 10
+
+# Default interval in seconds for saving the checkpoint
+DEFAULT_CHECKPOINT_INTERVAL = 1.0
+
+# Time in seconds between writing the lease file and reading it back when
+# acquiring the lease, to detect concurrent acquisitions
+LEASE_SETTLE_TIME = 0.5
+
+
+def _write_json_file(path, data, tmp_suffix):
+    """
+    Write data as JSON to a file, atomically replacing an existing file.
+    """
+    tmp_path = f'{path}.{tmp_suffix}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as fp:
+        json.dump(data, fp)
+    os.replace(tmp_path, path)
+
+
+def _read_json_file(path):
+    """
+    Read JSON data from a file. Returns None if the file does not exist.
+
+    Raises:
+      OSError: Error reading the file.
+      ValueError: Invalid JSON in the file.
+    """
+    try:
+        with open(path, encoding='utf-8') as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return None
+
+
+class Lease:
+    """
+    A lease on a file on storage shared by the forwarders, that grants its
+    holder the right to be the active forwarder.
+
+    The lease file contains the holder and the expiration time of the lease.
+    The holder must renew the lease before it expires. Any forwarder can
+    acquire the lease when it has expired or has been released.
+
+    The expiration time is an absolute time, so the clocks of the systems
+    sharing the lease file must be synchronized.
+    """
+
+    def __init__(self, path, lease_time=DEFAULT_LEASE_TIME):
+        """
+        Parameters:
+          path (string): Path name of the lease file.
+          lease_time (float): Time in seconds after which the lease expires
+            if it is not renewed.
+        """
+        self.path = path
+        self.lease_time = lease_time
+        self.holder = '{h}:{p}:{u}'.format(
+            h=socket.gethostname(), p=os.getpid(), u=uuid.uuid4().hex[:8])
+        self._tmp_suffix = self.holder.replace(':', '-')
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "path={s.path!r}, "
+                "lease_time={s.lease_time!r}, "
+                "holder={s.holder!r}"
+                ")".format(s=self))
+
+    def current_holder(self):
+        """
+        Return the holder of the lease, or None if the lease is free (i.e.
+        has expired or has been released).
+        """
+        try:
+            data = _read_json_file(self.path)
+        except (OSError, ValueError):
+            # Partially written or unreadable lease file
+            return None
+        if data is None or data.get('expires', 0) < time.time():
+            return None
+        return data.get('holder')
+
+    def acquire(self):
+        """
+        Try to acquire the lease.
+
+        Returns:
+          bool: Indicates whether the lease has been acquired.
+
+        Raises:
+          OSError: Error writing the lease file.
+        """
+        holder = self.current_holder()
+        if holder is not None and holder != self.holder:
+            return False
+        self._write()
+        # When multiple forwarders acquire the lease at the same time, the
+        # last one writing the lease file wins.
+        time.sleep(LEASE_SETTLE_TIME)
+        return self.current_holder() == self.holder
+
+    def renew(self):
+        """
+        Renew the lease.
+
+        Returns:
+          bool: Indicates whether the lease has been renewed. False means that
+          the lease has been lost, i.e. it has expired and another forwarder
+          has acquired it.
+
+        Raises:
+          OSError: Error writing the lease file.
+        """
+        holder = self.current_holder()
+        if holder is not None and holder != self.holder:
+            return False
+        self._write()
+        return True
+
+    def release(self):
+        """
+        Release the lease if held, so that another forwarder can acquire it
+        without waiting for it to expire.
+        """
+        if self.current_holder() == self.holder:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def _write(self):
+        _write_json_file(
+            self.path,
+            {'holder': self.holder, 'expires': time.time() + self.lease_time},
+            self._tmp_suffix)
+
+
+class Checkpoint:
+    """
+    A checkpoint of the sequence numbers of the last delivered OS message of
+    each LPAR, in a file on storage shared by the forwarders.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters:
+          path (string): Path name of the checkpoint file.
+        """
+        self.path = path
+        self._saved = None  # Last saved sequence numbers
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "path={s.path!r}"
+                ")".format(s=self))
+
+    def load(self):
+        """
+        Load the checkpoint.
+
+        Returns:
+          dict: Sequence number of the last delivered OS message, by LPAR URI.
+          Empty if there is no valid checkpoint.
+        """
+        try:
+            data = _read_json_file(self.path)
+        except (OSError, ValueError) as exc:
+            logprint(logging.WARNING, PRINT_ALWAYS,
+                     "Warning: Ignoring checkpoint file {f}: {m}".
+                     format(f=self.path, m=exc))
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        self._saved = data
+        return dict(data)
+
+    def save(self, seq_nos):
+        """
+        Save the checkpoint, if it has changed since it was last saved or
+        loaded.
+
+        Parameters:
+          seq_nos (dict): Sequence number of the last delivered OS message,
+            by LPAR URI.
+
+        Raises:
+          OSError: Error writing the checkpoint file.
+        """
+        if seq_nos == self._saved:
+            return
+        _write_json_file(self.path, seq_nos, f'{os.getpid()}')
+        self._saved = seq_nos
@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A class for sending OS messages in batches to an HTTP log ingest endpoint
+"""
+
+import os
+import gzip
+import time
+import queue
+import logging
+from threading import Thread, Event, Lock
+
+import urllib3
+
+from .utils import logprint, PRINT_ALWAYS, PRINT_VV
+
+# Valid values for the 'compression' property of HTTP destinations
+VALID_HTTP_COMPRESSIONS = ['none', 'gzip']
+
+# HTTP status codes for which a request is retried
+RETRY_HTTP_STATUS = (408, 429, 500, 502, 503, 504)
+
+# Maximum number of batches waiting to be sent. When exceeded, new batches
+# are dropped.
+MAX_PENDING_BATCHES = 16
+
+# Maximum time in seconds between retries
+MAX_RETRY_BACKOFF = 30.0
+
+# Compression level for gzip request bodies. A low level provides most of the
+# size reduction for log data at a fraction of the CPU cost.
+GZIP_COMPRESSLEVEL = 1
+
+
+class HttpStatusError(Exception):
+    """
+    The HTTP server rejected a batch with an HTTP status other than 2xx.
+    """
+
+
+class HttpBacklogError(Exception):
+    """
+    A batch could not be handed over for sending because too many batches
+    were already waiting to be sent.
+    """
+
+
+# pylint: disable=too-many-instance-attributes
+class HttpSink:
+    """
+    A sink that sends OS message records in batches to an HTTP log ingest
+    endpoint (e.g. Splunk HEC or Elasticsearch bulk style).
+
+    Records are collected into batches that are sent when a maximum count,
+    a maximum size or a maximum delay is reached. Each batch is sent as a
+    newline-delimited body in a single POST request, optionally compressed
+    with gzip. The requests are sent from a background thread over
+    persistent (keep-alive) connections, and failed requests are retried
+    with exponential backoff.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, url, headers=None, batch_max_count=500,
+                 batch_max_bytes=1048576, batch_max_delay=1.0,
+                 compression='gzip', max_retries=5, retry_backoff=0.5,
+                 timeout=10.0, verify_cert=True, error_aggregator=None,
+                 metrics=None):
+        """
+        Parameters:
+          url (string): URL of the endpoint the batches are POSTed to.
+          headers (dict): Additional HTTP headers for the requests, e.g.
+            for authorization.
+          batch_max_count (int): Maximum number of records in a batch.
+          batch_max_bytes (int): Maximum size of a batch in Bytes
+            (uncompressed).
+          batch_max_delay (float): Maximum time in seconds a record waits
+            in a batch before the batch is sent.
+          compression (string): Compression of the request body: 'none',
+            'gzip'.
+          max_retries (int): Maximum number of retries for a batch.
+          retry_backoff (float): Time in seconds before the first retry.
+            It is doubled for each further retry.
+          timeout (float): Timeout in seconds for connecting and reading.
+          verify_cert (bool or string): Whether and how the server
+            certificate is verified for HTTPS: True, False, or the path name
+            of a CA certificate file or directory.
+          error_aggregator (ErrorAggregator): Aggregator for the OS messages
+            that could not be delivered, or None to log each drop.
+          metrics (MetricsRegistry): Registry for the failure counters, or
+            None.
+        """
+        self.url = url
+        self.headers = dict(headers or {})
+        self.batch_max_count = batch_max_count
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_max_delay = batch_max_delay
+        self.compression = compression
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.verify_cert = verify_cert
+        self.error_aggregator = error_aggregator
+        self.destination = f'HTTP server {url}'  # For the error aggregator
+
+        self.headers.setdefault('Content-Type', 'application/x-ndjson')
+        if compression == 'gzip':
+            self.headers['Content-Encoding'] = 'gzip'
+
+        pool_kwargs = {}
+        if verify_cert is False:
+            pool_kwargs['cert_reqs'] = 'CERT_NONE'
+        elif isinstance(verify_cert, str):
+            pool_kwargs['cert_reqs'] = 'CERT_REQUIRED'
+            if os.path.isdir(verify_cert):
+                pool_kwargs['ca_cert_dir'] = verify_cert
+            else:
+                pool_kwargs['ca_certs'] = verify_cert
+        # A single sender thread uses the pool, so one connection per host is
+        # sufficient. The connection is kept alive between requests.
+        self._pool = urllib3.PoolManager(
+            num_pools=1, maxsize=1, block=False,
+            timeout=urllib3.Timeout(connect=timeout, read=timeout),
+            **pool_kwargs)
+
+        # Current batch
+        self._batch = []  # Records in the current batch
+        self._batch_seq_nos = []  # Sequence numbers of the OS messages in it
+        self._batch_bytes = 0  # Size of the current batch in Bytes
+        self._batch_time = None  # time.monotonic() of first record in batch
+        self._lock = Lock()  # Protects the current batch
+
+        # Complete batches waiting to be sent
+        self._send_queue = queue.Queue(maxsize=MAX_PENDING_BATCHES)
+
+        # Statistics
+        self.sent_batches = 0
+        self.sent_records = 0
+        self.dropped_records = 0
+        self.failed_requests = 0
+        if metrics:
+            labels = {'url': url}
+            self._failed_counter = metrics.counter(
+                'zhmc_os_forwarder_http_failed_requests_total',
+                "Number of failed requests to an HTTP server, including "
+                "requests that were retried",
+                labels=labels)
+            self._dropped_counter = metrics.counter(
+                'zhmc_os_forwarder_http_dropped_records_total',
+                "Number of records dropped for an HTTP server, because "
+                "sending them failed or too many batches were waiting",
+                labels=labels)
+        else:
+            self._failed_counter = None
+            self._dropped_counter = None
+
+        self._stop_event = Event()
+        self._timer_thread = Thread(target=self._run_timer, daemon=True)
+        self._send_thread = Thread(target=self._run_send, daemon=True)
+        self._timer_thread.start()
+        self._send_thread.start()
+
+    def __str__(self):
+        return ("{s.__class__.__name__}("
+                "url={s.url!r}"
+                ")".format(s=self))
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "url={s.url!r}, "
+                "batch_max_count={s.batch_max_count!r}, "
+                "batch_max_bytes={s.batch_max_bytes!r}, "
+                "batch_max_delay={s.batch_max_delay!r}, "
+                "compression={s.compression!r}, "
+                "max_retries={s.max_retries!r}, "
+                "retry_backoff={s.retry_backoff!r}, "
+                "timeout={s.timeout!r}"
+                ")".format(s=self))
+
+    def write(self, records, seq_no=None):
+        """
+        Add records to the current batch. If the batch is full, it is handed
+        over to the sender thread.
+
+        Parameters:
+          records (list of string): The records, without newlines.
+          seq_no (int): Sequence number of the OS message of the records,
+            for reporting errors, or None.
+        """
+        with self._lock:
+            for record in records:
+                data = record.encode('utf-8') + b'\n'
+                if self._batch and \
+                        self._batch_bytes + len(data) > self.batch_max_bytes:
+                    self._hand_over()
+                if not self._batch:
+                    self._batch_time = time.monotonic()
+                if seq_no is not None and \
+                        self._batch_seq_nos[-1:] != [seq_no]:
+                    self._batch_seq_nos.append(seq_no)
+                self._batch.append(data)
+                self._batch_bytes += len(data)
+                if len(self._batch) >= self.batch_max_count:
+                    self._hand_over()
+
+    def flush(self):
+        """
+        Hand over the current batch to the sender thread, if not empty.
+        """
+        with self._lock:
+            if self._batch:
+                self._hand_over()
+
+    def close(self):
+        """
+        Send the current batch, wait for all pending batches to be sent
+        (without further retries), stop the background threads and close the
+        connections.
+        """
+        self._stop_event.set()
+        self._timer_thread.join()
+        self.flush()
+        self._send_queue.put(None)  # Causes the sender thread to end
+        self._send_thread.join()
+        self._pool.clear()
+
+    def _hand_over(self):
+        """
+        Hand over the current batch to the sender thread and start a new
+        batch. Must be called with self._lock held.
+        """
+        batch = (self._batch, self._batch_seq_nos)
+        self._batch = []
+        self._batch_seq_nos = []
+        self._batch_bytes = 0
+        self._batch_time = None
+        try:
+            self._send_queue.put_nowait(batch)
+        except queue.Full:
+            exc = HttpBacklogError(
+                f"{MAX_PENDING_BATCHES} batches are already waiting to be "
+                "sent")
+            self._drop(batch, exc)
+
+    def _run_timer(self):
+        """
+        The method running as the timer thread. Hands over batches that
+        have reached their maximum delay.
+        """
+        interval = min(self.batch_max_delay / 2, 0.5)
+        while not self._stop_event.wait(interval):
+            with self._lock:
+                if not self._batch:
+                    continue
+                age = time.monotonic() - self._batch_time
+                if age >= self.batch_max_delay:
+                    self._hand_over()
+
+    def _run_send(self):
+        """
+        The method running as the sender thread.
+        """
+        while True:
+            batch = self._send_queue.get()
+            if batch is None:
+                break
+            records = batch[0]
+            body = b''.join(records)
+            if self.compression == 'gzip':
+                body = gzip.compress(body, compresslevel=GZIP_COMPRESSLEVEL)
+            exc = self._post(body)
+            if exc is None:
+                self.sent_batches += 1
+                self.sent_records += len(records)
+            else:
+                self._drop(batch, exc)
+
+    def _post(self, body):
+        """
+        POST a request body to the URL, with retries.
+
+        Returns:
+          Exception: None if the request succeeded, otherwise the error of
+          the last attempt.
+        """
+        backoff = self.retry_backoff
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                # During shutdown, pending batches get only a single attempt,
+                # so that an unreachable server does not delay the shutdown.
+                if self._stop_event.wait(backoff):
+                    return error
+                backoff = min(backoff * 2, MAX_RETRY_BACKOFF)
+            try:
+                resp = self._pool.request(
+                    'POST', self.url, body=body, headers=self.headers,
+                    retries=False)
+            except urllib3.exceptions.HTTPError as exc:
+                error = exc
+                self._count_failed_request()
+                logprint(logging.WARNING, PRINT_VV,
+                         "Warning: Cannot send batch to HTTP server {u} "
+                         "(attempt {a}): {m}",
+                         u=self.url, a=attempt + 1, m=exc)
+                continue
+            if 200 <= resp.status < 300:
+                return None
+            error = HttpStatusError(f"HTTP status {resp.status}")
+            self._count_failed_request()
+            logprint(logging.WARNING, PRINT_VV,
+                     "Warning: HTTP server {u} rejected batch with HTTP "
+                     "status {s} (attempt {a})",
+                     u=self.url, s=resp.status, a=attempt + 1)
+            if resp.status not in RETRY_HTTP_STATUS:
+                break
+        return error
+
+    def _count_failed_request(self):
+        """
+        Count a failed request.
+        """
+        self.failed_requests += 1
+        if self._failed_counter:
+            self._failed_counter.inc()
+
+    def _drop(self, batch, exc):
+        """
+        Drop a batch that could not be sent, count its records and report
+        the error.
+
+        Without an error aggregator, each drop is logged. With an error
+        aggregator, the OS messages in the batch are recorded as delivery
+        errors, and only the first error of a kind since the last report of
+        the aggregator is logged.
+        """
+        records, seq_nos = batch
+        self.dropped_records += len(records)
+        if self._dropped_counter:
+            self._dropped_counter.inc(len(records))
+        if self.error_aggregator is None or not seq_nos:
+            logprint(logging.WARNING, PRINT_ALWAYS,
+                     "Warning: Dropping {n} records for HTTP server {u}: {m}",
+                     n=len(records), u=self.url, m=exc)
+            return
+        first = [self.error_aggregator.record(self.destination, exc, seq_no)
+                 for seq_no in seq_nos]
+        if any(first):
+            logprint(logging.WARNING, PRINT_ALWAYS,
+                     "Warning: Cannot send {n} OS messages (seq_no {s} to "
+                     "{e}) to HTTP server {u}: {m} - further errors of this "
+                     "kind are reported every {i} sec",
+                     n=len(seq_nos), s=seq_nos[0], e=seq_nos[-1], u=self.url,
+                     m=exc, i=self.error_aggregator.interval)
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Classes for the metrics of the forwarder, and an HTTP server exposing them
+in the Prometheus text format
+"""
+
+import math
+from bisect import bisect_left
+from threading import Thread, Lock
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Bucket upper bounds in seconds for latency histograms
+LATENCY_BUCKETS = (
+    0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0,
+    900.0, 3600.0,
+)
+
+# Bucket upper bounds in seconds for histograms of the duration of hot path
+# stages, which are in the microsecond to millisecond range
+STAGE_BUCKETS = (
+    0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001,
+    0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 1.0,
+)
+
+# Content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _labels_str(labels):
+    """
+    Return the labels in Prometheus text format, e.g. '{cpc="CPC1"}'.
+    """
+    if not labels:
+        return ''
+    items = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"'). \
+            replace('\n', '\\n')
+        items.append(f'{name}="{value}"')
+    return '{' + ','.join(items) + '}'
+
+
+class Counter:
+    """
+    A metric whose value only increases.
+
+    Incrementing is not protected by a lock. Concurrent increments from
+    multiple threads may in rare cases be lost, which is acceptable for
+    metrics.
+    """
+
+    def __init__(self, name, help_text, labels=None):
+        """
+        Parameters:
+          name (string): Metric name.
+          help_text (string): Description of the metric.
+          labels (dict): Label names and values, or None.
+        """
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels or {}
+        self.value = 0
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "name={s.name!r}, "
+                "labels={s.labels!r}, "
+                "value={s.value!r}"
+                ")".format(s=self))
+
+    def inc(self, amount=1):
+        """
+        Increment the counter.
+        """
+        self.value += amount
+
+    def snapshot(self):
+        """
+        Return the current state of the counter as a dict.
+        """
+        return {
+            'name': self.name,
+            'help': self.help_text,
+            'type': 'counter',
+            'labels': dict(self.labels),
+            'value': self.value,
+        }
+
+
+class Histogram:
+    """
+    A metric that counts observed values in buckets with fixed upper bounds,
+    and keeps their sum, count and maximum.
+
+    Observing a value is done with a binary search over the bucket bounds and
+    is not protected by a lock (see Counter).
+    """
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, labels=None):
+        """
+        Parameters:
+          name (string): Metric name.
+          help_text (string): Description of the metric.
+          buckets (tuple of float): Upper bounds of the buckets, ascending.
+            A bucket for infinity is added.
+          labels (dict): Label names and values, or None.
+        """
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labels = labels or {}
+        self.counts = [0] * (len(self.buckets) + 1)  # Not cumulative
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "name={s.name!r}, "
+                "labels={s.labels!r}, "
+                "count={s.count!r}"
+                ")".format(s=self))
+
+    def observe(self, value):
+        """
+        Observe a value.
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def merge(self, snapshot):
+        """
+        Add the observations of a snapshot of a histogram with the same
+        buckets, as returned by snapshot().
+        """
+        for i, count in enumerate(snapshot['counts']):
+            self.counts[i] += count
+        self.sum += snapshot['sum']
+        self.count += snapshot['count']
+        self.max = max(self.max, snapshot['max'])
+
+    def snapshot(self):
+        """
+        Return the current state of the histogram as a dict.
+
+        The bucket counts are not cumulative, and the last bucket is for
+        values above the highest bound.
+        """
+        return {
+            'name': self.name,
+            'help': self.help_text,
+            'type': 'histogram',
+            'labels': dict(self.labels),
+            'buckets': list(self.buckets),
+            'counts': list(self.counts),
+            'sum': self.sum,
+            'count': self.count,
+            'max': self.max,
+        }
+
+
+def bucket_quantile(buckets, counts, quantile):
+    """
+    Return the upper bound of the bucket that contains the quantile of the
+    values counted in the buckets, or None if there are no values.
+
+    Parameters:
+      buckets (list of float): Upper bounds of the buckets.
+      counts (list of int): Non-cumulative counts, with one more item than
+        buckets (for infinity).
+      quantile (float): Quantile, 0..1.
+
+    Returns:
+      float: Upper bound of the bucket (math.inf for the last bucket), or None.
+    """
+    total = sum(counts)
+    if total == 0:
+        return None
+    rank = quantile * total
+    cum = 0
+    for i, count in enumerate(counts):
+        cum += count
+        if cum >= rank and count:
+            return buckets[i] if i < len(buckets) else math.inf
+    return math.inf
+
+
+class MetricsRegistry:
+    """
+    A registry of the metrics of the forwarder.
+
+    Metrics are identified by name and labels; requesting an existing metric
+    returns the existing metric object.
+    """
+
+    def __init__(self):
+        # Metrics
+        # - key: tuple(name, tuple of label items)
+        # - value: Counter or Histogram
+        self._metrics = {}
+        self._lock = Lock()  # Protects self._metrics
+
+    def counter(self, name, help_text, labels=None):
+        """
+        Return the counter with the name and labels, creating it if needed.
+        """
+        return self._get_or_create(Counter, name, help_text, labels)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS,
+                  labels=None):
+        """
+        Return the histogram with the name and labels, creating it if needed.
+        """
+        return self._get_or_create(
+            Histogram, name, help_text, labels, buckets=buckets)
+
+    def remove(self, metric):
+        """
+        Remove a metric from the registry, if it is registered.
+        """
+        key = (metric.name, tuple(metric.labels.items()))
+        with self._lock:
+            self._metrics.pop(key, None)
+
+    def metrics(self):
+        """
+        Return a list of all metric objects.
+        """
+        with self._lock:
+            return list(self._metrics.values())
+
+    def snapshot(self):
+        """
+        Return the current state of all metrics as a list of dicts.
+        """
+        return [metric.snapshot() for metric in self.metrics()]
+
+    def load_snapshots(self, snapshots):
+        """
+        Replace all metrics in the registry with the metrics in a number of
+        snapshots, e.g. from multiple worker processes.
+
+        Metrics with the same name and labels in multiple snapshots are
+        aggregated: Counter values, histogram bucket counts, sums and counts
+        are added up, and the maximum of the histogram maxima is used.
+
+        Parameters:
+          snapshots (list of list of dict): Snapshots, as returned by
+            snapshot().
+        """
+        metrics = {}
+        for snapshot in snapshots:
+            for item in snapshot:
+                key = (item['name'], tuple(item['labels'].items()))
+                metric = metrics.get(key)
+                if item['type'] == 'counter':
+                    if metric is None:
+                        metric = Counter(item['name'], item['help'],
+                                         labels=item['labels'])
+                        metrics[key] = metric
+                    metric.value += item['value']
+                    continue
+                if metric is None:
+                    metric = Histogram(item['name'], item['help'],
+                                       buckets=item['buckets'],
+                                       labels=item['labels'])
+                    metrics[key] = metric
+                metric.merge(item)
+        with self._lock:
+            self._metrics = metrics
+
+    def prometheus_text(self):
+        """
+        Return all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        seen_names = set()
+        for metric in sorted(self.metrics(), key=lambda m: m.name):
+            if metric.name not in seen_names:
+                seen_names.add(metric.name)
+                mtype = 'counter' if isinstance(metric, Counter) \
+                    else 'histogram'
+                lines.append(f'# HELP {metric.name} {metric.help_text}')
+                lines.append(f'# TYPE {metric.name} {mtype}')
+            if isinstance(metric, Counter):
+                lines.append(
+                    f'{metric.name}{_labels_str(metric.labels)} '
+                    f'{metric.value}')
+                continue
+            cum = 0
+            bounds = list(metric.buckets) + ['+Inf']
+            for bound, count in zip(bounds, list(metric.counts)):
+                cum += count
+                labels = dict(metric.labels, le=str(bound))
+                lines.append(
+                    f'{metric.name}_bucket{_labels_str(labels)} {cum}')
+            labels_str = _labels_str(metric.labels)
+            lines.append(f'{metric.name}_sum{labels_str} {metric.sum}')
+            lines.append(f'{metric.name}_count{labels_str} {metric.count}')
+        return '\n'.join(lines) + '\n'
+
+    def _get_or_create(self, cls, name, help_text, labels, **kwargs):
+        labels = labels or {}
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            try:
+                return self._metrics[key]
+            except KeyError:
+                metric = cls(name, help_text, labels=labels, **kwargs)
+                self._metrics[key] = metric
+                return metric
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the metrics HTTP server.
+    """
+
+    def do_GET(self):
+        # pylint: disable=invalid-name
+        """
+        Handle a GET request.
+        """
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # pylint: disable=redefined-builtin
+        """
+        Suppress logging of each request to stderr.
+        """
+
+
+def start_metrics_server(registry, port, host=''):
+    """
+    Start an HTTP server that exposes the metrics of a registry in the
+    Prometheus text format at the '/metrics' path, in a background thread.
+
+    Parameters:
+      registry (MetricsRegistry): The metrics to expose.
+      port (int): Port number to listen on.
+      host (string): Host address to listen on. Empty string for all.
+
+    Returns:
+      ThreadingHTTPServer: The server. Use its shutdown() method to stop it.
+
+    Raises:
+      OSError: Cannot listen on the port.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
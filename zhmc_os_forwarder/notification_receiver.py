@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A notification receiver whose topics can be added and removed while it
+connects to the HMC
+"""
+
+import zhmcclient
+
+
+class NotificationReceiver(zhmcclient.NotificationReceiver):
+    """
+    A zhmcclient.NotificationReceiver whose topics can be added and removed
+    at any time, also while it connects or reconnects to the HMC.
+
+    The zhmcclient notification receiver connects to the HMC when its
+    notifications() method is called and again after a lost connection, and
+    each time subscribes for the topics it was created with. This notification
+    receiver is created without topics. It subscribes for its current topics
+    after each connect, holding the subscription lock, and topics are added
+    and removed holding the same lock. This way, each topic is subscribed for
+    exactly once per connection.
+    """
+
+    def __init__(self, topics, host, userid, password, subscription_lock):
+        """
+        Parameters:
+          topics (list of string): Names of the initial notification topics.
+          host (string): Host name or IP address of the HMC.
+          userid (string): Userid for the HMC.
+          password (string): Password for the HMC.
+          subscription_lock (threading.RLock): Lock that protects the
+            subscriptions.
+        """
+        super().__init__([], host, userid, password)
+        self.topics = list(topics)  # Topics subscribed for on each connect
+        self._subscription_lock = subscription_lock
+        # Indicates that the topics have been subscribed for on the current
+        # connection
+        self._subscribed = False
+
+    def connect(self):
+        """
+        Connect to the HMC and subscribe for the topics.
+
+        Raises:
+          zhmcclient.NotificationConnectionError: STOMP connection failed.
+          zhmcclient.NotificationSubscriptionError: STOMP subscription failed.
+        """
+        with self._subscription_lock:
+            self._subscribed = False
+        super().connect()
+        with self._subscription_lock:
+            for topic in self.topics:
+                self.subscribe(topic)
+            self._subscribed = True
+
+    def add_topic(self, topic):
+        """
+        Add a topic, and subscribe for it if the notification receiver is
+        connected. Otherwise, it is subscribed for when the notification
+        receiver connects.
+
+        Raises:
+          zhmcclient.NotificationSubscriptionError: STOMP subscription failed.
+        """
+        with self._subscription_lock:
+            if topic in self.topics:
+                return
+            self.topics.append(topic)
+            if self._subscribed and self.is_connected():
+                self.subscribe(topic)
+
+    def remove_topic(self, topic):
+        """
+        Remove a topic, and unsubscribe from it if the notification receiver
+        is connected.
+
+        Raises:
+          zhmcclient.NotificationSubscriptionError: STOMP unsubscription
+            failed.
+        """
+        with self._subscription_lock:
+            if topic not in self.topics:
+                return
+            self.topics.remove(topic)
+            if self._subscribed and self.is_connected():
+                self.unsubscribe(topic)
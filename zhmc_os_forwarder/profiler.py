@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A sampling profiler with memory snapshots that can be started and stopped
+while the forwarder is running
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+import tracemalloc
+
+from .utils import logprint, PRINT_ALWAYS, DEFAULT_PROFILE_DIR
+
+# Default interval in seconds between two samples of the thread stacks
+DEFAULT_SAMPLE_INTERVAL = 0.01
+
+# Number of frames stored by tracemalloc for each memory allocation
+TRACEMALLOC_FRAMES = 10
+
+# Number of entries in the text reports
+REPORT_ENTRIES = 50
+
+
+class Profiler:
+    """
+    A sampling profiler with memory snapshots, for analyzing performance
+    problems in a running forwarder.
+
+    While the profiler is active, a thread samples the stacks of all other
+    threads at the sample interval, and tracemalloc traces the memory
+    allocations. When the profiler is stopped, the following files are
+    written to the profile directory, with a common prefix that contains the
+    process ID and the start time:
+
+    * ``<prefix>.stacks.txt`` - The sampled stacks in the collapsed format
+      (one stack per line with the frames separated by ``;``, followed by the
+      number of samples), as used by flame graph tools such as flamegraph.pl
+      and speedscope.
+    * ``<prefix>.top.txt`` - The functions with the most samples, by own
+      samples and by samples including the called functions.
+    * ``<prefix>.memory.txt`` - The source lines with the largest growth of
+      allocated memory while the profiler was active.
+    * ``<prefix>.tracemalloc`` - The tracemalloc snapshot at the stop, for
+      loading with tracemalloc.Snapshot.load().
+
+    The profiler can be toggled from a signal handler with request_toggle(),
+    which only sets a flag. The toggle is then performed by check(), which
+    must be called periodically outside of the signal handler, because
+    starting and stopping the profiler is too heavy for a signal handler.
+    """
+
+    def __init__(self, directory=DEFAULT_PROFILE_DIR,
+                 interval=DEFAULT_SAMPLE_INTERVAL):
+        """
+        Parameters:
+          directory (string): Path name of the directory for the results.
+          interval (float): Interval in seconds between two samples.
+        """
+        self.directory = directory
+        self.interval = interval
+        self._toggle_requested = False
+        self._thread = None  # Thread: The sampling thread, if active
+        self._stop_event = threading.Event()
+        # Number of samples, by stack as tuple(thread name, frames...)
+        self._stacks = {}
+        self._num_samples = 0
+        self._start_time = None  # float: time.time() of the start
+        self._start_snapshot = None  # tracemalloc.Snapshot at the start
+        self._started_tracemalloc = False
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "directory={s.directory!r}, "
+                "interval={s.interval!r}, "
+                "active={s.active!r}"
+                ")".format(s=self))
+
+    @property
+    def active(self):
+        """
+        bool: Indicates whether the profiler is active.
+        """
+        return self._thread is not None
+
+    def request_toggle(self, signum=None, frame=None):
+        # pylint: disable=unused-argument
+        """
+        Request the profiler to be started if inactive, or stopped if active,
+        at the next call of check().
+
+        Can be used as a signal handler.
+        """
+        self._toggle_requested = True
+
+    def check(self):
+        """
+        Start or stop the profiler if that was requested with
+        request_toggle().
+        """
+        if self._toggle_requested:
+            self._toggle_requested = False
+            if self.active:
+                self.stop()
+            else:
+                self.start()
+
+    def start(self):
+        """
+        Start the profiler.
+        """
+        if self.active:
+            return
+        self._stacks = {}
+        self._num_samples = 0
+        self._start_time = time.time()
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._start_snapshot = tracemalloc.take_snapshot()
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        logprint(logging.INFO, PRINT_ALWAYS,
+                 "Profiler started (sample interval: {i} sec)".
+                 format(i=self.interval))
+
+    def stop(self):
+        """
+        Stop the profiler and write the results to the profile directory.
+
+        Errors writing the results are logged, and do not stop the forwarder.
+
+        Returns:
+          list of string: Path names of the files written.
+        """
+        if not self.active:
+            return []
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        snapshot = tracemalloc.take_snapshot()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        start_snapshot = self._start_snapshot
+        self._start_snapshot = None
+
+        prefix = os.path.join(
+            self.directory, 'zhmc_os_forwarder-{p}-{t}'.format(
+                p=os.getpid(),
+                t=time.strftime('%Y%m%d-%H%M%S',
+                                time.localtime(self._start_time))))
+        filenames = []
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            filename = prefix + '.stacks.txt'
+            self._write_stacks(filename)
+            filenames.append(filename)
+            filename = prefix + '.top.txt'
+            self._write_top(filename)
+            filenames.append(filename)
+            filename = prefix + '.memory.txt'
+            _write_memory(filename, snapshot, start_snapshot)
+            filenames.append(filename)
+            filename = prefix + '.tracemalloc'
+            snapshot.dump(filename)
+            filenames.append(filename)
+        except OSError as exc:
+            logprint(logging.ERROR, PRINT_ALWAYS,
+                     "Error writing profiling results to directory {d}: {m}".
+                     format(d=self.directory, m=exc))
+        logprint(logging.INFO, PRINT_ALWAYS,
+                 "Profiler stopped after {n} samples in {t:.1f} sec; "
+                 "results written to: {f}".
+                 format(n=self._num_samples,
+                        t=time.time() - self._start_time,
+                        f=', '.join(filenames) or 'none'))
+        return filenames
+
+    def _run(self):
+        """
+        The function running in the sampling thread.
+        """
+        own_ident = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            self._sample(own_ident)
+
+    def _sample(self, own_ident):
+        """
+        Sample the stacks of all threads except the sampling thread.
+        """
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        # pylint: disable=protected-access
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append('{f} ({m}:{n})'.format(
+                    f=code.co_name, m=os.path.basename(code.co_filename),
+                    n=code.co_firstlineno))
+                frame = frame.f_back
+            frames.append(thread_names.get(ident, str(ident)))
+            stack = tuple(reversed(frames))
+            self._stacks[stack] = self._stacks.get(stack, 0) + 1
+        self._num_samples += 1
+
+    def _write_stacks(self, filename):
+        """
+        Write the sampled stacks in the collapsed format.
+        """
+        with open(filename, 'w', encoding='utf-8') as fp:
+            for stack, count in sorted(self._stacks.items()):
+                fp.write('{s} {n}\n'.format(s=';'.join(stack), n=count))
+
+    def _write_top(self, filename):
+        """
+        Write the functions with the most samples.
+        """
+        own_counts = {}
+        total_counts = {}
+        for stack, count in self._stacks.items():
+            function = stack[-1]
+            own_counts[function] = own_counts.get(function, 0) + count
+            # A recursive function is counted once per stack
+            for function in set(stack[1:]):
+                total_counts[function] = total_counts.get(function, 0) + count
+        num_samples = sum(self._stacks.values()) or 1
+        with open(filename, 'w', encoding='utf-8') as fp:
+            for title, counts in (('own samples', own_counts),
+                                  ('samples including called functions',
+                                   total_counts)):
+                fp.write('Top functions by {t} ({n} thread samples):\n'.
+                         format(t=title, n=num_samples))
+                top = sorted(counts.items(), key=lambda item: -item[1])
+                for function, count in top[:REPORT_ENTRIES]:
+                    fp.write('  {p:5.1f}% {n:8d}  {f}\n'.format(
+                        p=100.0 * count / num_samples, n=count, f=function))
+                fp.write('\n')
+
+
+def _write_memory(filename, snapshot, start_snapshot):
+    """
+    Write the source lines with the largest growth of allocated memory
+    between two tracemalloc snapshots.
+    """
+    stats = snapshot.compare_to(start_snapshot, 'lineno')
+    with open(filename, 'w', encoding='utf-8') as fp:
+        fp.write('Top source lines by growth of allocated memory:\n')
+        for stat in stats[:REPORT_ENTRIES]:
+            fp.write('  {s}\n'.format(s=stat))
+        total = sum(stat.size for stat in snapshot.statistics('filename'))
+        fp.write('\nTotal traced memory at the stop: {t} KiB\n'.
+                 format(t=total // 1024))
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Recording of received notifications to a file, and reading of recordings
+for replaying them
+"""
+
+import time
+import json
+import logging
+from threading import Thread, Event, Lock
+
+from ._version import __version__
+from .utils import logprint, PRINT_ALWAYS
+
+# Version of the format of recording files
+RECORDING_VERSION = 1
+
+# Default time in seconds between flushes of the recording file
+DEFAULT_RECORDING_FLUSH_INTERVAL = 1.0
+
+
+class Recorder:
+    """
+    Records received notifications to a recording file.
+
+    A recording file is a text file with one JSON object per line, that is
+    only appended to. There are three kinds of records:
+
+    * Start record, written when the recording is started, e.g.
+      ``{"recording":1,"version":"1.2.0","time":1700000000.0}``.
+    * LPAR record, written before the first notification of a forwarded LPAR,
+      with the identity of the LPAR that is needed for matching it against the
+      forwarder config when replaying, e.g.
+      ``{"lpar":{"uri":"...","name":"LPAR1","class":"logical-partition",
+      "cpc-uri":"...","cpc-name":"CPC1"}}``.
+    * Notification record, for each received notification, with the time it
+      was received (time.time()), and its headers and message, e.g.
+      ``{"time":1700000001.5,"headers":{...},"message":{...}}``.
+
+    Writes are buffered, so that recording does not slow down the receiving
+    of notifications. The buffer is flushed periodically in a background
+    thread and when the recording file is closed, so that a crash of the
+    forwarder loses at most the records of the last flush interval.
+    """
+
+    def __init__(self, filename, lpar_infos,
+                 flush_interval=DEFAULT_RECORDING_FLUSH_INTERVAL):
+        """
+        Parameters:
+          filename (string): Path name of the recording file. The recording
+            is appended if the file exists.
+          lpar_infos (dict): The forwarded LPARs, as the forwarded_lpar_infos
+            attribute of ForwardedLpars, for writing LPAR records.
+          flush_interval (float): Time in seconds between flushes of the
+            recording file.
+
+        Raises:
+          OSError: Error opening the recording file.
+        """
+        self.filename = filename
+        self.lpar_infos = lpar_infos
+        self.flush_interval = flush_interval
+        self.num_notifications = 0
+        self._lock = Lock()
+        # URIs of the LPARs for which an LPAR record has been written
+        self._recorded_uris = set()
+        # pylint: disable=consider-using-with
+        self._file = open(filename, 'a', encoding='utf-8')
+        self._write({'recording': RECORDING_VERSION, 'version': __version__,
+                     'time': time.time()})
+        self._stop_event = Event()
+        self._flush_thread = Thread(target=self._run_flush, daemon=True)
+        self._flush_thread.start()
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "filename={s.filename!r}, "
+                "num_notifications={s.num_notifications!r}"
+                ")".format(s=self))
+
+    def record(self, headers, message):
+        """
+        Record a received notification, preceded by an LPAR record if it is
+        the first notification of a forwarded LPAR.
+
+        Errors writing the recording file are logged, and do not stop the
+        forwarder.
+
+        Parameters:
+          headers (dict): The headers of the notification.
+          message (dict): The message of the notification.
+        """
+        recv_time = time.time()
+        lpar_uri = headers.get('object-uri')
+        with self._lock:
+            try:
+                if lpar_uri not in self._recorded_uris:
+                    lpar_info = self.lpar_infos.get(lpar_uri)
+                    if lpar_info is not None:
+                        self._write({'lpar': {
+                            'uri': lpar_info.uri,
+                            'name': lpar_info.name,
+                            'class': headers.get('class'),
+                            'cpc-uri': lpar_info.cpc_uri,
+                            'cpc-name': lpar_info.cpc_name,
+                        }})
+                        self._recorded_uris.add(lpar_uri)
+                self._write({'time': recv_time, 'headers': headers,
+                             'message': message})
+            except (OSError, ValueError) as exc:
+                # ValueError is raised when the file has been closed
+                logprint(logging.ERROR, PRINT_ALWAYS,
+                         "Error writing recording file {f}: {m}",
+                         f=self.filename, m=exc)
+                return
+            self.num_notifications += 1
+
+    def flush(self):
+        """
+        Flush the write buffer of the recording file.
+
+        Raises:
+          OSError: Error writing the recording file.
+        """
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self):
+        """
+        Stop the flush thread, and flush and close the recording file.
+        """
+        self._stop_event.set()
+        self._flush_thread.join()
+        with self._lock:
+            self._file.close()
+
+    def _write(self, record):
+        """
+        Write a record to the write buffer of the recording file.
+        """
+        self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def _run_flush(self):
+        """
+        The method running as the flush thread.
+        """
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError as exc:
+                logprint(logging.ERROR, PRINT_ALWAYS,
+                         "Error writing recording file {f}: {m}",
+                         f=self.filename, m=exc)
+
+
+def read_recording(filename):
+    """
+    Read the records of a recording file.
+
+    Lines that are not valid JSON, e.g. a last line that was only partially
+    written when the forwarder ended, are logged and skipped.
+
+    Parameters:
+      filename (string): Path name of the recording file.
+
+    Returns:
+      iterator of dict: The records of the recording file (see Recorder).
+
+    Raises:
+      OSError: Error reading the recording file.
+    """
+    with open(filename, encoding='utf-8') as fp:
+        for line_no, line in enumerate(fp, start=1):
+            try:
+                yield json.loads(line)
+            except ValueError as exc:
+                logprint(logging.WARNING, PRINT_ALWAYS,
+                         "Warning: Skipping invalid line {n} in recording "
+                         "file {f}: {m}", n=line_no, f=filename, m=exc)
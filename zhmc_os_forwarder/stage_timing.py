@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A class for measuring the duration of the stages of the forwarding hot path
+"""
+
+import time
+import logging
+
+from .metrics import STAGE_BUCKETS
+from .utils import logprint, PRINT_ALWAYS
+
+# Stages of the hot path, in the order in which an OS message passes them:
+# - lookup: Looking up the forwarded LPAR of an OS message notification.
+# - handle: Handling an OS message notification in the forwarder thread,
+#   including the lookup and putting the OS messages into the delivery queue.
+# - queue: Time an OS message waits in the delivery queue.
+# - format: Formatting an OS message into records for the destinations.
+# - syslog_send: Sending the records of an OS message to a syslog server.
+# - file_write: Writing the records of an OS message to a file destination.
+# - http_batch: Adding the records of an OS message to the batches of the
+#   HTTP destinations.
+# - deliver: Delivering an OS message to all its destinations, including
+#   formatting.
+STAGES = ('lookup', 'handle', 'queue', 'format', 'syslog_send', 'file_write',
+          'http_batch', 'deliver')
+
+
+class StageTimer:
+    """
+    Measures the duration of the stages of the forwarding hot path into
+    histograms, if enabled.
+
+    The measurement can be enabled and disabled at any time. While disabled,
+    start() returns None and stop() returns immediately, so that the
+    overhead is a few attribute accesses per stage. The histograms are
+    created when the measurement is enabled for the first time.
+
+    Usage::
+
+        start_time = stage_timer.start()
+        ...  # the stage
+        stage_timer.stop('format', start_time)
+    """
+
+    def __init__(self, metrics, enabled=False):
+        """
+        Parameters:
+          metrics (MetricsRegistry): Registry for the stage histograms.
+          enabled (bool): Enable the measurement.
+        """
+        self.metrics = metrics
+        self.enabled = False
+        # Histograms of the stage durations, by stage
+        self.histograms = {}
+        if enabled:
+            self.enable()
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "enabled={s.enabled!r}"
+                ")".format(s=self))
+
+    def enable(self):
+        """
+        Enable the measurement.
+        """
+        if not self.histograms:
+            self.histograms = {
+                stage: self.metrics.histogram(
+                    'zhmc_os_forwarder_stage_seconds',
+                    "Duration of a stage of the forwarding hot path, in "
+                    "seconds",
+                    buckets=STAGE_BUCKETS, labels={'stage': stage})
+                for stage in STAGES
+            }
+        self.enabled = True
+
+    def disable(self):
+        """
+        Disable the measurement. The histograms keep their values.
+        """
+        self.enabled = False
+
+    def toggle(self):
+        """
+        Enable the measurement if disabled, or disable it if enabled.
+
+        Returns:
+          bool: Indicates whether the measurement is now enabled.
+        """
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+        return self.enabled
+
+    def start(self):
+        """
+        Return the start time of a stage for stop(), or None if the
+        measurement is disabled.
+        """
+        if self.enabled:
+            return time.perf_counter()
+        return None
+
+    def stop(self, stage, start_time):
+        """
+        Observe the duration of a stage since its start time, if the
+        measurement was enabled when the stage was started.
+
+        Parameters:
+          stage (string): The stage, one of STAGES.
+          start_time (float): Start time of the stage, as returned by
+            start().
+        """
+        if start_time is not None:
+            self.histograms[stage].observe(time.perf_counter() - start_time)
+
+    def observe(self, stage, duration):
+        """
+        Observe the duration of a stage that has been measured by the caller,
+        if the measurement is enabled.
+
+        Parameters:
+          stage (string): The stage, one of STAGES.
+          duration (float): Duration of the stage in seconds.
+        """
+        if self.enabled:
+            self.histograms[stage].observe(duration)
+
+
+def toggle_handler(stage_timer):
+    """
+    Return a signal handler that toggles the measurement of a stage timer and
+    logs its new state.
+    """
+
+    def handler(signum, frame):  # pylint: disable=unused-argument
+        enabled = stage_timer.toggle()
+        logprint(logging.INFO, PRINT_ALWAYS,
+                 "Stage timing is now {}".
+                 format('enabled' if enabled else 'disabled'))
+
+    return handler
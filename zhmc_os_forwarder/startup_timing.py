@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A class for measuring the duration of the phases of the forwarder startup
+"""
+
+import time
+import json
+import logging
+from threading import Lock
+from contextlib import contextmanager
+
+from .utils import logprint, PRINT_V, PRINT_VV
+
+# Phases of the startup, in the order in which they happen:
+# - logon: Logging on to the HMC.
+# - cpc_list: Listing the CPCs.
+# - lpar_list: Listing the LPARs of a CPC, for each CPC.
+# - config_match: Matching an LPAR against the forwarder config, for each
+#   LPAR.
+# - receiver_create: Creating a notification receiver, for each receiver.
+# - syslog_setup: Connecting to a syslog server, for each syslog server.
+# - channel_open: Opening the OS message channel of an LPAR, for each LPAR,
+#   including the lookup of the topic of an already open channel.
+# - topic_lookup: Looking up the topic of an already open OS message channel
+#   of an LPAR (HTTP status 409, reason 331), for each such LPAR.
+# - subscribe: Subscribing for the OS message notifications of an LPAR, for
+#   each LPAR.
+# - subscribe_all: Opening the OS message channels of all LPARs and
+#   subscribing for their notifications, which is done concurrently.
+STARTUP_PHASES = ('logon', 'cpc_list', 'lpar_list', 'config_match',
+                  'receiver_create', 'syslog_setup', 'channel_open',
+                  'topic_lookup', 'subscribe', 'subscribe_all')
+
+# Number of slowest items reported for each phase
+MAX_SLOWEST_ITEMS = 5
+
+
+class StartupTimer:
+    """
+    Measures the duration of the phases of the forwarder startup.
+
+    Each phase is measured for each of its operations, e.g. for each CPC or
+    LPAR. The durations are observed in histograms, and the slowest
+    operations of each phase are kept with their item (e.g. the CPC or LPAR
+    name) for the report. Operations of a phase may run concurrently.
+
+    After finish(), nothing is measured anymore, so that the same code paths
+    can be used after the startup without affecting the startup timing.
+
+    In active/standby mode, the time a standby forwarder waits for the lease
+    between begin_standby() and end_standby() is not included in the total
+    startup time, but reported separately.
+
+    Usage::
+
+        with startup_timer.measure('lpar_list', cpc.name):
+            ...  # the operation
+    """
+
+    def __init__(self, metrics):
+        """
+        Parameters:
+          metrics (MetricsRegistry): Registry for the phase histograms.
+        """
+        self.start_time = time.monotonic()
+        self.end_time = None  # float: time.monotonic() of finish()
+        self.standby_time = None  # float: Seconds waited for the lease
+        self._standby_start = None  # float: time.monotonic() of standby
+        self._lock = Lock()
+        self.histograms = {
+            phase: metrics.histogram(
+                'zhmc_os_forwarder_startup_phase_seconds',
+                "Duration of the operations of a phase of the forwarder "
+                "startup, in seconds",
+                labels={'phase': phase})
+            for phase in STARTUP_PHASES
+        }
+        # Slowest operations, by phase, as list of tuple(duration, item),
+        # slowest first
+        self.slowest = {phase: [] for phase in STARTUP_PHASES}
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "finished={f!r}"
+                ")".format(s=self, f=self.end_time is not None))
+
+    @contextmanager
+    def measure(self, phase, item=None):
+        """
+        Context manager that measures the duration of an operation of a
+        startup phase, including when the operation raises an exception.
+
+        Parameters:
+          phase (string): The phase, one of STARTUP_PHASES.
+          item (string): The item of the operation, e.g. the CPC name, or
+            None.
+        """
+        if self.end_time is not None:
+            yield
+            return
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(phase, time.monotonic() - start_time, item)
+
+    def record(self, phase, duration, item=None):
+        """
+        Record the duration of an operation of a startup phase.
+
+        Parameters:
+          phase (string): The phase, one of STARTUP_PHASES.
+          duration (float): Duration of the operation in seconds.
+          item (string): The item of the operation, e.g. the CPC name, or
+            None.
+        """
+        if self.end_time is not None:
+            return
+        with self._lock:
+            self.histograms[phase].observe(duration)
+            if item is not None:
+                slowest = self.slowest[phase]
+                slowest.append((duration, item))
+                slowest.sort(key=lambda di: -di[0])
+                del slowest[MAX_SLOWEST_ITEMS:]
+
+    def begin_standby(self):
+        """
+        Begin waiting for the lease in standby mode.
+        """
+        self._standby_start = time.monotonic()
+
+    def end_standby(self):
+        """
+        End waiting for the lease, when the lease has been acquired.
+        """
+        if self._standby_start is not None:
+            self.standby_time = time.monotonic() - self._standby_start
+            self._standby_start = None
+
+    def finish(self):
+        """
+        Finish the measurement.
+        """
+        if self.end_time is None:
+            self.end_time = time.monotonic()
+
+    def as_dict(self):
+        """
+        Return the startup timing in machine-readable form.
+
+        Returns:
+          dict: With items 'total' (float: elapsed time in seconds since the
+          start of the startup until finish(), or until now, without the
+          time waited for the lease), 'standby' (float: time in seconds
+          waited for the lease, or None if not in active/standby mode) and
+          'phases' (dict by phase name of dicts with items 'count', 'sum',
+          'max' and 'slowest' (list of [item, duration]), for the phases
+          that had operations).
+        """
+        end_time = self.end_time or time.monotonic()
+        if self._standby_start is not None:
+            standby_time = end_time - self._standby_start
+        else:
+            standby_time = self.standby_time
+        phases = {}
+        with self._lock:
+            for phase in STARTUP_PHASES:
+                hist = self.histograms[phase]
+                if not hist.count:
+                    continue
+                phases[phase] = {
+                    'count': hist.count,
+                    'sum': hist.sum,
+                    'max': hist.max,
+                    'slowest': [[item, duration] for duration, item
+                                in self.slowest[phase]],
+                }
+        return {
+            'total': end_time - self.start_time - (standby_time or 0),
+            'standby': standby_time,
+            'phases': phases,
+        }
+
+    def report(self):
+        """
+        Log the startup timing, with one message per phase, and in
+        machine-readable form as JSON.
+        """
+        timing = self.as_dict()
+        logprint(logging.INFO, PRINT_V,
+                 "Startup took {t:.3f} sec",
+                 t=timing['total'])
+        if timing['standby'] is not None:
+            logprint(logging.INFO, PRINT_V,
+                     "Standby waited {t:.3f} sec for the lease (not included "
+                     "in the startup time)",
+                     t=timing['standby'])
+        for phase, info in timing['phases'].items():
+            slowest = ', '.join(
+                f'{item} ({duration:.3f} sec)'
+                for item, duration in info['slowest'])
+            logprint(logging.INFO, PRINT_V,
+                     "Startup phase {p}: {n} operations, {s:.3f} sec in "
+                     "total, max {m:.3f} sec{l}",
+                     p=phase, n=info['count'], s=info['sum'], m=info['max'],
+                     l=f"; slowest: {slowest}" if slowest else "")
+        logprint(logging.INFO, PRINT_VV,
+                 "Startup timing as JSON: {j}",
+                 j=json.dumps(timing))
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A supervisor that runs the forwarder in multiple worker processes
+"""
+
+import os
+import sys
+import time
+import signal
+import logging
+import multiprocessing
+
+import urllib3
+import zhmcclient
+
+from . import utils
+from .forwarder_server import ForwarderServer
+from .metrics import MetricsRegistry
+from .stage_timing import toggle_handler
+from .profiler import Profiler
+from .utils import logprint, PRINT_ALWAYS, PRINT_V, EarlyExit, ImproperExit, \
+    parse_yaml_file, setup_logging
+
+# Interval in seconds at which workers report their metrics to the supervisor
+WORKER_REPORT_INTERVAL = 5
+
+# Time in seconds without a report from a running worker after which the
+# worker is considered hung and is restarted
+WORKER_STALL_TIMEOUT = 60
+
+# Time in seconds a forwarder thread or the delivery thread of a worker may
+# work on a single notification or OS message before the worker is
+# considered hung and is restarted
+WORKER_THREAD_STALL_TIMEOUT = 120
+
+# Delay in seconds before restarting a worker for the first time. The delay
+# doubles with each restart, up to WORKER_MAX_RESTART_DELAY.
+WORKER_RESTART_DELAY = 1
+
+# Maximum delay in seconds before restarting a worker
+WORKER_MAX_RESTART_DELAY = 60
+
+# Time in seconds a worker must have been running for its restart delay to be
+# reset to WORKER_RESTART_DELAY
+WORKER_STABLE_TIME = 300
+
+# Time in seconds to wait for a worker to shut down before terminating it
+WORKER_SHUTDOWN_TIMEOUT = 30
+
+
+def run_worker(args, worker_index, num_workers, conn):
+    """
+    The function running in a worker process.
+
+    Runs a forwarder server for the forwarded LPARs assigned to the worker,
+    and reports its metrics and the health of its threads to the supervisor
+    until the supervisor requests the worker to stop, or goes away.
+
+    Parameters:
+      args (argparse.Namespace): Parsed command line arguments.
+      worker_index (int): Index of the worker, 0..num_workers-1.
+      num_workers (int): Number of workers.
+      conn (multiprocessing.connection.Connection): Connection to the
+        supervisor.
+    """
+    # Ctrl-C is handled by the supervisor, which then stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # SIGUSR1 and SIGUSR2 are forwarded by the supervisor, and must not end
+    # the worker before their handlers are set up
+    for signame in ('SIGUSR1', 'SIGUSR2'):
+        if hasattr(signal, signame):
+            signal.signal(getattr(signal, signame), signal.SIG_IGN)
+    utils.VERBOSE_LEVEL = args.verbose
+    utils.SCHEMA_CACHE_DIR = args.schema_cache
+    urllib3.disable_warnings()
+
+    forwarder_server = None
+    profiler = Profiler(args.profile_dir)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, profiler.request_toggle)
+    if args.profile:
+        profiler.start()
+    rc = 0
+    try:
+        setup_logging(args.log_dest, args.log_complevels, args.syslog_facility)
+        config_data = parse_yaml_file(
+            args.c, 'forwarder config file', 'config_schema.yaml')
+        forwarder_server = ForwarderServer(
+            config_data, args.c, stats_interval=args.stats_interval,
+            num_receivers=args.receivers, shard=args.shard,
+            worker=(worker_index, num_workers),
+            stage_timing=args.stage_timing,
+            record=f'{args.record}.{worker_index}' if args.record else None)
+        if hasattr(signal, 'SIGUSR2'):
+            signal.signal(signal.SIGUSR2,
+                          toggle_handler(forwarder_server.stage_timer))
+        forwarder_server.startup()
+        logprint(logging.INFO, PRINT_ALWAYS,
+                 "Worker {i} is up and running, forwarding {n} LPARs".
+                 format(i=worker_index,
+                        n=len(forwarder_server.forwarded_lpars.
+                              forwarded_lpar_infos)))
+        while True:
+            conn.send((forwarder_server.metrics.snapshot(),
+                       forwarder_server.health()))
+            profiler.check()
+            if conn.poll(WORKER_REPORT_INTERVAL):
+                # Stop request from the supervisor, or the supervisor is gone
+                break
+            if forwarder_server.lease_lost:
+                raise ImproperExit(
+                    "The worker has lost or given up the lease")
+    except (zhmcclient.Error, EarlyExit, ImproperExit) as exc:
+        logprint(logging.ERROR, PRINT_ALWAYS,
+                 "Error in worker {i}: {e}: {m}".
+                 format(i=worker_index, e=exc.__class__.__name__, m=exc))
+        rc = 1
+    except OSError:
+        # The supervisor is gone
+        pass
+    finally:
+        if forwarder_server:
+            forwarder_server.shutdown()
+        profiler.stop()
+    sys.exit(rc)
+
+
+# pylint: disable=too-few-public-methods
+class _WorkerInfo:
+    """
+    State of a worker process in the supervisor
+    """
+
+    def __init__(self, index):
+        self.index = index  # int: Index of the worker
+        self.process = None  # multiprocessing.Process: The worker process
+        self.conn = None  # Connection: Connection to the worker
+        self.start_time = None  # float: time.monotonic() of the start
+        self.report_time = None  # float: time.monotonic() of last report
+        self.snapshot = []  # list of dict: Last reported metrics
+        self.health = []  # list of dict: Last reported thread health
+        self.restart_delay = WORKER_RESTART_DELAY  # float: Next restart delay
+        self.restart_time = None  # float: time.monotonic() of planned restart
+        self.restarts = None  # metrics.Counter: Restarts of the worker
+
+
+class Supervisor:
+    """
+    A supervisor that runs the forwarder in multiple worker processes.
+
+    The forwarded LPARs are distributed across the workers by their LPAR URI.
+    The supervisor restarts workers that end, stop reporting, or report a
+    forwarder thread or delivery thread that has ended or is stuck, and
+    aggregates the metrics reported by the workers.
+    """
+
+    def __init__(self, args, num_workers):
+        """
+        Parameters:
+          args (argparse.Namespace): Parsed command line arguments, passed on
+            to the workers.
+          num_workers (int): Number of worker processes.
+        """
+        self.args = args
+        self.num_workers = num_workers
+        self._context = multiprocessing.get_context('spawn')
+        self._own_metrics = MetricsRegistry()  # Metrics of the supervisor
+        # Aggregated metrics of the supervisor and the workers
+        self.metrics = MetricsRegistry()
+        self.workers = []  # _WorkerInfo objects, by worker index
+        for index in range(num_workers):
+            worker = _WorkerInfo(index)
+            worker.restarts = self._own_metrics.counter(
+                'zhmc_os_forwarder_worker_restarts_total',
+                "Number of restarts of a worker process",
+                labels={'worker': str(index)})
+            self.workers.append(worker)
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "num_workers={s.num_workers!r}"
+                ")".format(s=self))
+
+    def startup(self):
+        """
+        Start the worker processes.
+        """
+        for worker in self.workers:
+            self._start_worker(worker)
+
+    def check(self):
+        """
+        Receive the reports of the workers, restart workers that have ended,
+        stopped reporting or are unhealthy, and aggregate the metrics.
+
+        Must be called periodically, e.g. every second.
+        """
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.process is None:
+                if now >= worker.restart_time:
+                    worker.restarts.inc()
+                    self._start_worker(worker)
+                continue
+            try:
+                while worker.conn.poll():
+                    worker.snapshot, worker.health = worker.conn.recv()
+                    worker.report_time = time.monotonic()
+            except (EOFError, OSError):
+                pass  # The worker has ended; handled below
+            problem = self._health_problem(worker)
+            if worker.process.exitcode is not None:
+                logprint(logging.WARNING, PRINT_ALWAYS,
+                         "Warning: Worker {i} has ended with exit code {rc}".
+                         format(i=worker.index, rc=worker.process.exitcode))
+                self._plan_restart(worker, now)
+            elif worker.report_time is not None and \
+                    now - worker.report_time > WORKER_STALL_TIMEOUT:
+                logprint(logging.WARNING, PRINT_ALWAYS,
+                         "Warning: Worker {i} has not reported for {t} sec; "
+                         "terminating it".
+                         format(i=worker.index, t=WORKER_STALL_TIMEOUT))
+                worker.process.kill()
+                worker.process.join()
+                self._plan_restart(worker, now)
+            elif problem:
+                logprint(logging.WARNING, PRINT_ALWAYS,
+                         "Warning: In worker {i}, {p}; terminating it".
+                         format(i=worker.index, p=problem))
+                worker.process.kill()
+                worker.process.join()
+                self._plan_restart(worker, now)
+        snapshots = [self._own_metrics.snapshot()]
+        snapshots.extend(worker.snapshot for worker in self.workers)
+        self.metrics.load_snapshots(snapshots)
+
+    def shutdown(self):
+        """
+        Stop the worker processes.
+        """
+        for worker in self.workers:
+            if worker.process is not None:
+                try:
+                    worker.conn.send(None)  # Stop request
+                except OSError:
+                    pass  # The worker has ended
+        deadline = time.monotonic() + WORKER_SHUTDOWN_TIMEOUT
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            worker.process.join(max(deadline - time.monotonic(), 0))
+            if worker.process.exitcode is None:
+                logprint(logging.WARNING, PRINT_ALWAYS,
+                         "Warning: Worker {i} did not shut down within {t} "
+                         "sec; terminating it".
+                         format(i=worker.index, t=WORKER_SHUTDOWN_TIMEOUT))
+                worker.process.kill()
+                worker.process.join()
+            worker.conn.close()
+            worker.process = None
+
+    def signal_workers(self, signum):
+        """
+        Send a signal to the running worker processes.
+        """
+        for worker in self.workers:
+            if worker.process is not None and worker.process.pid is not None:
+                try:
+                    os.kill(worker.process.pid, signum)
+                except OSError:
+                    pass  # The worker has ended
+
+    def _start_worker(self, worker):
+        """
+        Start the process of a worker.
+        """
+        logprint(logging.INFO, PRINT_V,
+                 "Starting worker {i}".format(i=worker.index))
+        conn, child_conn = self._context.Pipe()
+        worker.process = self._context.Process(
+            target=run_worker,
+            args=(self.args, worker.index, self.num_workers, child_conn),
+            name=f'zhmc_os_forwarder-worker-{worker.index}')
+        worker.process.start()
+        child_conn.close()
+        worker.conn = conn
+        worker.start_time = time.monotonic()
+        worker.report_time = None
+        worker.health = []
+
+    @staticmethod
+    def _health_problem(worker):
+        """
+        Return a description of the first problem in the last reported health
+        of a worker, or None if it is healthy.
+        """
+        for thread in worker.health:
+            if not thread['alive']:
+                return "thread {n} has ended".format(n=thread['name'])
+            if thread['busy_time'] > WORKER_THREAD_STALL_TIMEOUT:
+                return "thread {n} has not made progress for {t:.0f} sec". \
+                    format(n=thread['name'], t=thread['busy_time'])
+        return None
+
+    @staticmethod
+    def _plan_restart(worker, now):
+        """
+        Clean up an ended worker and plan its restart, with a delay that
+        increases while the worker keeps ending soon after being started.
+        """
+        worker.conn.close()
+        worker.process = None
+        if now - worker.start_time >= WORKER_STABLE_TIME:
+            worker.restart_delay = WORKER_RESTART_DELAY
+        worker.restart_time = now + worker.restart_delay
+        logprint(logging.INFO, PRINT_ALWAYS,
+                 "Restarting worker {i} in {t} sec".
+                 format(i=worker.index, t=worker.restart_delay))
+        worker.restart_delay = min(
+            worker.restart_delay * 2, WORKER_MAX_RESTART_DELAY)
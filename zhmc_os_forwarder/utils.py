@@ -20,12 +20,16 @@ import os
 import types
 import platform
 import time
+import json
 import logging
+import hashlib
+import tempfile
+from functools import lru_cache
 from contextlib import contextmanager
 
-import yaml
-import jsonschema
-import zhmcclient
+# The yaml, jsonschema and zhmcclient packages are imported where they are
+# used, so that CLI paths such as --version, --help-config and --check-config
+# do not load them, or only the ones they need.
 
 #
 # GLobal variables that will be set after command line parsing and will
@@ -38,6 +42,14 @@ VERBOSE_LEVEL = 0
 # Indicates that logging was enabled on the command line
 LOGGING_ENABLED = False
 
+# Lowest Python logging level at which the forwarder logger logs messages.
+# Higher than any logging level while logging is disabled, so that logprint()
+# can decide without calling into the logging module whether to log.
+LOG_LEVEL = logging.CRITICAL + 1
+
+# Directory for caching the parsed JSON schema files, or None for no caching
+SCHEMA_CACHE_DIR = None
+
 
 #
 # Logging
@@ -45,11 +57,15 @@ LOGGING_ENABLED = False
 
 LOGGER_NAME = 'zhmcosforwarder'
 
-# Logger names by log component
+# The forwarder logger, for logprint()
+_LOGGER = logging.getLogger(LOGGER_NAME)
+
+# Logger names by log component. The names of the zhmcclient loggers are
+# zhmcclient.HMC_LOGGER_NAME and zhmcclient.JMS_LOGGER_NAME.
 LOGGER_NAMES = {
     'forwarder': LOGGER_NAME,
-    'hmc': zhmcclient.HMC_LOGGER_NAME,
-    'jms': zhmcclient.JMS_LOGGER_NAME,
+    'hmc': 'zhmcclient.hmc',
+    'jms': 'zhmcclient.jms',
 }
 VALID_LOG_COMPONENTS = list(LOGGER_NAMES.keys()) + ['all']
 
@@ -100,6 +116,18 @@ SYSLOG_ADDRESS = {
 
 DEFAULT_CONFIG_FILE = '/etc/zhmc-os-forwarder/config.yaml'
 
+# Interval in seconds for logging statistics
+DEFAULT_STATS_INTERVAL = 300
+
+# Number of notification receivers
+DEFAULT_NUM_RECEIVERS = 1
+
+# Number of worker processes
+DEFAULT_NUM_WORKERS = 1
+
+# Directory for the profiling results
+DEFAULT_PROFILE_DIR = tempfile.gettempdir()
+
 
 #
 # Retry
@@ -108,17 +136,8 @@ DEFAULT_CONFIG_FILE = '/etc/zhmc-os-forwarder/config.yaml'
 # Sleep time in seconds when retrying HMC connections
 RETRY_SLEEP_TIME = 10
 
-# Retry / timeout configuration for zhmcclient (used at the socket level)
-RETRY_TIMEOUT_CONFIG = zhmcclient.RetryTimeoutConfig(
-    connect_timeout=10,
-    connect_retries=2,
-    read_timeout=300,
-    read_retries=2,
-    max_redirects=zhmcclient.DEFAULT_MAX_REDIRECTS,
-    operation_timeout=zhmcclient.DEFAULT_OPERATION_TIMEOUT,
-    status_timeout=zhmcclient.DEFAULT_STATUS_TIMEOUT,
-    name_uri_cache_timetolive=zhmcclient.DEFAULT_NAME_URI_CACHE_TIMETOLIVE,
-)
+# The retry / timeout configuration for zhmcclient is RETRY_TIMEOUT_CONFIG
+# in the forwarder_server module.
 
 
 #
@@ -188,6 +207,8 @@ def zhmc_exceptions(session, config_filename):
             client = zhmcclient.Client(session)
             version_info = client.version_info()
     """
+    # pylint: disable=import-outside-toplevel
+    import zhmcclient
     try:
         yield
     except zhmcclient.ConnectionError as exc:
@@ -250,10 +271,12 @@ def parse_yaml_file(yamlfile, name, schemafilename=None):
     Raises:
         ImproperExit
     """
+    # pylint: disable=import-outside-toplevel
+    import yaml
 
     try:
         with open(yamlfile, encoding='utf-8') as fp:
-            yaml_obj = yaml.safe_load(fp)
+            yaml_obj = yaml.load(fp, Loader=_yaml_loader())
     except FileNotFoundError as exc:
         new_exc = ImproperExit(
             "Cannot find {} {}: {}".
@@ -275,49 +298,133 @@ def parse_yaml_file(yamlfile, name, schemafilename=None):
 
     if schemafilename:
 
-        schemafile = os.path.join(
-            os.path.dirname(__file__), 'schemas', schemafilename)
-        try:
-            with open(schemafile, encoding='utf-8') as fp:
-                schema = yaml.safe_load(fp)
-        except FileNotFoundError as exc:
-            new_exc = ImproperExit(
-                "Internal error: Cannot find schema file {}: {}".
-                format(schemafile, exc))
-            new_exc.__cause__ = None  # pylint: disable=invalid-name
-            raise new_exc
-        except PermissionError as exc:
-            new_exc = ImproperExit(
-                "Internal error: Permission error reading schema file {}: {}".
-                format(schemafile, exc))
-            new_exc.__cause__ = None  # pylint: disable=invalid-name
-            raise new_exc
-        except yaml.YAMLError as exc:
-            new_exc = ImproperExit(
-                "Internal error: YAML error reading schema file {}: {}".
-                format(schemafile, exc))
-            new_exc.__cause__ = None  # pylint: disable=invalid-name
-            raise new_exc
+        # pylint: disable=import-outside-toplevel
+        import jsonschema
 
-        try:
-            jsonschema.validate(yaml_obj, schema)
-        except jsonschema.exceptions.SchemaError as exc:
-            new_exc = ImproperExit(
-                "Internal error: Invalid JSON schema file {}: {}".
-                format(schemafile, exc))
-            new_exc.__cause__ = None
-            raise new_exc
-        except jsonschema.exceptions.ValidationError as exc:
-            element_str = json_path_str(exc.absolute_path)
+        validator = schema_validator(schemafilename)
+        error = jsonschema.exceptions.best_match(
+            validator.iter_errors(yaml_obj))
+        if error is not None:
+            element_str = json_path_str(error.absolute_path)
             new_exc = ImproperExit(
                 "Validation of {} {} failed on {}: {}".
-                format(name, yamlfile, element_str, exc.message))
+                format(name, yamlfile, element_str, error.message))
             new_exc.__cause__ = None
             raise new_exc
 
     return yaml_obj
 
 
+@lru_cache(maxsize=None)
+def schema_validator(schemafilename):
+    """
+    Return a JSON schema validator for a JSON schema file in YAML format in
+    the 'schemas' directory of this package.
+
+    The schema file is loaded and checked once per process. If
+    SCHEMA_CACHE_DIR is set, the parsed schema is cached in that directory
+    as JSON, which is much faster to load than YAML.
+
+    Raises:
+        ImproperExit
+    """
+    # pylint: disable=import-outside-toplevel
+    import jsonschema
+
+    schemafile = os.path.join(
+        os.path.dirname(__file__), 'schemas', schemafilename)
+    schema = _load_schema(schemafile)
+    validator_class = jsonschema.validators.validator_for(schema)
+    try:
+        validator_class.check_schema(schema)
+    except jsonschema.exceptions.SchemaError as exc:
+        new_exc = ImproperExit(
+            "Internal error: Invalid JSON schema file {}: {}".
+            format(schemafile, exc))
+        new_exc.__cause__ = None
+        raise new_exc
+    return validator_class(schema)
+
+
+def _load_schema(schemafile):
+    """
+    Return the parsed content of a JSON schema file in YAML format, using
+    the schema cache directory if set.
+
+    Raises:
+        ImproperExit
+    """
+    # pylint: disable=import-outside-toplevel
+    import yaml
+
+    try:
+        with open(schemafile, 'rb') as fp:
+            schema_bytes = fp.read()
+    except FileNotFoundError as exc:
+        new_exc = ImproperExit(
+            "Internal error: Cannot find schema file {}: {}".
+            format(schemafile, exc))
+        new_exc.__cause__ = None  # pylint: disable=invalid-name
+        raise new_exc
+    except PermissionError as exc:
+        new_exc = ImproperExit(
+            "Internal error: Permission error reading schema file {}: {}".
+            format(schemafile, exc))
+        new_exc.__cause__ = None  # pylint: disable=invalid-name
+        raise new_exc
+
+    cache_file = None
+    if SCHEMA_CACHE_DIR:
+        # The cache file is specific to the content of the schema file, so
+        # that a changed schema file is never used from an outdated cache.
+        digest = hashlib.sha256(schema_bytes).hexdigest()[:16]
+        cache_file = os.path.join(
+            SCHEMA_CACHE_DIR, "{f}.{d}.json".format(
+                f=os.path.basename(schemafile), d=digest))
+        try:
+            with open(cache_file, encoding='utf-8') as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            pass  # Not cached yet, or unusable cache file
+
+    try:
+        schema = yaml.load(schema_bytes, Loader=_yaml_loader())
+    except yaml.YAMLError as exc:
+        new_exc = ImproperExit(
+            "Internal error: YAML error reading schema file {}: {}".
+            format(schemafile, exc))
+        new_exc.__cause__ = None  # pylint: disable=invalid-name
+        raise new_exc
+
+    if cache_file:
+        # Written to a temporary file first, so that concurrent processes
+        # never read a partially written cache file. A cache directory that
+        # cannot be written is not an error.
+        try:
+            os.makedirs(SCHEMA_CACHE_DIR, exist_ok=True)
+            fd, tmp_file = tempfile.mkstemp(
+                dir=SCHEMA_CACHE_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+                json.dump(schema, fp)
+            os.replace(tmp_file, cache_file)
+        except OSError as exc:
+            logprint(logging.WARNING, PRINT_V,
+                     "Warning: Cannot cache schema file {f} in directory "
+                     "{d}: {m}".format(f=schemafile, d=SCHEMA_CACHE_DIR,
+                                       m=exc))
+    return schema
+
+
+def _yaml_loader():
+    """
+    Return the YAML loader class for safe loading, using the LibYAML based
+    loader if available because it is much faster.
+    """
+    # pylint: disable=import-outside-toplevel
+    import yaml
+    return getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
 def json_path_str(path_list):
     """
     Return a string with the path list in JSON path notation, except that
@@ -337,6 +444,37 @@ def json_path_str(path_list):
     return f"element '{path_str}'"
 
 
+def shard_index(uri, num_shards, domain=''):
+    """
+    Return the index of the shard a resource URI belongs to, when resources
+    are distributed across a number of shards.
+
+    The shard index is determined by rendezvous hashing: The URI belongs to
+    the shard with the highest hash value of the shard index and the URI.
+    The shard index is therefore the same across processes and restarts, and
+    when the number of shards changes, only the URIs that belong to the added
+    or removed shards move.
+
+    Distributions in different domains are independent of each other, e.g.
+    the URIs of one shard are distributed across all notification receivers
+    of the shard.
+
+    Parameters:
+      uri (string): The resource URI, e.g. the LPAR URI.
+      num_shards (int): Number of shards.
+      domain (string): Domain of the distribution, at most 16 characters.
+        The empty string is the domain of the shards and worker processes.
+
+    Returns:
+      int: The shard index, 0..num_shards-1.
+    """
+    key = uri.encode('utf-8')
+    person = domain.encode('utf-8')
+    return max(range(num_shards), key=lambda i: hashlib.blake2b(
+        key, digest_size=8, salt=i.to_bytes(8, 'big'),
+        person=person).digest())
+
+
 def get_hmc_info(session):
     """
     Return the result of the 'Query API Version' operation. This includes
@@ -345,30 +483,48 @@ def get_hmc_info(session):
 
     Raises: zhmccclient exceptions
     """
+    # pylint: disable=import-outside-toplevel
+    import zhmcclient
     client = zhmcclient.Client(session)
     hmc_info = client.query_api_version()
     return hmc_info
 
 
-def logprint(log_level, print_level, message):
+def logprint(log_level, print_level, message, *args, **kwargs):
     """
     Log a message at the specified log level, and print the message at
     the specified verbosity level
 
+    If format arguments are specified, the message is formatted only if it
+    is printed or logged. This should be used for messages that may be
+    issued for each OS message, e.g.::
+
+        logprint(logging.WARNING, PRINT_ALWAYS,
+                 "Warning: Cannot send seq_no {s} from LPAR {p!r}",
+                 s=seq_no, p=lpar_name)
+
     Parameters:
         log_level (int): Python logging level at which the message should be
           logged (logging.DEBUG, etc.), or None for no logging.
         print_level (int): Verbosity level at which the message should be
           printed (1, 2), or None for no printing.
-        message (string): The message.
+        message (string): The message, or the format string for the message
+          if format arguments are specified.
+        *args, **kwargs: Optional format arguments for the message, as for
+          str.format().
     """
-    if print_level is not None and VERBOSE_LEVEL >= print_level:
+    do_print = print_level is not None and VERBOSE_LEVEL >= print_level
+    do_log = log_level is not None and log_level >= LOG_LEVEL
+    if not do_print and not do_log:
+        return
+    if args or kwargs:
+        message = message.format(*args, **kwargs)
+    if do_print:
         print(message)
-    if log_level is not None and LOGGING_ENABLED:
-        logger = logging.getLogger(LOGGER_NAME)
+    if do_log:
         # Note: This method never raises an exception. Errors during logging
         # are handled by calling handler.handleError().
-        logger.log(log_level, message)
+        _LOGGER.log(log_level, message)
 
 
 def setup_logging(log_dest, log_complevels, syslog_facility):
@@ -378,7 +534,8 @@ def setup_logging(log_dest, log_complevels, syslog_facility):
     Raises:
         EarlyExit
     """
-    global LOGGING_ENABLED  # pylint: disable=global-statement
+    # pylint: disable=global-statement
+    global LOGGING_ENABLED, LOG_LEVEL
 
     if log_dest is None:
         logprint(None, PRINT_V, "Logging is disabled")
@@ -521,3 +678,4 @@ def setup_logging(log_dest, log_complevels, syslog_facility):
                 logger.setLevel(logging.NOTSET)
 
         LOGGING_ENABLED = True
+        LOG_LEVEL = _LOGGER.getEffectiveLevel()
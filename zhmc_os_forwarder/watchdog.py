@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+# Copyright 2023 IBM Corp. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A class for detecting notification receivers and subscriptions that have
+silently stopped delivering OS messages
+"""
+
+import logging
+
+import zhmcclient
+
+from .utils import logprint, PRINT_ALWAYS, PRINT_VV
+
+# Default time in seconds without notifications for an LPAR after which the
+# HMC is probed for OS messages of the LPAR that have not been received, or 0
+# to disable the watchdog
+DEFAULT_STALL_TIMEOUT = 300
+
+# Default maximum number of LPARs probed at each check of the watchdog
+DEFAULT_MAX_PROBES = 10
+
+# Number of sequence numbers retrieved when probing an LPAR
+PROBE_RANGE = 100
+
+
+class Watchdog:
+    """
+    Detects notification receivers and subscriptions that have silently
+    stopped delivering OS messages, e.g. due to a half-open TCP connection
+    or a subscription that was lost on the HMC.
+
+    An LPAR for which no notification has been received for the stall timeout
+    is probed by retrieving the OS messages from the expected next sequence
+    number on from the HMC. If the HMC has such OS messages, the notifications
+    for the LPAR have stalled. LPARs for which no OS message has been received
+    yet cannot be probed.
+
+    Each LPAR is probed at most once per stall timeout, and at most
+    max_probes LPARs are probed at each check, least recently probed first.
+    """
+
+    def __init__(self, metrics, stall_timeout=DEFAULT_STALL_TIMEOUT,
+                 max_probes=DEFAULT_MAX_PROBES):
+        """
+        Parameters:
+          metrics (MetricsRegistry): Registry for the watchdog metrics.
+          stall_timeout (float): Time in seconds without notifications for an
+            LPAR after which the LPAR is probed.
+          max_probes (int): Maximum number of LPARs probed at each check.
+        """
+        self.stall_timeout = stall_timeout
+        self.max_probes = max_probes
+        self.probes_counter = metrics.counter(
+            'zhmc_os_forwarder_stall_probes_total',
+            "Number of probes of LPARs without notifications on the HMC")
+        self.stalls_counter = metrics.counter(
+            'zhmc_os_forwarder_stalls_total',
+            "Number of LPARs whose notifications were found to have stalled")
+        self.rebuilds_counter = metrics.counter(
+            'zhmc_os_forwarder_receiver_rebuilds_total',
+            "Number of notification receivers rebuilt by the watchdog")
+        self.resubscriptions_counter = metrics.counter(
+            'zhmc_os_forwarder_resubscriptions_total',
+            "Number of LPARs subscribed again by the watchdog")
+
+    def __repr__(self):
+        return ("{s.__class__.__name__}("
+                "stall_timeout={s.stall_timeout!r}, "
+                "max_probes={s.max_probes!r}"
+                ")".format(s=self))
+
+    @property
+    def check_interval(self):
+        """
+        float: Interval in seconds at which check() should be called.
+        """
+        return max(self.stall_timeout / 4, 1)
+
+    def candidates(self, lpar_infos, now):
+        """
+        Return the LPARs to be probed at this check.
+
+        Parameters:
+          lpar_infos (iterable of ForwardedLparInfo): The forwarded LPARs.
+          now (float): Current time.monotonic().
+
+        Returns:
+          list of ForwardedLparInfo: The LPARs to be probed.
+        """
+        idle_lpars = []
+        for lpar_info in lpar_infos:
+            if not lpar_info.topic or lpar_info.next_seq_no is None:
+                continue  # Not subscribed, or cannot be probed
+            if lpar_info.held_messages is not None:
+                continue  # Missing OS messages are being retrieved
+            if now - lpar_info.recv_time >= self.stall_timeout and \
+                    now - lpar_info.probe_time >= self.stall_timeout:
+                idle_lpars.append(lpar_info)
+        idle_lpars.sort(key=lambda li: li.probe_time)
+        return idle_lpars[:self.max_probes]
+
+    def check(self, lpar_infos, now):
+        """
+        Probe the LPARs without notifications and return the LPARs whose
+        notifications have stalled.
+
+        Parameters:
+          lpar_infos (iterable of ForwardedLparInfo): The forwarded LPARs.
+          now (float): Current time.monotonic().
+
+        Returns:
+          list of ForwardedLparInfo: The LPARs whose notifications have
+          stalled.
+        """
+        stalled_lpars = []
+        for lpar_info in self.candidates(lpar_infos, now):
+            lpar_info.probe_time = now
+            if self.probe(lpar_info):
+                stalled_lpars.append(lpar_info)
+        return stalled_lpars
+
+    def probe(self, lpar_info):
+        """
+        Return whether the HMC has OS messages of an LPAR from the expected
+        next sequence number on, i.e. OS messages that should have been
+        received.
+        """
+        seq_no = lpar_info.next_seq_no
+        self.probes_counter.inc()
+        logprint(logging.INFO, PRINT_VV,
+                 "Probing LPAR {p!r} on CPC {c!r} for OS messages from "
+                 "sequence number {s} on",
+                 p=lpar_info.name, c=lpar_info.cpc_name, s=seq_no)
+        try:
+            result = lpar_info.lpar.list_os_messages(
+                begin=seq_no, end=seq_no + PROBE_RANGE - 1)
+        except zhmcclient.Error as exc:
+            logprint(logging.ERROR, PRINT_ALWAYS,
+                     "Error probing LPAR {p!r} on CPC {c!r} for OS "
+                     "messages: {m}".format(p=lpar_info.name,
+                                            c=lpar_info.cpc_name, m=exc))
+            return False
+        # The sequence number may have been reached in the meantime
+        if not result['os-messages'] or lpar_info.next_seq_no != seq_no:
+            return False
+        self.stalls_counter.inc()
+        logprint(logging.WARNING, PRINT_ALWAYS,
+                 "Warning: No notifications received for LPAR {p!r} on CPC "
+                 "{c!r} for {t} sec, but the HMC has OS messages from "
+                 "sequence number {s} on",
+                 p=lpar_info.name, c=lpar_info.cpc_name,
+                 t=self.stall_timeout, s=seq_no)
+        return True
@@ -20,23 +20,42 @@ IBM Z HMC OS Message Forwarder
 
 import argparse
 import sys
+import re
+import signal
 import time
 import logging
 import logging.handlers
-
-import urllib3
-import zhmcclient
+from importlib.metadata import version, PackageNotFoundError
 
 from ._version import __version__
-from .forwarder_server import ForwarderServer
-from . import utils  # for global variable VERBOSE_LEVEL
+from . import utils  # for global variables VERBOSE_LEVEL, SCHEMA_CACHE_DIR
 from .utils import DEFAULT_CONFIG_FILE, VALID_LOG_DESTINATIONS, \
     VALID_LOG_LEVELS, VALID_LOG_COMPONENTS, DEFAULT_LOG_LEVEL, \
     DEFAULT_LOG_COMP, DEFAULT_SYSLOG_FACILITY, VALID_SYSLOG_FACILITIES, \
-    PRINT_ALWAYS, PRINT_V, RETRY_TIMEOUT_CONFIG, \
+    PRINT_ALWAYS, PRINT_V, DEFAULT_STATS_INTERVAL, \
+    DEFAULT_NUM_RECEIVERS, DEFAULT_NUM_WORKERS, DEFAULT_PROFILE_DIR, \
     ProperExit, ImproperExit, EarlyExit, \
     parse_yaml_file, logprint, setup_logging
 
+# The zhmcclient and urllib3 packages and the modules using them are imported
+# only when the forwarder is started, so that CLI paths such as --version,
+# --help-config and --check-config start fast.
+
+
+def shard_arg(value):
+    """
+    Parse the value of the --shard option into a tuple(index, count).
+    """
+    try:
+        index, count = (int(v) for v in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid shard {value!r}; must be INDEX/COUNT")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(
+            f"invalid shard {value!r}; INDEX must be 0 to COUNT-1")
+    return index, count
+
 
 def parse_args(args):
     """
@@ -69,8 +88,75 @@ def parse_args(args):
                         "system log. Default: {def_slf}".
                         format(slfs=', '.join(VALID_SYSLOG_FACILITIES),
                                def_slf=DEFAULT_SYSLOG_FACILITY))
+    parser.add_argument("--stats-interval", metavar="SECONDS", type=int,
+                        default=DEFAULT_STATS_INTERVAL,
+                        help="interval for logging statistics such as the "
+                        "forwarding lag, or 0 to disable. Default: {}".
+                        format(DEFAULT_STATS_INTERVAL))
+    parser.add_argument("--metrics-port", metavar="PORT", type=int,
+                        default=None,
+                        help="expose metrics in the Prometheus text format "
+                        "at http://HOST:PORT/metrics. Default: not exposed")
+    parser.add_argument("--receivers", metavar="NUM", type=int,
+                        default=DEFAULT_NUM_RECEIVERS,
+                        help="maximum number of notification receivers, each "
+                        "receiving the OS messages of a subset of the LPARs "
+                        "in its own thread. Default: {}".
+                        format(DEFAULT_NUM_RECEIVERS))
+    parser.add_argument("--shard", metavar="INDEX/COUNT", type=shard_arg,
+                        default=None,
+                        help="forward only the LPARs of shard INDEX (0 to "
+                        "COUNT-1), when the LPARs are distributed across "
+                        "COUNT forwarders with the same config file. "
+                        "Default: forward all LPARs")
+    parser.add_argument("--workers", metavar="NUM", type=int,
+                        default=DEFAULT_NUM_WORKERS,
+                        help="number of worker processes. With more than 1, "
+                        "a supervisor process distributes the LPARs across "
+                        "the worker processes, restarts ended workers and "
+                        "aggregates their metrics. Default: {}".
+                        format(DEFAULT_NUM_WORKERS))
+    parser.add_argument("--stage-timing", action='store_true',
+                        help="measure the duration of the stages of the "
+                        "forwarding hot path from the start on. The "
+                        "measurement can also be toggled at run time by "
+                        "sending signal SIGUSR2 to the forwarder process. "
+                        "Default: not measured")
+    parser.add_argument("--record", metavar="FILE", default=None,
+                        help="append the received notifications to a "
+                        "recording file, for replaying them with --replay. "
+                        "With --workers, each worker records to FILE.INDEX. "
+                        "Default: not recorded")
+    parser.add_argument("--replay", metavar="FILE", default=None,
+                        help="replay the OS message notifications of a "
+                        "recording file to the destinations in the forwarder "
+                        "config file without an HMC, and exit when done. "
+                        "Default: forward the notifications from the HMC")
+    parser.add_argument("--replay-speed", metavar="FACTOR", type=float,
+                        default=1.0,
+                        help="speed factor for --replay relative to the "
+                        "original speed, or 0 for replaying as fast as "
+                        "possible. Default: 1")
+    parser.add_argument("--profile", action='store_true',
+                        help="profile the forwarder from the start on. "
+                        "Profiling can also be toggled at run time by "
+                        "sending signal SIGUSR1 to the forwarder process. "
+                        "The results are written when profiling is stopped "
+                        "or the forwarder shuts down. Default: not profiled")
+    parser.add_argument("--profile-dir", metavar="DIR",
+                        default=DEFAULT_PROFILE_DIR,
+                        help="directory for the profiling results. "
+                        "Default: {}".format(DEFAULT_PROFILE_DIR))
     parser.add_argument("--verbose", "-v", action='count', default=0,
                         help="increase the verbosity level (max: 2)")
+    parser.add_argument("--schema-cache", metavar="DIR", default=None,
+                        help="cache the parsed JSON schema for the "
+                        "forwarder config file in this directory, for faster "
+                        "startup. Default: no caching")
+    parser.add_argument("--check-config", action='store_true',
+                        help="validate the forwarder config file and exit "
+                        "with exit code 0 if it is valid, or 1 otherwise. "
+                        "The HMC is not contacted")
     parser.add_argument("--version", action='store_true',
                         help="show versions of forwarder and zhmcclient "
                         "library and exit")
@@ -82,11 +168,17 @@ def parse_args(args):
 def print_version():
     """
     Print the version of this program and the zhmcclient library.
+
+    The version of the zhmcclient library is taken from its package metadata,
+    so that the library does not need to be imported.
     """
-    # pylint: disable=no-member
+    try:
+        zhmcclient_version = version('zhmcclient')
+    except PackageNotFoundError:
+        zhmcclient_version = 'not installed'
     print("zhmc_os_forwarder version: {}\n"
           "zhmcclient version: {}".
-          format(__version__, zhmcclient.__version__))
+          format(__version__, zhmcclient_version))
 
 
 def help_config():
@@ -119,6 +211,32 @@ forwarding:
 """)
 
 
+def check_config(config_filename):
+    """
+    Validate the forwarder config file and return the exit code for the
+    config check mode.
+
+    In addition to the validation against the JSON schema, the regular
+    expressions for the CPC and LPAR names are compiled. The HMC is not
+    contacted.
+    """
+    # pylint: disable=import-outside-toplevel
+    from .forwarder_config import ForwarderConfig
+    try:
+        config_data = parse_yaml_file(
+            config_filename, 'forwarder config file', 'config_schema.yaml')
+        ForwarderConfig(config_data, config_filename)
+    except ImproperExit as exc:
+        print(f"Error: {exc}")
+        return 1
+    except re.error as exc:
+        print("Error: Invalid regular expression {p!r} in forwarder config "
+              "file {f}: {m}".format(p=exc.pattern, f=config_filename, m=exc))
+        return 1
+    print(f"Forwarder config file {config_filename} is valid")
+    return 0
+
+
 def main():
     """
     Main function for the script.
@@ -134,11 +252,28 @@ def main():
         help_config()
         sys.exit(0)
 
+    utils.SCHEMA_CACHE_DIR = args.schema_cache
+
+    if args.check_config:
+        sys.exit(check_config(args.c))
+
     utils.VERBOSE_LEVEL = args.verbose
 
+    # pylint: disable=import-outside-toplevel
+    import urllib3
+    import zhmcclient
+    from .forwarder_server import ForwarderServer, RETRY_TIMEOUT_CONFIG
+    from .supervisor import Supervisor
+    from .metrics import start_metrics_server
+    from .stage_timing import toggle_handler
+    from .profiler import Profiler
+
     urllib3.disable_warnings()
 
     forwarder_server = None
+    supervisor = None
+    metrics_server = None
+    profiler = None
 
     try:
         setup_logging(args.log_dest, args.log_complevels, args.syslog_facility)
@@ -170,19 +305,76 @@ def main():
                  "retries, read: {r.read_timeout} sec / {r.read_retries} "
                  "retries.".format(r=RETRY_TIMEOUT_CONFIG))
 
-        forwarder_server = ForwarderServer(config_data, config_filename)
-        try:
-            forwarder_server.startup()
-        except zhmcclient.Error as exc:
-            new_exc = ImproperExit(
-                f"{exc.__class__.__name__}: {exc}")
-            new_exc.__cause__ = None  # pylint: disable=invalid-name
-            raise new_exc
-
-        logprint(logging.INFO, PRINT_V,
-                 "Current number of subscriptions for OS message "
-                 "notifications: {}".
-                 format(forwarder_server.num_subscriptions))
+        if args.replay:
+            forwarder_server = ForwarderServer(
+                config_data, config_filename,
+                stats_interval=args.stats_interval,
+                stage_timing=args.stage_timing)
+            # Profiling the replay, e.g. as a benchmark, is stopped at the
+            # end of the replay
+            profiler = Profiler(args.profile_dir)
+            if args.profile:
+                profiler.start()
+            forwarder_server.startup_replay()
+            try:
+                forwarder_server.replay(args.replay, args.replay_speed)
+            except KeyboardInterrupt:
+                pass
+            raise ProperExit
+
+        if args.workers > 1:
+            logprint(logging.INFO, PRINT_ALWAYS,
+                     f"Starting {args.workers} worker processes")
+            supervisor = Supervisor(args, args.workers)
+            supervisor.startup()
+            if hasattr(signal, 'SIGUSR2'):
+                signal.signal(
+                    signal.SIGUSR2,
+                    lambda signum, frame: supervisor.signal_workers(signum))
+            if hasattr(signal, 'SIGUSR1'):
+                signal.signal(
+                    signal.SIGUSR1,
+                    lambda signum, frame: supervisor.signal_workers(signum))
+            metrics = supervisor.metrics
+        else:
+            forwarder_server = ForwarderServer(
+                config_data, config_filename,
+                stats_interval=args.stats_interval,
+                num_receivers=args.receivers, shard=args.shard,
+                stage_timing=args.stage_timing, record=args.record)
+            if hasattr(signal, 'SIGUSR2'):
+                signal.signal(signal.SIGUSR2,
+                              toggle_handler(forwarder_server.stage_timer))
+            profiler = Profiler(args.profile_dir)
+            if hasattr(signal, 'SIGUSR1'):
+                signal.signal(signal.SIGUSR1, profiler.request_toggle)
+            if args.profile:
+                profiler.start()
+            try:
+                forwarder_server.startup()
+            except zhmcclient.Error as exc:
+                new_exc = ImproperExit(
+                    f"{exc.__class__.__name__}: {exc}")
+                new_exc.__cause__ = None  # pylint: disable=invalid-name
+                raise new_exc
+
+            logprint(logging.INFO, PRINT_V,
+                     "Current number of subscriptions for OS message "
+                     "notifications: {}".
+                     format(forwarder_server.num_subscriptions))
+            metrics = forwarder_server.metrics
+
+        if args.metrics_port is not None:
+            try:
+                metrics_server = start_metrics_server(
+                    metrics, args.metrics_port)
+            except OSError as exc:
+                raise ImproperExit(
+                    "Cannot expose metrics on port {p}: {m}".
+                    format(p=args.metrics_port, m=exc))
+            logprint(logging.INFO, PRINT_V,
+                     "Exposing metrics at port {p}".
+                     format(p=args.metrics_port))
 
         logprint(logging.INFO, PRINT_ALWAYS,
                  "Forwarder is up and running (Press Ctrl-C to shut down)")
@@ -190,6 +382,13 @@ def main():
         while True:
             try:
                 time.sleep(1)
+                if supervisor:
+                    supervisor.check()
+                if profiler:
+                    profiler.check()
+                if forwarder_server and forwarder_server.lease_lost:
+                    raise ImproperExit(
+                        "The forwarder has lost or given up the lease")
             except KeyboardInterrupt:
                 raise ProperExit
 
@@ -204,14 +403,28 @@ def main():
     except ImproperExit as exc:
         logprint(logging.ERROR, PRINT_ALWAYS,
                  f"Error: {exc}")
+        if metrics_server:
+            metrics_server.shutdown()
+            metrics_server.server_close()
+        if supervisor:
+            supervisor.shutdown()
         if forwarder_server:
             forwarder_server.shutdown()
+        if profiler:
+            profiler.stop()
         exit_rc(1)
     except ProperExit:
         logprint(logging.WARNING, PRINT_ALWAYS,
                  "Forwarder shutdown requested")
+        if metrics_server:
+            metrics_server.shutdown()
+            metrics_server.server_close()
+        if supervisor:
+            supervisor.shutdown()
         if forwarder_server:
             forwarder_server.shutdown()
+        if profiler:
+            profiler.stop()
         exit_rc(0)
 
 